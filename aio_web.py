@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import web
+
+from http_client import DEFAULT_POLICY, HOST_POLICIES, LINE_API_BASE, HostPolicy, PostSafeRetry
+from metrics import CONTENT_TYPE, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Базовый адрес OpenAI API (та же переменная, что читает библиотека openai)
+OPENAI_API_BASE = os.environ.get('OPENAI_API_BASE', 'https://api.openai.com/v1').rstrip('/')
+
+# Одновременных соединений на процесс (всего и к одному хосту)
+AIO_CONNECTIONS = int(os.environ.get('AIO_CONNECTIONS', 200))
+AIO_CONNECTIONS_PER_HOST = int(os.environ.get('AIO_CONNECTIONS_PER_HOST', 50))
+
+
+class UpstreamError(Exception):
+    """Внешний сервис ответил ошибкой."""
+
+    def __init__(self, service: str, status: int, body: str) -> None:
+        super().__init__(f'Error from {service}: {status} {body[:200]}')
+        self.service = service
+        self.status = status
+        self.body = body
+
+
+def create_session(**kwargs: Any) -> aiohttp.ClientSession:
+    """
+    Общая сессия aiohttp процесса: keep-alive пул соединений и кэш DNS.
+    Создавать внутри работающего цикла событий (например, в on_startup).
+    """
+    connector = aiohttp.TCPConnector(
+        limit=AIO_CONNECTIONS, limit_per_host=AIO_CONNECTIONS_PER_HOST, ttl_dns_cache=300
+    )
+    return aiohttp.ClientSession(connector=connector, **kwargs)
+
+
+async def post_json(
+    session: aiohttp.ClientSession,
+    service: str,
+    url: str,
+    payload: Dict[str, Any],
+    headers: Dict[str, str],
+    policy: Optional[HostPolicy] = None,
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    POST с JSON-телом и повторами по политике хоста, при которых запрос не выполняется дважды
+    (то же правило, что у http_client.PostSafeRetry): повторяются только ошибки установки
+    соединения, когда запрос заведомо не отправлен, и, если policy.retry_post, статус 429.
+    После 5xx, таймаута или обрыва соединения сервис мог уже выполнить запрос
+    (например, доставить push-сообщение), поэтому такие ошибки не повторяются.
+
+    :param session: Сессия aiohttp.
+    :param service: Имя сервиса для сообщений об ошибках.
+    :param url: Адрес.
+    :param payload: Тело запроса.
+    :param headers: Заголовки.
+    :param policy: Политика хоста (по умолчанию из http_client.HOST_POLICIES).
+    :param timeout: Таймаут одной попытки; по умолчанию из политики.
+    :return: Разобранный JSON ответа (пустой словарь для пустого тела).
+    :raises UpstreamError: Если сервис вернул ошибку.
+    :raises aiohttp.ClientError, asyncio.TimeoutError: При сетевой ошибке или таймауте.
+    """
+    if policy is None:
+        policy = HOST_POLICIES.get(urlsplit(url).hostname, DEFAULT_POLICY)
+    client_timeout = aiohttp.ClientTimeout(total=timeout or policy.timeout)
+    attempt = 0
+    while True:
+        retry_after = None
+        try:
+            async with session.post(url, json=payload, headers=headers, timeout=client_timeout) as response:
+                text = await response.text()
+                if response.status == 200:
+                    return json.loads(text) if text else {}
+                retryable = policy.retry_post and response.status in PostSafeRetry.POST_RETRY_STATUSES
+                if not retryable or attempt >= policy.retries:
+                    raise UpstreamError(service, response.status, text)
+                header = response.headers.get('Retry-After', '')
+                retry_after = float(header) if header.isdigit() else None
+        except aiohttp.ClientConnectorError:
+            # Соединение не установлено — запрос не отправлен, повтор безопасен
+            if attempt >= policy.retries:
+                raise
+        backoff = policy.backoff_factor * (2 ** attempt)
+        attempt += 1
+        await asyncio.sleep(retry_after if retry_after is not None else backoff + random.uniform(0, backoff))
+
+
+class AsyncLineClient:
+    """Асинхронный клиент LINE Messaging API (reply и push)."""
+
+    def __init__(self, session: aiohttp.ClientSession, access_token: str, endpoint: str = LINE_API_BASE) -> None:
+        """
+        :param session: Сессия aiohttp.
+        :param access_token: Токен доступа канала.
+        :param endpoint: Базовый адрес API.
+        """
+        self.session = session
+        self.endpoint = endpoint.rstrip('/')
+        self._headers = {'Authorization': f'Bearer {access_token}'}
+
+    async def reply(self, reply_token: str, messages: List[Dict[str, Any]]) -> None:
+        """
+        Отправляет до 5 сообщений по reply-токену.
+
+        :raises UpstreamError: Если API вернул ошибку.
+        """
+        await post_json(
+            self.session, 'LINE API', f'{self.endpoint}/v2/bot/message/reply',
+            {'replyToken': reply_token, 'messages': messages}, self._headers
+        )
+
+    async def push(self, to: str, messages: List[Dict[str, Any]]) -> None:
+        """
+        Отправляет сообщения пользователю, группе или комнате без reply-токена.
+
+        :raises UpstreamError: Если API вернул ошибку.
+        """
+        await post_json(
+            self.session, 'LINE API', f'{self.endpoint}/v2/bot/message/push',
+            {'to': to, 'messages': messages}, self._headers
+        )
+
+
+class AsyncOpenAIClient:
+    """Асинхронный клиент Chat Completions API."""
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        api_key: str,
+        api_base: str = OPENAI_API_BASE,
+        timeout: float = 60.0
+    ) -> None:
+        """
+        :param session: Сессия aiohttp.
+        :param api_key: Ключ API.
+        :param api_base: Базовый адрес API.
+        :param timeout: Таймаут запроса по умолчанию, секунды.
+        """
+        self.session = session
+        self.api_base = api_base.rstrip('/')
+        self.timeout = timeout
+        self._headers = {'Authorization': f'Bearer {api_key}'}
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        timeout: Optional[float] = None
+    ) -> str:
+        """
+        :return: Текст первого варианта ответа без пробелов по краям.
+        :raises UpstreamError: Если API вернул ошибку.
+        """
+        response = await post_json(
+            self.session, 'OpenAI', f'{self.api_base}/chat/completions',
+            {'model': model, 'messages': messages, 'max_tokens': max_tokens, 'n': 1, 'temperature': temperature},
+            self._headers, policy=DEFAULT_POLICY._replace(retries=0), timeout=timeout or self.timeout
+        )
+        return response['choices'][0]['message']['content'].strip()
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        read_timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый ответ (stream=True, server-sent events).
+
+        :param read_timeout: Таймаут ожидания очередного фрагмента, секунды.
+        :return: Асинхронный итератор фрагментов текста.
+        :raises UpstreamError: Если API вернул ошибку.
+        """
+        payload = {
+            'model': model, 'messages': messages, 'max_tokens': max_tokens, 'n': 1,
+            'temperature': temperature, 'stream': True,
+        }
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=read_timeout or self.timeout)
+        async with self.session.post(
+            f'{self.api_base}/chat/completions', json=payload, headers=self._headers, timeout=timeout
+        ) as response:
+            if response.status != 200:
+                raise UpstreamError('OpenAI', response.status, await response.text())
+            async for line in response.content:
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    break
+                delta = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    """Метрики Prometheus (общий реестр metrics.REGISTRY)."""
+    return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+def _run_worker(make_app: Callable[[], web.Application], host: str, port: int, reuse_port: bool) -> None:
+    web.run_app(make_app(), host=host, port=port, reuse_port=reuse_port, print=None)
+
+
+def serve(make_app: Callable[[], web.Application], host: str, port: int, processes: int = 1) -> None:
+    """
+    Запускает приложение aiohttp в одном или нескольких процессах.
+    Процессы слушают один порт (SO_REUSEPORT), ядро распределяет соединения между ними.
+    Рабочие процессы запускаются через spawn: каждый заново импортирует модули приложения
+    и сам открывает файлы SQLite (CACHE_PATH, RATE_LIMIT_PATH) и запускает фоновые потоки.
+    После fork соединения SQLite и потоки родителя использовать нельзя.
+
+    :param make_app: Фабрика приложения (вызывается в каждом процессе); при processes > 1
+                     должна быть функцией уровня модуля.
+    :param host: Адрес.
+    :param port: Порт.
+    :param processes: Число процессов.
+    """
+    if processes <= 1:
+        _run_worker(make_app, host, port, reuse_port=False)
+        return
+    logger.info(f"Запуск {processes} процессов на {host}:{port}")
+    context = multiprocessing.get_context('spawn')
+    workers = [
+        context.Process(target=_run_worker, args=(make_app, host, port, True), name=f'web-{i}')
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def stop(signum, frame):
+        # Остановка главного процесса (SIGTERM от супервизора) останавливает и рабочие
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        stop(signal.SIGINT, None)
+        for worker in workers:
+            worker.join()
@@ -1,113 +1,277 @@
 import os
-import re
+import atexit
 import logging
-from urllib.parse import urlparse
 
 from flask import Flask, request, abort
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import (
-    MessageEvent, TextMessage, TextSendMessage,
-    StickerMessage, StickerSendMessage
-)
+from linebot import LineBotApi
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+from linebot.models import TextSendMessage, StickerSendMessage
 import openai
-from googletrans import Translator
-import requests
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
 
-# Загрузка переменных окружения из файла .env
-load_dotenv()
+from bot_common import (
+    BUSY_REPLY, CHAT_COMMAND, COMMANDS, EVENT_OVERLOAD_POLICY, LINE_CHANNEL_ACCESS_TOKEN, OPENAI_API_KEY,
+    OPENAI_BUDGET_REPLY, OPENAI_ERROR_REPLY, OPENAI_FALLBACK_TIMEOUT, OPENAI_FAST_MODEL, OPENAI_MAX_TOKENS,
+    OPENAI_PUSH_FOLLOWUP, OPENAI_READ_TIMEOUT, OPENAI_REPLY_DEADLINE, OPENAI_RPM, OPENAI_STREAM_TIMEOUT,
+    OPENAI_TEMPERATURE, OPENAI_TIERS, OPENAI_TPM, PARSE_MAX_BYTES, PARSE_REPLY_CHARS, PARSE_TIMEOUT,
+    PENDING_REPLY, RATE_LIMITED_REPLY, allow_message, chat_messages, check_credentials, estimate_openai_tokens,
+    finish_completion, is_valid_url, parser, push_target, rate_limiter, response_cache, translation_engine,
+)
+from http_client import LINE_API_BASE, get_session
+from commands import CommandError, CommandRouter
+from llm_stream import CompletionStream, PartialAnswer, openai_deltas
+from page_fetch import fetch_paragraph_text
+from rate_limit import per_minute
+from logging_setup import SAMPLED, preview, setup_logging
+from metrics import count_upstream_error, install_metrics_endpoint, register_stats, stage_timer, timed
+from webhook import InvalidBodyError
+from worker_pool import BoundedWorkerPool
 
-# Настройка базового логирования
-logging.basicConfig(level=logging.INFO)
+# Логирование через фоновый поток (LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_BODY_LIMIT)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Общие настройки, кэш и лимиты — в bot_common (их же использует app_async.py)
+check_credentials()
+
 # Инициализация Flask-приложения
 app = Flask(__name__)
 
-# Получение токенов и ключей API из переменных окружения
-LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
-LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-if not (LINE_CHANNEL_ACCESS_TOKEN and LINE_CHANNEL_SECRET and OPENAI_API_KEY):
-    logger.error("Один или несколько ключей/токенов не заданы!")
-    exit(1)
+class PooledLineHttpClient(RequestsHttpClient):
+    """
+    HTTP-клиент LINE SDK поверх общей keep-alive сессии вместо requests.post на каждый вызов.
+    Таймаут по умолчанию и повторы берутся из политики хоста в http_client.
+    """
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        response = get_session().get(
+            url, headers=headers, params=params, stream=stream, timeout=timeout
+        )
+        return RequestsHttpResponse(response)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        response = get_session().post(url, headers=headers, data=data, timeout=timeout)
+        return RequestsHttpResponse(response)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        response = get_session().delete(url, headers=headers, data=data, timeout=timeout)
+        return RequestsHttpResponse(response)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        response = get_session().put(url, headers=headers, data=data, timeout=timeout)
+        return RequestsHttpResponse(response)
+
 
 # Инициализация API Line и OpenAI
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
-handler = WebhookHandler(LINE_CHANNEL_SECRET)
+line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN, endpoint=LINE_API_BASE, http_client=PooledLineHttpClient)
 openai.api_key = OPENAI_API_KEY
+openai.requestssession = get_session()
+
+# Пул обработки событий: вебхук отвечает сразу, события обрабатываются в фоне
+# (при переполнении — по EVENT_OVERLOAD_POLICY)
+EVENT_WORKERS = int(os.getenv('EVENT_WORKERS', 8))
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 100))
+
+event_pool = BoundedWorkerPool(workers=EVENT_WORKERS, max_queue=EVENT_QUEUE_SIZE, name='line-event')
+# Ответы о перегрузке отправляются отдельным небольшим пулом, а не в потоке вебхука:
+# при перегрузке /callback должен отвечать сразу, иначе LINE повторит доставку событий
+BUSY_WORKERS = int(os.getenv('BUSY_WORKERS', 2))
+busy_pool = BoundedWorkerPool(workers=BUSY_WORKERS, max_queue=EVENT_QUEUE_SIZE, name='line-busy')
+
+OPENAI_STREAM_WORKERS = int(os.getenv('OPENAI_STREAM_WORKERS', EVENT_WORKERS * 2))
+
+# Генерации выполняются в отдельном пуле и могут продолжаться после отправки ответа
+stream_pool = BoundedWorkerPool(workers=OPENAI_STREAM_WORKERS, max_queue=EVENT_QUEUE_SIZE, name='openai-stream')
+# Команды с timeout выполняются в своём пуле: поток события ждёт ответ не дольше timeout
+command_pool = BoundedWorkerPool(workers=EVENT_WORKERS, max_queue=EVENT_QUEUE_SIZE, name='command')
+
+
+def shutdown_workers():
+    """
+    Останавливает пулы в порядке зависимостей: сначала дорабатывают события из очереди
+    и команды, которые ещё ставят генерации в stream_pool и переводы в translation_engine,
+    затем сами генерации (с досылкой push-сообщений) и переводчик.
+    """
+    event_pool.shutdown()
+    busy_pool.shutdown()
+    command_pool.shutdown()
+    stream_pool.shutdown()
+    translation_engine.shutdown()
+
+
+# Один обработчик вместо нескольких: atexit вызывает обработчики в обратном порядке регистрации
+atexit.register(shutdown_workers)
+
+# Реестр текстовых команд (/translate, /parse, /ask): кэш ответов, схлопывание одинаковых
+# одновременных обращений к внешним сервисам и timeout по метаданным команд
+router = CommandRouter(cache=response_cache, pool=command_pool)
+
+# Метрики Prometheus: задержки этапов, ошибки внешних сервисов, состояние кэша и очереди (/metrics)
+install_metrics_endpoint(app)
+register_stats(
+    'linebot_singleflight_stats', 'Схлопывание одинаковых запросов к внешним сервисам', 'command',
+    router.flight_stats
+)
+register_stats('linebot_event_pool_stats', 'Очередь обработки событий', 'pool',
+               lambda: {'line-event': event_pool.stats(), 'line-busy': busy_pool.stats(),
+                        'command': command_pool.stats(), 'openai-stream': stream_pool.stats()})
+
+# Обработчики сообщений по типу содержимого ('text', 'sticker', ...)
+MESSAGE_HANDLERS = {}
 
-# Инициализация переводчика
-translator = Translator()
+
+def on_message(message_type):
+    """Регистрирует обработчик для сообщений заданного типа."""
+    def decorator(func):
+        MESSAGE_HANDLERS[message_type] = func
+        return func
+    return decorator
 
 
 @app.route("/callback", methods=['POST'])
 def callback():
     """Обработчик входящих запросов от сервера LINE."""
     signature = request.headers.get('X-Line-Signature', None)
-    body = request.get_data(as_text=True)
-    logger.info(f"Request body: {body}")
+    # Тело не декодируется в str и не сохраняется в кэше запроса
+    body = request.get_data(cache=False)
+    # Тело целиком не логируется: обрезанное и без текста сообщений, только на DEBUG
+    logger.debug("Request body: %s", preview(body))
     
     if signature is None:
         logger.warning("Нет X-Line-Signature в заголовках!")
         abort(400)
 
+    with stage_timer('verify_line_signature'):
+        valid = parser.verify(body, signature)
+    if not valid:
+        logger.warning("Неверная подпись!")
+        abort(400)
+
     try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        logger.exception("Неверная подпись!")
+        with stage_timer('parse_events'):
+            events = parser.parse_body(body)
+    except InvalidBodyError as e:
+        logger.warning(f"Некорректное тело запроса: {e}")
         abort(400)
+
+    for event in events:
+        if not event_pool.submit(dispatch_event, event):
+            reject_event(event)
     return 'OK'
 
 
-@handler.add(MessageEvent, message=TextMessage)
+def dispatch_event(event):
+    """Передаёт событие зарегистрированному обработчику (выполняется в пуле)."""
+    if event.type != 'message' or event.message is None:
+        return
+    func = MESSAGE_HANDLERS.get(event.message.type)
+    if func is None:
+        logger.info("Нет обработчика для сообщения типа %s", event.message.type, extra=SAMPLED)
+        return
+    func(event)
+
+
+def reject_event(event):
+    """Сброс нагрузки при переполненной очереди событий."""
+    logger.warning(f"Очередь событий заполнена ({event_pool.queue_depth}), событие отклонено.")
+    if EVENT_OVERLOAD_POLICY != 'busy' or event.type != 'message' or not event.reply_token:
+        return
+    if not busy_pool.submit(send_busy_reply, event.reply_token):
+        logger.warning("Очередь ответов о перегрузке заполнена, ответ не отправлен.")
+
+
+def send_busy_reply(reply_token):
+    """Ответ о перегрузке (выполняется в busy_pool)."""
+    try:
+        line_bot_api.reply_message(reply_token, TextSendMessage(text=BUSY_REPLY))
+    except Exception as e:
+        logger.exception(f"Ошибка при отправке ответа о перегрузке: {e}")
+
+
+@on_message('text')
 def handle_text_message(event):
     """Обработка текстовых сообщений от пользователей."""
     user_message = event.message.text.strip()
-    reply = "Не удалось обработать запрос."  # Значение по умолчанию
-    
-    # Команда перевода: /translate <язык> <текст>
-    translate_match = re.match(r'^/translate\s+(\w{2})\s+(.+)', user_message, re.IGNORECASE)
-    if translate_match:
-        dest_lang = translate_match.group(1)
-        text_to_translate = translate_match.group(2)
-        translation = translate_text(text_to_translate, dest_language=dest_lang)
-        reply = f"Перевод ({dest_lang}): {translation}"
-    
-    # Команда парсинга сайта: /parse <URL>
-    elif (parse_match := re.match(r'^/parse\s+(.+)', user_message, re.IGNORECASE)):
-        url = parse_match.group(1)
-        parsed_content = parse_website(url)
-        if parsed_content:
-            # Ограничиваем длину ответа
-            reply = f"Содержимое <{url}>:\n{parsed_content[:1000]}..."
+    followup = None
+    try:
+        command, match = router.resolve(user_message)
+        if allow_message(event.source, command):
+            reply = router.run(command, match, user_message)
         else:
-            reply = "Не удалось спарсить содержимое сайта."
-    
-    # Команда обращения к OpenAI: /ask <вопрос>
-    elif (ask_match := re.match(r'^/ask\s+(.+)', user_message, re.IGNORECASE)):
-        question = ask_match.group(1)
-        ai_response = ask_openai(question)
-        reply = ai_response
-    
-    # Если не найдено ни одной специфической команды, отправляем сообщение в OpenAI
-    else:
-        ai_response = ask_openai(user_message)
-        reply = ai_response
+            reply = RATE_LIMITED_REPLY
+    except Exception as e:
+        logger.exception(f"Ошибка при обработке команды: {e}")
+        reply = "Не удалось обработать запрос."
+    if isinstance(reply, PartialAnswer):
+        # Генерация не уложилась в срок: отвечаем тем, что есть, остальное — push-сообщением
+        followup, reply = reply, reply.text
 
     try:
-        line_bot_api.reply_message(
-            event.reply_token,
-            TextSendMessage(text=reply)
-        )
+        with stage_timer('send_reply'):
+            line_bot_api.reply_message(
+                event.reply_token,
+                TextSendMessage(text=reply)
+            )
     except Exception as e:
+        count_upstream_error('line', e)
         logger.exception(f"Ошибка при отправке ответа: {e}")
 
+    if followup is not None and OPENAI_PUSH_FOLLOWUP:
+        to = push_target(event.source)
+        if to:
+            followup.stream.add_done_callback(lambda stream: send_followup(to, followup))
+
+
+def send_followup(to, answer):
+    """Досылает остаток ответа после завершения генерации (выполняется в пуле генераций)."""
+    text = answer.followup_text()
+    if text is None:
+        if answer.stream.error is not None and answer.mode == 'pending':
+            text = OPENAI_ERROR_REPLY
+        else:
+            return
+    try:
+        with stage_timer('send_push'):
+            line_bot_api.push_message(to, TextSendMessage(text=text))
+    except Exception as e:
+        count_upstream_error('line', e)
+        logger.exception(f"Ошибка при отправке продолжения ответа: {e}")
+
+
+# Команда перевода: /translate <язык> <текст>
+@router.command('translate', **COMMANDS['translate'])
+def translate_command(match):
+    dest_lang = match.group(1)
+    translation = translate_text(match.group(2), dest_language=dest_lang)
+    if translation is None:
+        raise CommandError(f"Перевод ({dest_lang}): Произошла ошибка при переводе.")
+    return f"Перевод ({dest_lang}): {translation}"
+
+
+# Команда парсинга сайта: /parse <URL>
+@router.command('parse', **COMMANDS['parse'])
+def parse_command(match):
+    url = match.group(1)
+    parsed_content = parse_website(url)
+    if not parsed_content:
+        raise CommandError("Не удалось спарсить содержимое сайта.")
+    # Ограничиваем длину ответа
+    return f"Содержимое <{url}>:\n{parsed_content[:PARSE_REPLY_CHARS]}..."
+
+
+# Команда обращения к OpenAI: /ask <вопрос>
+@router.command('ask', **COMMANDS['ask'])
+def ask_command(match):
+    return ask_openai(match.group(1))
 
-@handler.add(MessageEvent, message=StickerMessage)
+
+# Если не найдено ни одной специфической команды, отправляем сообщение в OpenAI
+@router.default(**CHAT_COMMAND)
+def chat_message(text):
+    return ask_openai(text)
+
+
+@on_message('sticker')
 def handle_sticker_message(event):
     """Пересылаем стикеры обратно пользователю."""
     try:
@@ -122,28 +286,23 @@ def handle_sticker_message(event):
         logger.exception(f"Ошибка при обработке стикера: {e}")
 
 
+@timed()
 def translate_text(text, dest_language='ru'):
-    """Перевод текста с помощью googletrans."""
+    """Перевод текста через пакетную очередь translation_engine; None при ошибке."""
     try:
-        result = translator.translate(text, dest=dest_language)
-        return result.text
+        return translation_engine.translate(text, dest_language).text
     except Exception as e:
+        count_upstream_error('translate', e)
         logger.exception(f"Ошибка при переводе текста: {e}")
-        return "Произошла ошибка при переводе."
-
-
-def is_valid_url(url):
-    """Базовая проверка валидности URL."""
-    parsed = urlparse(url)
-    return all([parsed.scheme in ('http', 'https'), parsed.netloc])
+        return None
 
 
+@timed()
 def parse_website(url):
-    """Парсит содержимое сайта, извлекая текст из тегов <p>."""
+    """Парсит содержимое сайта, извлекая текст из тегов <p>; None при ошибке."""
     if not is_valid_url(url):
         logger.warning(f"Некорректный URL: {url}")
         return None
-
     try:
         headers = {
             'User-Agent': (
@@ -151,38 +310,83 @@ def parse_website(url):
                 '(KHTML, like Gecko) Chrome/85.0.4183.102 Safari/537.36'
             )
         }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        paragraphs = soup.find_all('p')
-        text = '\n'.join(para.get_text(strip=True) for para in paragraphs if para.get_text(strip=True))
-        return text
+        return fetch_paragraph_text(
+            url, headers=headers, timeout=PARSE_TIMEOUT,
+            max_bytes=PARSE_MAX_BYTES, max_chars=PARSE_REPLY_CHARS,
+            session=get_session()
+        )
     except Exception as e:
+        count_upstream_error('parse', e)
         logger.exception(f"Ошибка при парсинге сайта {url}: {e}")
         return None
 
 
+@timed()
 def ask_openai(prompt):
-    """Получает ответ от OpenAI с использованием модели GPT-4."""
+    """
+    Получает ответ от OpenAI: короткие запросы — быстрая модель, остальные — GPT-4.
+    Потоковый запрос ждёт не дольше OPENAI_REPLY_DEADLINE, затем возвращается PartialAnswer.
+
+    :raises CommandError: Если бюджет OpenAI исчерпан, пул генераций заполнен или генерация не удалась.
+    """
+    model = OPENAI_TIERS.choose(prompt)
+    if not rate_limiter.allow(
+        per_minute('openai:requests', OPENAI_RPM),
+        per_minute('openai:tokens', OPENAI_TPM, cost=estimate_openai_tokens(prompt)),
+    ):
+        logger.warning("Глобальный бюджет OpenAI исчерпан, запрос отклонён.")
+        raise CommandError(OPENAI_BUDGET_REPLY)
+
+    stream = CompletionStream(
+        lambda: openai_deltas(model, chat_messages(prompt), OPENAI_MAX_TOKENS, OPENAI_TEMPERATURE, OPENAI_READ_TIMEOUT),
+        max_duration=OPENAI_STREAM_TIMEOUT,
+    )
+    stream.add_done_callback(finish_completion)
+    if not stream_pool.submit(stream.run):
+        logger.warning(f"Пул генераций заполнен ({stream_pool.queue_depth}), запрос отклонён.")
+        raise CommandError(BUSY_REPLY)
+
+    if stream.wait(OPENAI_REPLY_DEADLINE):
+        if stream.error is not None:
+            raise CommandError(OPENAI_ERROR_REPLY)
+        return stream.text.strip()
+
+    # Срок ответа истёк, генерация продолжается в фоне
+    partial = stream.text
+    if partial.strip():
+        logger.info("Ответ OpenAI не готов за %.1f с, отправлена часть (%d симв.)",
+                    OPENAI_REPLY_DEADLINE, len(partial), extra=SAMPLED)
+        return PartialAnswer(f"{partial.strip()}…", stream, 'partial', sent_chars=len(partial))
+    fallback = _ask_fallback(prompt, model)
+    if fallback:
+        logger.info("Ответ OpenAI не готов за %.1f с, отправлен ответ %s",
+                    OPENAI_REPLY_DEADLINE, OPENAI_FAST_MODEL, extra=SAMPLED)
+        return PartialAnswer(fallback, stream, 'fallback')
+    return PartialAnswer(PENDING_REPLY, stream, 'pending')
+
+
+def _ask_fallback(prompt, model):
+    """Короткий ответ быстрой модели, пока основная ещё генерирует; None, если его не получить."""
+    if model == OPENAI_FAST_MODEL or not rate_limiter.allow(per_minute('openai:requests', OPENAI_RPM)):
+        return None
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "Ты помогающий ассистент."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150,
-            n=1,
-            stop=None,
-            temperature=0.7,
-        )
-        ai_reply = response.choices[0].message['content'].strip()
-        return ai_reply
+        with stage_timer('ask_openai_fallback'):
+            response = openai.ChatCompletion.create(
+                model=OPENAI_FAST_MODEL,
+                messages=chat_messages(prompt),
+                max_tokens=OPENAI_MAX_TOKENS,
+                n=1,
+                stop=None,
+                temperature=OPENAI_TEMPERATURE,
+                request_timeout=OPENAI_FALLBACK_TIMEOUT,
+            )
+        return response.choices[0].message['content'].strip() or None
     except Exception as e:
-        logger.exception(f"Ошибка при обращении к OpenAI: {e}")
-        return "Извините, произошла ошибка при обработке вашего запроса."
+        count_upstream_error('openai', e)
+        logger.warning(f"Быстрая модель не ответила: {e}")
+        return None
 
 
 if __name__ == "__main__":
     # Запуск Flask-приложения
-    app.run(host='0.0.0.0', port=5000)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
@@ -0,0 +1,334 @@
+"""
+Асинхронный вариант app.py на aiohttp: обработчик /callback не занимает поток на время
+обращения к OpenAI или загрузки страницы, поэтому один процесс держит тысячи диалогов.
+
+Конфигурация, кэш, лимиты и шаблоны команд общие с app.py (модуль bot_common); пулы потоков
+и обработчики завершения app.py в рабочие процессы не импортируются.
+Запуск: python app_async.py [--port 5000] [--processes 4]
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+from aiohttp import web
+
+import bot_common as common
+from aio_web import AsyncLineClient, AsyncOpenAIClient, create_session, metrics_view, serve
+from commands import AsyncCommandRouter, CommandError
+from llm_stream import AsyncCompletionStream, PartialAnswer
+from logging_setup import SAMPLED, setup_logging
+from metrics import count_upstream_error, stage_timer
+from page_fetch import fetch_paragraph_text_async
+from rate_limit import per_minute
+from webhook import InvalidBodyError
+
+logger = logging.getLogger(__name__)
+
+# Одновременно обрабатываемых событий на процесс и ожидающих сверх этого
+EVENT_CONCURRENCY = int(os.getenv('ASYNC_EVENT_CONCURRENCY', 1000))
+EVENT_BACKLOG = int(os.getenv('ASYNC_EVENT_BACKLOG', 5000))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 60))
+
+PARSE_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+        '(KHTML, like Gecko) Chrome/85.0.4183.102 Safari/537.36'
+    )
+}
+
+# С общими SQLite-файлами (CACHE_PATH, RATE_LIMIT_PATH) обращения к кэшу и лимитам ждут диска
+# и блокировки файла (до 5 с), поэтому выполняются в потоках, а не в цикле событий
+SQLITE_OFFLOAD = bool(common.CACHE_PATH or common.RATE_LIMIT_PATH)
+
+
+async def offload(func, *args):
+    """Вызывает синхронную функцию кэша или лимитов, не блокируя цикл событий файлом SQLite."""
+    if SQLITE_OFFLOAD:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+
+# Команды с теми же шаблонами и метаданными, что в app.py, но с асинхронными обработчиками
+router = AsyncCommandRouter(cache=common.response_cache, blocking=offload)
+
+
+def mirror(name):
+    """Регистрирует асинхронный обработчик команды name с шаблоном и метаданными из bot_common.COMMANDS."""
+    return router.command(name, **common.COMMANDS[name])
+
+
+@mirror('translate')
+async def translate_command(match):
+    dest_lang = match.group(1)
+    translation = await translate_text(match.group(2), dest_lang)
+    if translation is None:
+        raise CommandError(f"Перевод ({dest_lang}): Произошла ошибка при переводе.")
+    return f"Перевод ({dest_lang}): {translation}"
+
+
+@mirror('parse')
+async def parse_command(match):
+    url = match.group(1)
+    parsed_content = await parse_website(url)
+    if not parsed_content:
+        raise CommandError("Не удалось спарсить содержимое сайта.")
+    return f"Содержимое <{url}>:\n{parsed_content[:common.PARSE_REPLY_CHARS]}..."
+
+
+@mirror('ask')
+async def ask_command(match):
+    return await ask_openai(match.group(1))
+
+
+@router.default(**common.CHAT_COMMAND)
+async def chat_message(text):
+    return await ask_openai(text)
+
+
+async def translate_text(text, dest_language='ru'):
+    """Асинхронный вариант app.translate_text: ожидание пакета не занимает поток."""
+    with stage_timer('translate_text'):
+        try:
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(common.translation_engine.submit(text, dest_language)),
+                common.translation_engine.timeout
+            )
+            return result.text
+        except Exception as e:
+            count_upstream_error('translate', e)
+            logger.exception(f"Ошибка при переводе текста: {e}")
+            return None
+
+
+async def parse_website(url):
+    """Асинхронный вариант app.parse_website."""
+    with stage_timer('parse_website'):
+        if not common.is_valid_url(url):
+            logger.warning(f"Некорректный URL: {url}")
+            return None
+        try:
+            return await fetch_paragraph_text_async(
+                http_session, url, headers=PARSE_HEADERS, timeout=common.PARSE_TIMEOUT,
+                max_bytes=common.PARSE_MAX_BYTES, max_chars=common.PARSE_REPLY_CHARS
+            )
+        except Exception as e:
+            count_upstream_error('parse', e)
+            logger.exception(f"Ошибка при парсинге сайта {url}: {e}")
+            return None
+
+
+async def ask_openai(prompt):
+    """Асинхронный вариант app.ask_openai (общие выбор модели и бюджет OpenAI)."""
+    with stage_timer('ask_openai'):
+        model = common.OPENAI_TIERS.choose(prompt)
+        if not await offload(
+            common.rate_limiter.allow,
+            per_minute('openai:requests', common.OPENAI_RPM),
+            per_minute('openai:tokens', common.OPENAI_TPM, cost=common.estimate_openai_tokens(prompt)),
+        ):
+            logger.warning("Глобальный бюджет OpenAI исчерпан, запрос отклонён.")
+            raise CommandError(common.OPENAI_BUDGET_REPLY)
+
+        stream = AsyncCompletionStream(
+            lambda: openai_client.chat_stream(
+                common.chat_messages(prompt), model=model, max_tokens=common.OPENAI_MAX_TOKENS,
+                temperature=common.OPENAI_TEMPERATURE, read_timeout=common.OPENAI_READ_TIMEOUT
+            ),
+            max_duration=common.OPENAI_STREAM_TIMEOUT,
+        ).start()
+        stream.add_done_callback(common.finish_completion)
+
+        if await stream.wait(common.OPENAI_REPLY_DEADLINE):
+            if stream.error is not None:
+                raise CommandError(common.OPENAI_ERROR_REPLY)
+            return stream.text.strip()
+
+        partial = stream.text
+        if partial.strip():
+            logger.info("Ответ OpenAI не готов за %.1f с, отправлена часть (%d симв.)",
+                        common.OPENAI_REPLY_DEADLINE, len(partial), extra=SAMPLED)
+            return PartialAnswer(f"{partial.strip()}…", stream, 'partial', sent_chars=len(partial))
+        fallback = await _ask_fallback(prompt, model)
+        if fallback:
+            logger.info("Ответ OpenAI не готов за %.1f с, отправлен ответ %s",
+                        common.OPENAI_REPLY_DEADLINE, common.OPENAI_FAST_MODEL, extra=SAMPLED)
+            return PartialAnswer(fallback, stream, 'fallback')
+        return PartialAnswer(common.PENDING_REPLY, stream, 'pending')
+
+
+async def _ask_fallback(prompt, model):
+    """Асинхронный вариант app._ask_fallback."""
+    if model == common.OPENAI_FAST_MODEL or not await offload(
+        common.rate_limiter.allow, per_minute('openai:requests', common.OPENAI_RPM)
+    ):
+        return None
+    try:
+        with stage_timer('ask_openai_fallback'):
+            return await openai_client.chat(
+                common.chat_messages(prompt),
+                model=common.OPENAI_FAST_MODEL,
+                max_tokens=common.OPENAI_MAX_TOKENS,
+                temperature=common.OPENAI_TEMPERATURE,
+                timeout=common.OPENAI_FALLBACK_TIMEOUT,
+            ) or None
+    except Exception as e:
+        count_upstream_error('openai', e)
+        logger.warning(f"Быстрая модель не ответила: {e}")
+        return None
+
+
+async def reply(reply_token, messages):
+    try:
+        with stage_timer('send_reply'):
+            await line_client.reply(reply_token, messages)
+    except Exception as e:
+        count_upstream_error('line', e)
+        logger.exception(f"Ошибка при отправке ответа: {e}")
+
+
+async def handle_text_message(event):
+    user_message = event.message.text.strip()
+    followup = None
+    try:
+        command, match = router.resolve(user_message)
+        if await offload(common.allow_message, event.source, command):
+            text = await router.run(command, match, user_message)
+        else:
+            text = common.RATE_LIMITED_REPLY
+    except Exception as e:
+        logger.exception(f"Ошибка при обработке команды: {e}")
+        text = "Не удалось обработать запрос."
+    if isinstance(text, PartialAnswer):
+        followup, text = text, text.text
+    await reply(event.reply_token, [{'type': 'text', 'text': text}])
+
+    if followup is not None and common.OPENAI_PUSH_FOLLOWUP:
+        to = common.push_target(event.source)
+        if to:
+            followup.stream.add_done_callback(lambda stream: track(send_followup(to, followup)))
+
+
+async def send_followup(to, answer):
+    """Асинхронный вариант app.send_followup."""
+    text = answer.followup_text()
+    if text is None:
+        if answer.stream.error is not None and answer.mode == 'pending':
+            text = common.OPENAI_ERROR_REPLY
+        else:
+            return
+    try:
+        with stage_timer('send_push'):
+            await line_client.push(to, [{'type': 'text', 'text': text}])
+    except Exception as e:
+        count_upstream_error('line', e)
+        logger.exception(f"Ошибка при отправке продолжения ответа: {e}")
+
+
+async def handle_sticker_message(event):
+    await reply(event.reply_token, [{
+        'type': 'sticker',
+        'packageId': event.message.package_id,
+        'stickerId': event.message.sticker_id,
+    }])
+
+
+MESSAGE_HANDLERS = {
+    'text': handle_text_message,
+    'sticker': handle_sticker_message,
+}
+
+
+async def dispatch_event(event):
+    async with event_slots:
+        func = MESSAGE_HANDLERS.get(event.message.type)
+        if func is None:
+            logger.info("Нет обработчика для сообщения типа %s", event.message.type, extra=SAMPLED)
+            return
+        await func(event)
+
+
+async def callback(request):
+    """Обработчик входящих запросов от сервера LINE: события обрабатываются в фоновых задачах."""
+    signature = request.headers.get('X-Line-Signature')
+    if signature is None:
+        logger.warning("Нет X-Line-Signature в заголовках!")
+        raise web.HTTPBadRequest()
+    body = await request.read()
+    with stage_timer('verify_line_signature'):
+        valid = common.parser.verify(body, signature)
+    if not valid:
+        logger.warning("Неверная подпись!")
+        raise web.HTTPBadRequest()
+    try:
+        with stage_timer('parse_events'):
+            events = common.parser.parse_body(body)
+    except InvalidBodyError as e:
+        logger.warning(f"Некорректное тело запроса: {e}")
+        raise web.HTTPBadRequest()
+
+    for event in events:
+        if event.type != 'message' or event.message is None:
+            continue
+        if len(pending_tasks) >= EVENT_CONCURRENCY + EVENT_BACKLOG:
+            logger.warning(f"Очередь событий заполнена ({len(pending_tasks)}), событие отклонено.")
+            if common.EVENT_OVERLOAD_POLICY == 'busy':
+                track(reply(event.reply_token, [{'type': 'text', 'text': common.BUSY_REPLY}]))
+            continue
+        track(dispatch_event(event))
+    return web.Response(text='OK')
+
+
+def track(coro):
+    task = asyncio.ensure_future(coro)
+    pending_tasks.add(task)
+    task.add_done_callback(pending_tasks.discard)
+
+
+pending_tasks = set()
+event_slots = None
+http_session = None
+line_client = None
+openai_client = None
+
+
+async def on_startup(application):
+    global event_slots, http_session, line_client, openai_client
+    event_slots = asyncio.Semaphore(EVENT_CONCURRENCY)
+    http_session = create_session()
+    line_client = AsyncLineClient(http_session, common.LINE_CHANNEL_ACCESS_TOKEN)
+    openai_client = AsyncOpenAIClient(http_session, common.OPENAI_API_KEY, timeout=OPENAI_TIMEOUT)
+
+
+async def on_cleanup(application):
+    if pending_tasks:
+        logger.info(f"Ожидание завершения событий: {len(pending_tasks)}")
+        await asyncio.wait(set(pending_tasks), timeout=30)
+    await http_session.close()
+    common.translation_engine.shutdown()
+
+
+def make_app():
+    # Вызывается в каждом рабочем процессе: импорт модуля не запускает потоков
+    setup_logging()
+    common.check_credentials()
+    application = web.Application()
+    application.router.add_post('/callback', callback)
+    application.router.add_get('/metrics', metrics_view)
+    application.on_startup.append(on_startup)
+    application.on_cleanup.append(on_cleanup)
+    return application
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Асинхронный сервер LINE-бота.')
+    arg_parser.add_argument('--host', default='0.0.0.0')
+    arg_parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 5000)))
+    arg_parser.add_argument('--processes', type=int, default=int(os.getenv('WEB_PROCESSES', 1)),
+                            help='Число процессов, слушающих порт')
+    args = arg_parser.parse_args(argv)
+    serve(make_app, args.host, args.port, args.processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Бенчмарк стоимости выбора команды для входящего сообщения: прежняя цепочка re.match
+против CommandRouter. Обработчики пустые, измеряется только диспетчеризация.
+
+Запуск: python benchmarks/bench_dispatch.py [--messages 200000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands import CommandRouter  # noqa: E402
+
+SAMPLE_MESSAGES = [
+    'Привет! Как дела?',
+    'Что сегодня на ужин?',
+    'ok',
+    '/translate en Доброе утро',
+    '/parse https://example.com/article',
+    '/ask Сколько будет 2+2?',
+    '/unknown command',
+]
+
+
+def legacy_dispatch(user_message: str) -> str:
+    """Цепочка if/elif из исходного handle_text_message."""
+    translate_match = re.match(r'^/translate\s+(\w{2})\s+(.+)', user_message, re.IGNORECASE)
+    if translate_match:
+        return 'translate'
+    elif re.match(r'^/parse\s+(.+)', user_message, re.IGNORECASE):
+        return 'parse'
+    elif re.match(r'^/ask\s+(.+)', user_message, re.IGNORECASE):
+        return 'ask'
+    return 'chat'
+
+
+def build_router() -> CommandRouter:
+    router = CommandRouter()
+    router.command('translate', r'^/translate\s+(\w{2})\s+(.+)')(lambda match: 'translate')
+    router.command('parse', r'^/parse\s+(.+)')(lambda match: 'parse')
+    router.command('ask', r'^/ask\s+(.+)')(lambda match: 'ask')
+    router.default(lambda text: 'chat')
+    return router
+
+
+def measure(label: str, messages: List[str], dispatch: Callable[[str], str]) -> None:
+    start = time.perf_counter()
+    for message in messages:
+        dispatch(message)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed / len(messages) * 1e9:>8.0f} нс/сообщ.")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--messages', type=int, default=200000, help='Количество сообщений')
+    arg_parser.add_argument('--seed', type=int, default=1, help='Зерно генератора случайных чисел')
+    args = arg_parser.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = [rng.choice(SAMPLE_MESSAGES) for _ in range(args.messages)]
+    router = build_router()
+
+    for message in SAMPLE_MESSAGES:
+        assert legacy_dispatch(message) == router.dispatch(message), message
+
+    measure('legacy re.match chain', messages, legacy_dispatch)
+    measure('CommandRouter', messages, router.dispatch)
+    plain = [m for m in messages if not m.startswith('/')]
+    measure('legacy (plain text)', plain, legacy_dispatch)
+    measure('CommandRouter (plain)', plain, router.dispatch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Микробенчмарк шифрования ответов: сообщений в секунду для одиночного и пакетного пути.
+
+Запуск: python benchmarks/bench_encryption.py [--messages 20000] [--size 120]
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+from typing import Callable, List
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crypto_engine import EncryptionEngine, MODE_CBC, MODE_GCM  # noqa: E402
+
+
+def legacy_encrypt_text(key: bytes, plain_text: str) -> str:
+    """Исходная реализация encrypt_text: новый объект AES на каждое сообщение."""
+    iv = os.urandom(16)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    cipher_text = cipher.encrypt(pad(plain_text.encode('utf-8'), AES.block_size))
+    return base64.b64encode(iv + cipher_text).decode('utf-8')
+
+
+def measure(label: str, count: int, func: Callable[[], object]) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {count / elapsed:>12,.0f} сообщ./с")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--messages', type=int, default=20000, help='Количество сообщений')
+    arg_parser.add_argument('--size', type=int, default=120, help='Длина сообщения в символах')
+    arg_parser.add_argument('--batch', type=int, default=100, help='Размер пакета для encrypt_many')
+    args = arg_parser.parse_args()
+
+    key = os.urandom(32)
+    texts: List[str] = [(f'сообщение {i} ' * args.size)[:args.size] for i in range(args.messages)]
+    batches = [texts[i:i + args.batch] for i in range(0, len(texts), args.batch)]
+
+    measure('legacy encrypt_text (CBC)', len(texts), lambda: [legacy_encrypt_text(key, t) for t in texts])
+    for mode in (MODE_CBC, MODE_GCM):
+        engine = EncryptionEngine(key, mode=mode)
+        tokens = [token for batch in batches for token in engine.encrypt_many(batch)]
+        measure(f'{mode}: encrypt_text', len(texts), lambda: [engine.encrypt_text(t) for t in texts])
+        measure(f'{mode}: encrypt_many (x{args.batch})', len(texts),
+                lambda: [engine.encrypt_many(b) for b in batches])
+        measure(f'{mode}: decrypt_text', len(texts), lambda: [engine.decrypt_text(t) for t in tokens])
+        token_batches = [tokens[i:i + args.batch] for i in range(0, len(tokens), args.batch)]
+        measure(f'{mode}: decrypt_many (x{args.batch})', len(texts),
+                lambda: [engine.decrypt_many(b) for b in token_batches])
+
+
+if __name__ == '__main__':
+    main()
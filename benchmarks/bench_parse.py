@@ -0,0 +1,70 @@
+"""
+Бенчмарк разбора страниц каталога на сохранённых страницах из benchmarks/fixtures:
+прежний parse_page на BeautifulSoup против extraction.ProductExtractor (lxml и selectolax).
+
+Запуск: python benchmarks/bench_parse.py [--repeat 50] [fixture.html ...]
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+from bs4 import BeautifulSoup
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from extraction import ProductExtractor, _SelectolaxParser  # noqa: E402
+
+
+def legacy_parse_page(html: str) -> List[Dict[str, str]]:
+    """Исходный parse_page из parser.py: полное дерево BeautifulSoup и четыре find на элемент."""
+    soup = BeautifulSoup(html, 'lxml')
+    products = []
+    for item in soup.find_all('div', class_='product-item'):
+        try:
+            products.append({
+                'name': item.find('h2', class_='product-name').get_text(strip=True),
+                'price': item.find('span', class_='price').get_text(strip=True),
+                'image_url': item.find('img', class_='product-image')['src'],
+                'product_url': item.find('a', class_='product-link')['href'],
+            })
+        except (AttributeError, TypeError):
+            continue
+    return products
+
+
+def measure(label: str, html: str, repeat: int, parse: Callable[[str], list]) -> None:
+    count = len(parse(html))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(html)
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<14} {elapsed * 1000:>8.2f} мс/стр.  {count:>4} продуктов")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('fixtures', nargs='*', help='HTML-файлы (по умолчанию benchmarks/fixtures/*.html)')
+    arg_parser.add_argument('--repeat', type=int, default=50, help='Повторов на страницу')
+    args = arg_parser.parse_args()
+    # Предупреждения о неполных записях не должны влиять на замер
+    logging.disable(logging.WARNING)
+
+    parsers = [('bs4 (legacy)', legacy_parse_page), ('lxml', ProductExtractor(backend='lxml').extract)]
+    if _SelectolaxParser is not None:
+        parsers.append(('selectolax', ProductExtractor(backend='selectolax').extract))
+
+    for path in args.fixtures or sorted(glob.glob(os.path.join(BENCH_DIR, 'fixtures', '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        print(f"{os.path.basename(path)} ({len(html) // 1024} КБ)")
+        for label, parse in parsers:
+            measure(label, html, args.repeat, parse)
+
+
+if __name__ == '__main__':
+    main()
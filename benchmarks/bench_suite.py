@@ -0,0 +1,331 @@
+"""
+Офлайн-бенчмарк компонентов на локальных заглушках (benchmarks/stubs.py): сеть наружу
+не нужна. Для каждого компонента — пропускная способность, задержка p50/p99 и пиковый RSS.
+Каждый компонент замеряется в отдельном процессе, чтобы RSS и прогретые кэши не смешивались.
+
+Компоненты:
+  callback             app.py /callback: подпись, разбор, постановка событий в очередь
+  encryption_callback  encryption.py /callback: разбор, шифрование и отправка ответов
+  send_reply           encryption.send_reply_messages -> заглушка LINE
+  ask_openai           app.ask_openai -> заглушка OpenAI (stream, кэш отключён)
+  translate            app.translate_text -> пакетная очередь -> заглушка переводчика (кэши отключены)
+  parse_website        app.parse_website -> статья на заглушке сайта (кэш отключён)
+  parse_page           parser.parse_page на сгенерированной странице каталога
+  scrape_page          parser.get_page + parse_page по страницам заглушки каталога
+
+Результаты сравниваются с benchmarks/baseline.json: рост задержки или RSS либо падение
+пропускной способности больше допуска считается регрессией (код выхода 1). Компоненты,
+обращающиеся к заглушкам, делят процессор с процессом заглушки и шумят сильнее —
+для них допуск по времени удваивается. Базовые значения зависят от машины
+(параметры машины сохраняются в файле) — обновляйте их там же, где сравниваете.
+
+Запуск:
+  python benchmarks/bench_suite.py
+  python benchmarks/bench_suite.py --only parse_page,callback --iterations 500
+  python benchmarks/bench_suite.py --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from html_fixtures import catalog_page  # noqa: E402
+from loadtest_webhook import CHANNEL_SECRET, percentile, target_env, wait_ready  # noqa: E402
+from webhook_payloads import text_payloads  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Показатели и направление «лучше»: +1 — больше лучше, -1 — меньше лучше
+METRICS = (('throughput', +1), ('p50_ms', -1), ('p99_ms', -1), ('peak_rss_mb', -1))
+
+
+def total_operations(args) -> int:
+    return args.warmup + args.iterations * args.rounds
+
+
+def setup_callback(args, stub_url: str) -> Callable[[int], None]:
+    import app as bot
+    client = bot.app.test_client()
+    payloads = text_payloads(total_operations(args), CHANNEL_SECRET, args.events_per_request)
+
+    def op(i: int) -> None:
+        body, headers, _ = payloads[i]
+        response = client.post('/callback', data=body, headers=headers)
+        assert response.status_code == 200, response.status_code
+    return op
+
+
+def setup_encryption_callback(args, stub_url: str) -> Callable[[int], None]:
+    import encryption
+    client = encryption.app.test_client()
+    payloads = text_payloads(total_operations(args), CHANNEL_SECRET, args.events_per_request)
+
+    def op(i: int) -> None:
+        body, headers, _ = payloads[i]
+        response = client.post('/callback', data=body, headers=headers)
+        assert response.status_code == 200, response.status_code
+    return op
+
+
+def setup_send_reply(args, stub_url: str) -> Callable[[int], None]:
+    import encryption
+    message = encryption.build_text_message(encryption.encrypt_text('Ответ для бенчмарка ' * 5))
+    return lambda i: encryption.send_reply_messages(f'rt-bench-{i}', [message])
+
+
+def setup_ask_openai(args, stub_url: str) -> Callable[[int], None]:
+    import app as bot
+    return lambda i: bot.ask_openai(f'Вопрос для бенчмарка номер {i}')
+
+
+def setup_translate(args, stub_url: str) -> Callable[[int], None]:
+    import app as bot
+    return lambda i: bot.translate_text(f'Текст для перевода номер {i}', 'en')
+
+
+def setup_parse_website(args, stub_url: str) -> Callable[[int], None]:
+    import app as bot
+
+    def op(i: int) -> None:
+        assert bot.parse_website(f'{stub_url}/article/{i % 16}?kb={args.article_kb}')
+    return op
+
+
+def setup_parse_page(args, stub_url: str) -> Callable[[int], None]:
+    import parser as scraper
+    html = catalog_page(products=args.products)
+
+    def op(i: int) -> None:
+        assert len(scraper.parse_page(html)) == args.products
+    return op
+
+
+def setup_scrape_page(args, stub_url: str) -> Callable[[int], None]:
+    import parser as scraper
+    from http_client import HostPolicy, PooledSession
+    session = PooledSession(policies={}, default=HostPolicy())
+    headers = {'User-Agent': 'bench'}
+
+    def op(i: int) -> None:
+        html = scraper.get_page(session, f'{stub_url}/catalog?page={i % args.pages + 1}', headers, retries=0)
+        assert len(scraper.parse_page(html)) == args.products
+    return op
+
+
+# Компоненты без обращений к заглушкам (замер только процессорного времени)
+CPU_COMPONENTS = frozenset({'parse_page'})
+
+COMPONENTS: Dict[str, Callable] = {
+    'callback': setup_callback,
+    'encryption_callback': setup_encryption_callback,
+    'send_reply': setup_send_reply,
+    'ask_openai': setup_ask_openai,
+    'translate': setup_translate,
+    'parse_website': setup_parse_website,
+    'parse_page': setup_parse_page,
+    'scrape_page': setup_scrape_page,
+}
+
+
+def run_component(args) -> Dict[str, float]:
+    """
+    Замер одного компонента в текущем процессе (режим --run-component).
+    Замер повторяется args.rounds раз, берётся медиана каждого показателя.
+    """
+    op = COMPONENTS[args.run_component](args, args.stub_url)
+    for i in range(args.warmup):
+        op(i)
+    rounds = []
+    i = args.warmup
+    for _ in range(args.rounds):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            op_started = time.perf_counter()
+            op(i)
+            latencies.append(time.perf_counter() - op_started)
+            i += 1
+        elapsed = time.perf_counter() - started
+        rounds.append((args.iterations / elapsed, percentile(latencies, 50), percentile(latencies, 99)))
+    throughput, p50, p99 = (statistics.median(values) for values in zip(*rounds))
+    return {
+        'iterations': args.iterations * args.rounds,
+        'throughput': round(throughput, 1),
+        'p50_ms': round(p50 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+        # ru_maxrss в Linux — в килобайтах
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def spawn_component(name: str, args, stub_url: str, workdir: str) -> Dict[str, float]:
+    command = [
+        sys.executable, os.path.abspath(__file__), '--run-component', name, '--stub-url', stub_url,
+        '--iterations', str(args.iterations), '--rounds', str(args.rounds), '--warmup', str(args.warmup),
+        '--events-per-request', str(args.events_per_request), '--products', str(args.products),
+        '--pages', str(args.pages), '--article-kb', str(args.article_kb),
+    ]
+    env = target_env(stub_url, 0, {
+        'CACHE_TTL_ASK': '0', 'CACHE_TTL_TRANSLATE': '0', 'CACHE_TTL_PARSE': '0', 'TRANSLATE_CACHE_TTL': '0',
+        'TRANSLATE_API_BASE': stub_url,
+        'PYTHONPATH': ROOT_DIR,
+        'LOG_LEVEL': 'ERROR',
+    })
+    # Рабочий каталог временный: файлы, которые компоненты создают в текущем каталоге, не остаются в репозитории
+    completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, timeout=args.timeout)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{name}: код {completed.returncode}\n{completed.stderr[-2000:]}')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float, rss_tolerance: float) -> List[str]:
+    """
+    :return: Описания регрессий относительно базовых значений.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, direction in METRICS:
+            if metric not in base or not base[metric]:
+                continue
+            if metric == 'peak_rss_mb':
+                allowed = rss_tolerance
+            else:
+                allowed = tolerance if name in CPU_COMPONENTS else tolerance * 2
+            change = (result[metric] - base[metric]) / base[metric]
+            if -direction * change > allowed:
+                regressions.append(f'{name}.{metric}: {base[metric]} -> {result[metric]} ({change:+.0%})')
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'компонент':<20} {'оп./с':>16} {'p50, мс':>16} {'p99, мс':>16} {'RSS, МБ':>14}")
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        cells = []
+        for metric, _ in METRICS:
+            cell = f'{result[metric]:.1f}' if metric in ('throughput', 'peak_rss_mb') else f'{result[metric]:.2f}'
+            if base.get(metric):
+                cell += f' ({(result[metric] - base[metric]) / base[metric]:+.0%})'
+            cells.append(cell)
+        print(f"{name:<20} {cells[0]:>16} {cells[1]:>16} {cells[2]:>16} {cells[3]:>14}")
+
+
+async def start_stub(args, stub_url: str) -> subprocess.Popen:
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'stubs.py'), '--port', str(args.stub_port),
+         '--openai-delay', '0', '--line-delay', '0', '--translate-delay', '0', '--jitter', '0',
+         '--site-products', str(args.products), '--site-pages', str(args.pages),
+         '--article-kb', str(args.article_kb)],
+        cwd=ROOT_DIR
+    )
+    async with aiohttp.ClientSession() as session:
+        await wait_ready(session, f'{stub_url}/_stats', stub)
+    return stub
+
+
+def run_suite(args) -> int:
+    names = args.only.split(',') if args.only else list(COMPONENTS)
+    unknown = [name for name in names if name not in COMPONENTS]
+    if unknown:
+        raise SystemExit(f"Неизвестные компоненты: {', '.join(unknown)}")
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            saved = json.load(f)
+        baseline = saved.get('components', {})
+        if saved.get('options', {}).get('machine', {}).get('cpus') != os.cpu_count():
+            print("Внимание: базовые значения сняты на машине с другим числом процессоров.")
+
+    stub_url = f'http://127.0.0.1:{args.stub_port}'
+    stub = asyncio.run(start_stub(args, stub_url))
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+            for name in names:
+                results[name] = spawn_component(name, args, stub_url, workdir)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    print(f"Итераций: {args.iterations} x {args.rounds} раундов, событий в вебхуке: {args.events_per_request}, "
+          f"продуктов на странице: {args.products}, статья: {args.article_kb} КБ")
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                saved = json.load(f).get('components', {})
+        saved.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'options': baseline_options(args), 'components': saved}, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"Базовые значения сохранены в {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance, args.rss_tolerance)
+    for regression in regressions:
+        print(f"РЕГРЕССИЯ {regression}")
+    return 1 if regressions else 0
+
+
+def baseline_options(args) -> Dict[str, Any]:
+    return {
+        'iterations': args.iterations, 'rounds': args.rounds, 'events_per_request': args.events_per_request,
+        'products': args.products, 'pages': args.pages, 'article_kb': args.article_kb,
+        'machine': machine_info(),
+    }
+
+
+def machine_info() -> Dict[str, Any]:
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='Офлайн-бенчмарк компонентов бота и парсера.')
+    arg_parser.add_argument('--only', help=f"Компоненты через запятую: {','.join(COMPONENTS)}")
+    arg_parser.add_argument('--iterations', type=int, default=200, help='Замеряемых операций в одном раунде')
+    arg_parser.add_argument('--rounds', type=int, default=5, help='Раундов замера (берётся медиана)')
+    arg_parser.add_argument('--warmup', type=int, default=20, help='Операций прогрева (не замеряются)')
+    arg_parser.add_argument('--events-per-request', type=int, default=5, help='Событий в одном вебхуке')
+    arg_parser.add_argument('--products', type=int, default=240, help='Продуктов на странице каталога')
+    arg_parser.add_argument('--pages', type=int, default=50, help='Страниц в каталоге заглушки')
+    arg_parser.add_argument('--article-kb', type=int, default=128, help='Размер статьи для parse_website, КБ')
+    arg_parser.add_argument('--stub-port', type=int, default=9110)
+    arg_parser.add_argument('--baseline', default=BASELINE_PATH, help='Файл базовых значений')
+    arg_parser.add_argument('--save-baseline', action='store_true', help='Записать результаты как базовые')
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимое ухудшение пропускной способности и задержки (доля)')
+    arg_parser.add_argument('--rss-tolerance', type=float, default=0.15, help='Допустимый рост пикового RSS (доля)')
+    arg_parser.add_argument('--timeout', type=float, default=600, help='Предельное время одного компонента, с')
+    # Внутренний режим: замер одного компонента в дочернем процессе
+    arg_parser.add_argument('--run-component', choices=sorted(COMPONENTS), help=argparse.SUPPRESS)
+    arg_parser.add_argument('--stub-url', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.run_component:
+        print(json.dumps(run_component(args)))
+        return
+    sys.exit(run_suite(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Бенчмарк перевода под параллельной нагрузкой на заглушке переводчика (benchmarks/stubs.py):
+прежний путь (один HTTP-запрос на строку) против translation.TranslationEngine
+(пакеты по целевому языку, кэш языков и переводов, пул клиентов).
+
+Сообщает пропускную способность, задержку p50/p99 и число обращений к переводчику.
+
+Запуск: python benchmarks/bench_translate.py [--requests 2000] [--concurrency 64] [--unique 500]
+        [--languages en,de,fr] [--delay 0.05]
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import aiohttp
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from loadtest_webhook import percentile, wait_ready  # noqa: E402
+from translation import HttpTranslator, TranslationEngine, TranslatorPool  # noqa: E402
+
+
+def run_load(label: str, stub_url: str, work: List[tuple], concurrency: int,
+             translate: Callable[[str, str], str]) -> None:
+    requests.post(f'{stub_url}/_reset')
+    latencies = []
+
+    def one(item):
+        text, dest = item
+        start = time.perf_counter()
+        translate(text, dest)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, work))
+    elapsed = time.perf_counter() - start
+    calls = requests.get(f'{stub_url}/_stats').json()['translate_calls']
+    print(f"  {label:<22} {len(work) / elapsed:>8.0f} перев./с  p50 {percentile(latencies, 50) * 1000:>7.1f} мс"
+          f"  p99 {percentile(latencies, 99) * 1000:>7.1f} мс  обращений к API {calls}")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--requests', type=int, default=2000, help='Всего переводов')
+    arg_parser.add_argument('--concurrency', type=int, default=64, help='Одновременных запросов')
+    arg_parser.add_argument('--unique', type=int, default=500, help='Различных строк (остальные — повторы)')
+    arg_parser.add_argument('--languages', default='en,de,fr', help='Целевые языки')
+    arg_parser.add_argument('--delay', type=float, default=0.05, help='Задержка ответа заглушки, с')
+    arg_parser.add_argument('--window', type=float, default=0.02, help='Окно накопления пакета, с')
+    arg_parser.add_argument('--batch', type=int, default=32, help='Максимум строк в пакете')
+    arg_parser.add_argument('--clients', type=int, default=4, help='Клиентов в пуле')
+    arg_parser.add_argument('--stub-port', type=int, default=9150)
+    args = arg_parser.parse_args()
+
+    stub_url = f'http://127.0.0.1:{args.stub_port}'
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'stubs.py'), '--port', str(args.stub_port),
+         '--translate-delay', str(args.delay), '--jitter', '0'],
+        cwd=ROOT_DIR
+    )
+    try:
+        async def ready():
+            async with aiohttp.ClientSession() as session:
+                await wait_ready(session, f'{stub_url}/_stats', stub)
+        asyncio.run(ready())
+
+        rng = random.Random(0)
+        languages = args.languages.split(',')
+        work = [
+            (f'Строка для перевода номер {rng.randrange(args.unique)}', rng.choice(languages))
+            for _ in range(args.requests)
+        ]
+        print(f"{args.requests} переводов, {args.unique} различных строк, {len(languages)} языка(ов), "
+              f"задержка API {args.delay * 1000:.0f} мс, {args.concurrency} потоков")
+
+        client = HttpTranslator(stub_url)
+        run_load('по строке', stub_url, work, args.concurrency,
+                 lambda text, dest: client.translate(text, dest=dest).text)
+
+        engine = TranslationEngine(
+            [TranslatorPool('http', lambda: HttpTranslator(stub_url), args.clients)],
+            window=args.window, max_batch=args.batch
+        )
+        run_load('TranslationEngine', stub_url, work, args.concurrency,
+                 lambda text, dest: engine.translate(text, dest).text)
+        engine.shutdown()
+        print(f"  статистика движка: {engine.stats()}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Микробенчмарк проверки подписи и разбора вебхука на больших телах с множеством событий:
+прежние пути encryption.py (HMAC + base64 + json.loads) и app.py (декодирование в str
+и linebot.WebhookParser) против webhook.WebhookParser (json и orjson; объекты Event и словари событий).
+
+Запуск: python benchmarks/bench_webhook.py [--events 1,100,1000] [--text-chars 200] [--repeat 200]
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from linebot import WebhookParser as SdkWebhookParser
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from webhook import WebhookParser, orjson  # noqa: E402
+from webhook_payloads import signed_payload, text_event  # noqa: E402
+
+CHANNEL_SECRET = 'bench-channel-secret'
+
+
+def legacy_encryption_parse(body: bytes, signature: str) -> Any:
+    """Исходный путь encryption.callback: ключ кодируется на каждый вызов, сравниваются base64-строки."""
+    digest = hmac.new(CHANNEL_SECRET.encode('utf-8'), body, hashlib.sha256).digest()
+    if not hmac.compare_digest(base64.b64encode(digest).decode('utf-8'), signature):
+        raise ValueError('Invalid signature')
+    return json.loads(body.decode('utf-8'))['events']
+
+
+def measure(label: str, events: int, repeat: int, parse: Callable[[], Any]) -> None:
+    parse()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse()
+    elapsed = (time.perf_counter() - start) / repeat
+    # Память, которую занимают разобранные события, пока они ждут обработки
+    tracemalloc.start()
+    result = parse()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"  {label:<22} {elapsed * 1e6:>10.1f} мкс/запрос  {events / elapsed:>12,.0f} событий/с"
+          f"  {retained / events:>8.0f} Б/событие")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--events', default='1,100,1000', help='Событий в запросе (через запятую)')
+    arg_parser.add_argument('--text-chars', type=int, default=200, help='Длина текста сообщения')
+    arg_parser.add_argument('--repeat', type=int, default=200, help='Повторов на размер')
+    args = arg_parser.parse_args()
+
+    sdk_parser = SdkWebhookParser(CHANNEL_SECRET)
+    parsers = [('webhook (json)', WebhookParser(CHANNEL_SECRET, loads=json.loads))]
+    if orjson is not None:
+        parsers.append(('webhook (orjson)', WebhookParser(CHANNEL_SECRET)))
+
+    for count in (int(value) for value in args.events.split(',')):
+        text = ('сообщение ' * args.text_chars)[:args.text_chars]
+        body, headers = signed_payload(
+            [text_event(text, f'U{i:032x}') for i in range(count)], CHANNEL_SECRET
+        )
+        signature = headers['X-Line-Signature']
+        repeat = max(5, args.repeat * 10 // max(count, 10))
+        print(f"{count} событий, {len(body) // 1024} КБ, повторов {repeat}")
+        measure('legacy encryption', count, repeat, lambda: legacy_encryption_parse(body, signature))
+        measure('legacy app (SDK)', count, repeat, lambda: sdk_parser.parse(body.decode('utf-8'), signature))
+        for label, parser in parsers:
+            measure(label, count, repeat, lambda: parser.parse(body, signature))
+        for label, parser in parsers:
+            # Путь encryption.py: проверка подписи и события-словари без объектов Event
+            measure(label.replace('webhook', 'dicts'), count, repeat,
+                    lambda: parser.verify(body, signature) and parser.load_body(body))
+
+
+if __name__ == '__main__':
+    main()
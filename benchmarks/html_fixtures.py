@@ -0,0 +1,152 @@
+"""
+Генератор HTML для бенчмарков: страницы каталога в разметке benchmarks/fixtures
+(product-item, product-name, price, product-image, product-link) и статьи с абзацами
+для /parse. Размер задаётся числом карточек/абзацев; при одинаковом seed результат один и тот же.
+
+Запуск: python benchmarks/html_fixtures.py --products 240 --output benchmarks/fixtures/catalog_page_240.html
+        python benchmarks/html_fixtures.py --article-kb 512 --output /tmp/article.html
+"""
+import argparse
+import random
+from typing import Optional
+
+CATEGORIES = ('Планшет', 'Ноутбук', 'Смартфон', 'Клавиатура', 'Кофемашина', 'Наушники', 'Монитор', 'Пылесос')
+SERIES = ('Pro', 'Lite', 'Max', 'Air', 'Mini')
+WORDS = (
+    'каталог', 'товар', 'доставка', 'цена', 'скидка', 'магазин', 'гарантия', 'модель', 'отзыв',
+    'покупатель', 'характеристика', 'наличие', 'склад', 'заказ', 'оплата', 'качество',
+)
+
+
+def format_price(value: float) -> str:
+    """Цена в виде '7 759,35 ₽'."""
+    return f'{value:,.2f}'.replace(',', ' ').replace('.', ',') + ' ₽'
+
+
+def product_card(product_id: int, rng: random.Random, specs: int = 6, missing_price: bool = False,
+                 price: Optional[float] = None) -> str:
+    """
+    Карточка одного продукта.
+
+    :param product_id: Номер продукта (входит в название, ссылку и картинку).
+    :param rng: Источник случайных чисел.
+    :param specs: Число строк характеристик (увеличивает размер карточки).
+    :param missing_price: Без блока цены (неполная запись).
+    :param price: Цена; по умолчанию случайная.
+    """
+    name = f'{rng.choice(CATEGORIES)} {rng.choice(SERIES)} {product_id}'
+    if price is None:
+        price = round(rng.uniform(500, 90000), 2)
+    price_block = '' if missing_price else (
+        f'  <div class="price-block"><span class="price">{format_price(price)}</span>'
+        f'<span class="old-price">{format_price(price * 1.1)}</span></div>\n'
+    )
+    spec_items = ''.join(f'<li>Характеристика {i}: значение {rng.randint(1, 99)}</li>' for i in range(specs))
+    return (
+        f'<div class="product-item card" data-id="{product_id}">\n'
+        f'  <div class="badge-wrap"><span class="badge">Хит</span></div>\n'
+        f'  <a class="product-link" href="/catalog/item/{product_id}">'
+        f'<img class="product-image lazy" src="https://cdn.example.com/img/{product_id}.jpg" alt="{name}"></a>\n'
+        f'  <h2 class="product-name"><span>{name}</span></h2>\n'
+        f'{price_block}'
+        f'  <ul class="specs">{spec_items}</ul>\n'
+        f'  <button class="buy">В корзину</button>\n'
+        f'</div>\n'
+    )
+
+
+def catalog_page(
+    page: int = 1,
+    products: int = 24,
+    specs: int = 6,
+    missing_price_rate: float = 0.0,
+    nav_links: int = 30,
+    footer_paragraphs: int = 20,
+    pages: Optional[int] = None,
+    seed: int = 0
+) -> str:
+    """
+    Страница каталога.
+
+    :param page: Номер страницы (продукты нумеруются сквозным образом).
+    :param products: Карточек на странице.
+    :param specs: Строк характеристик в карточке.
+    :param missing_price_rate: Доля карточек без цены.
+    :param nav_links: Ссылок в навигации (разметка, не относящаяся к продуктам).
+    :param footer_paragraphs: Абзацев в подвале.
+    :param pages: Всего страниц (для ссылки на следующую страницу); None — без пагинации.
+    :param seed: Зерно генератора: одинаковые параметры дают одинаковую страницу.
+    :return: HTML-код.
+    """
+    rng = random.Random(f'{seed}:{page}')
+    first = (page - 1) * products
+    nav = ''.join(f'<a href="/c/{i}">Раздел {i}</a>' for i in range(nav_links))
+    cards = ''.join(
+        product_card(first + i, rng, specs, missing_price=rng.random() < missing_price_rate)
+        for i in range(products)
+    )
+    pager = ''
+    if pages is not None and page < pages:
+        pager = f'<nav class="pager"><a class="next" href="?page={page + 1}">Дальше</a></nav>\n'
+    footer = '<p>Подвал сайта</p>' * footer_paragraphs
+    return (
+        '<!DOCTYPE html>\n<html lang="ru"><head><meta charset="utf-8"><title>Каталог</title>'
+        '<style>.card{margin:0}</style><script>window.dataLayer=[];</script></head><body>\n'
+        f'<header><nav>{nav}</nav></header>\n'
+        f'<main class="catalog">\n{cards}</main>\n{pager}'
+        f'<footer>{footer}</footer></body></html>'
+    )
+
+
+def article_page(size_kb: int = 64, paragraph_chars: int = 400, seed: int = 0) -> str:
+    """
+    Статья из абзацев <p> вперемешку с разметкой, которую /parse должен пропустить.
+
+    :param size_kb: Примерный размер страницы, КБ.
+    :param paragraph_chars: Примерная длина абзаца, символы.
+    :param seed: Зерно генератора.
+    :return: HTML-код.
+    """
+    rng = random.Random(seed)
+    parts = [
+        '<!DOCTYPE html>\n<html lang="ru"><head><meta charset="utf-8"><title>Статья</title>'
+        '<script>var analytics = {"enabled": true};</script></head><body>\n<article>\n'
+    ]
+    size = len(parts[0])
+    number = 0
+    while size < size_kb * 1024:
+        words = []
+        while sum(len(word) + 1 for word in words) < paragraph_chars:
+            words.append(rng.choice(WORDS))
+        chunk = f'<p>{number}. {" ".join(words).capitalize()}.</p>\n'
+        if number % 5 == 4:
+            chunk += f'<div class="ad"><span>Реклама {number}</span></div>\n'
+        parts.append(chunk)
+        # Размер в байтах UTF-8: кириллица занимает два байта
+        size += len(chunk.encode('utf-8'))
+        number += 1
+    parts.append('</article>\n</body></html>')
+    return ''.join(parts)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='Генератор HTML-страниц для бенчмарков.')
+    arg_parser.add_argument('--products', type=int, default=24, help='Карточек на странице каталога')
+    arg_parser.add_argument('--specs', type=int, default=6, help='Строк характеристик в карточке')
+    arg_parser.add_argument('--missing-price-rate', type=float, default=0.0, help='Доля карточек без цены')
+    arg_parser.add_argument('--page', type=int, default=1, help='Номер страницы каталога')
+    arg_parser.add_argument('--article-kb', type=int, help='Сгенерировать статью указанного размера вместо каталога')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--output', required=True, help='Файл для сохранения')
+    args = arg_parser.parse_args()
+    if args.article_kb:
+        html = article_page(args.article_kb, seed=args.seed)
+    else:
+        html = catalog_page(args.page, args.products, args.specs, args.missing_price_rate, seed=args.seed)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(html)
+    print(f"{args.output}: {len(html.encode('utf-8')) // 1024} КБ")
+
+
+if __name__ == '__main__':
+    main()
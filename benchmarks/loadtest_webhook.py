@@ -0,0 +1,184 @@
+"""
+Нагрузочный тест /callback: поднимает заглушки LINE API и OpenAI (benchmarks/stubs.py),
+запускает выбранный вариант сервера и воспроизводит подписанные вебхуки.
+
+Сообщает пропускную способность, задержку ответа вебхука и сквозную задержку
+(от отправки вебхука до получения заглушкой reply-вызова бота) — p50/p99.
+
+Запуск:
+  python benchmarks/loadtest_webhook.py --target app_async --requests 2000 --concurrency 500
+  python benchmarks/loadtest_webhook.py --target app --requests 500 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from webhook_payloads import text_payloads  # noqa: E402
+
+CHANNEL_SECRET = 'bench-channel-secret'
+ACCESS_TOKEN = 'bench-access-token'
+
+TARGETS = {
+    'app': ['app.py'],
+    'app_async': ['app_async.py'],
+    'encryption': ['encryption.py'],
+    'encryption_async': ['encryption_async.py'],
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def target_env(stub_url: str, port: int, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'LINE_CHANNEL_SECRET': CHANNEL_SECRET,
+        'LINE_CHANNEL_ACCESS_TOKEN': ACCESS_TOKEN,
+        'CHANNEL_SECRET': CHANNEL_SECRET,
+        'CHANNEL_ACCESS_TOKEN': ACCESS_TOKEN,
+        'OPENAI_API_KEY': 'bench-openai-key',
+        'ENCRYPTION_KEY': '0123456789abcdef',
+        'LINE_API_BASE': stub_url,
+        'OPENAI_API_BASE': f'{stub_url}/v1',
+        # Каждый запрос должен дойти до заглушки OpenAI, лимиты не должны мешать
+        'CACHE_TTL_ASK': '0',
+        'USER_RATE_PER_MIN': '1000000000',
+        'GROUP_RATE_PER_MIN': '1000000000',
+        'OPENAI_RPM': '1000000000',
+        'OPENAI_TPM': '1000000000000',
+        'EVENT_QUEUE_SIZE': '100000',
+        # Заглушки LINE и OpenAI на одном хосте: лимит соединений на хост не должен их сериализовать
+        'AIO_CONNECTIONS': '2000',
+        'AIO_CONNECTIONS_PER_HOST': '2000',
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'WARNING'),
+    })
+    env.update(extra or {})
+    return env
+
+
+async def wait_ready(session: aiohttp.ClientSession, url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Процесс завершился с кодом {process.returncode}')
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f'{url} не отвечает')
+
+
+async def replay(session, url, payloads, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, sent_at = [], {}, {}
+
+    async def one(body, headers, tokens):
+        async with semaphore:
+            started = time.time()
+            for token in tokens:
+                sent_at[token] = started
+            try:
+                async with session.post(url, data=body, headers=headers) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError as e:
+                status = type(e).__name__
+            latencies.append(time.time() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(*payload) for payload in payloads))
+    return time.monotonic() - started, latencies, statuses, sent_at
+
+
+async def run(args) -> None:
+    stub_url = f'http://127.0.0.1:{args.stub_port}'
+    target_url = f'http://127.0.0.1:{args.port}'
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'stubs.py'), '--port', str(args.stub_port),
+         '--openai-delay', str(args.openai_delay), '--line-delay', str(args.line_delay)],
+        cwd=ROOT_DIR
+    )
+    command = [sys.executable] + TARGETS[args.target]
+    if args.target.endswith('_async'):
+        command += ['--port', str(args.port), '--processes', str(args.processes)]
+    server = subprocess.Popen(command, cwd=ROOT_DIR, env=target_env(stub_url, args.port))
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await wait_ready(session, f'{stub_url}/_stats', stub)
+            await wait_ready(session, f'{target_url}/metrics', server)
+            payloads = text_payloads(args.requests, CHANNEL_SECRET, args.events_per_request, template=args.text)
+            expected = args.requests * args.events_per_request
+
+            elapsed, latencies, statuses, sent_at = await replay(
+                session, f'{target_url}/callback', payloads, args.concurrency
+            )
+            # Ответы бота могут приходить позже ответа вебхука (фоновая обработка)
+            deadline = time.monotonic() + args.drain_timeout
+            while True:
+                async with session.get(f'{stub_url}/_stats') as response:
+                    stats = await response.json()
+                if len(stats['replies']) >= expected or time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(0.2)
+            drained = time.monotonic() - deadline + args.drain_timeout
+    finally:
+        for process in (server, stub):
+            process.terminate()
+        for process in (server, stub):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    end_to_end = [at - sent_at[token] for token, at in stats['replies'].items() if token in sent_at]
+    print(f"Цель: {args.target} (процессов: {args.processes}), запросов: {args.requests}, "
+          f"событий: {expected}, одновременно: {args.concurrency}")
+    print(f"Ответы вебхука: {statuses}; {args.requests / elapsed:.1f} запр./с за {elapsed:.2f} с; "
+          f"p50 {percentile(latencies, 50) * 1000:.1f} мс, p99 {percentile(latencies, 99) * 1000:.1f} мс")
+    print(f"Ответы бота: {len(end_to_end)}/{expected} за {drained:.2f} с "
+          f"({len(end_to_end) / max(drained, 1e-9):.1f} отв./с); "
+          f"сквозная p50 {percentile(end_to_end, 50) * 1000:.1f} мс, p99 {percentile(end_to_end, 99) * 1000:.1f} мс; "
+          f"вызовов OpenAI: {stats['openai_calls']}")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='Нагрузочный тест вебхука LINE-бота.')
+    arg_parser.add_argument('--target', choices=sorted(TARGETS), default='app_async')
+    arg_parser.add_argument('--processes', type=int, default=1, help='Процессов сервера (для *_async)')
+    arg_parser.add_argument('--requests', type=int, default=1000)
+    arg_parser.add_argument('--events-per-request', type=int, default=1)
+    arg_parser.add_argument('--concurrency', type=int, default=200)
+    arg_parser.add_argument('--text', default='вопрос номер {n}', help='Шаблон текста сообщения с {n}')
+    arg_parser.add_argument('--openai-delay', type=float, default=0.5)
+    arg_parser.add_argument('--line-delay', type=float, default=0.02)
+    arg_parser.add_argument('--port', type=int, default=5055)
+    arg_parser.add_argument('--stub-port', type=int, default=9100)
+    arg_parser.add_argument('--request-timeout', type=float, default=60)
+    arg_parser.add_argument('--drain-timeout', type=float, default=120,
+                            help='Сколько ждать ответов бота после отправки всех вебхуков, с')
+    asyncio.run(run(arg_parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
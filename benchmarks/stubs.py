@@ -0,0 +1,274 @@
+"""
+Локальные заглушки внешних сервисов для бенчмарков: LINE Messaging API (reply/push),
+OpenAI Chat Completions (в том числе stream=True), LibreTranslate-совместимый переводчик
+и синтетический сайт: каталог с пагинацией (/catalog?page=N, ETag и 304) и статьи (/article/N).
+Задержки ответов настраиваются, время получения каждого ответа бота сохраняется
+для расчёта сквозной задержки.
+
+Запуск: python benchmarks/stubs.py [--port 9100] [--openai-delay 0.5] [--line-delay 0.02]
+                                   [--model-delay gpt-4=30 --model-delay gpt-3.5-turbo=1]
+                                   [--site-products 24] [--site-pages 100] [--article-kb 64]
+  LINE_API_BASE=http://127.0.0.1:9100  OPENAI_API_BASE=http://127.0.0.1:9100/v1
+  TRANSLATE_API_BASE=http://127.0.0.1:9100
+  python parser.py --base-url 'http://127.0.0.1:9100/catalog?page={}'
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, NamedTuple, Optional
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from html_fixtures import article_page, catalog_page  # noqa: E402
+
+
+class SiteOptions(NamedTuple):
+    """Параметры синтетического сайта."""
+    products: int = 24
+    pages: int = 100
+    specs: int = 6
+    article_kb: int = 64
+    delay: float = 0.0
+
+
+@functools.lru_cache(maxsize=256)
+def _catalog_html(page: int, site: SiteOptions) -> bytes:
+    return catalog_page(page, site.products, site.specs, pages=site.pages).encode('utf-8')
+
+
+@functools.lru_cache(maxsize=64)
+def _article_html(number: int, size_kb: int) -> bytes:
+    return article_page(size_kb, seed=number).encode('utf-8')
+
+
+class StubState:
+    def __init__(self, openai_delay: float, line_delay: float, jitter: float, error_rate: float,
+                 model_delays: Optional[Dict[str, float]] = None, translate_delay: float = 0.05,
+                 site: SiteOptions = SiteOptions()) -> None:
+        self.openai_delay = openai_delay
+        self.model_delays = model_delays or {}
+        self.line_delay = line_delay
+        self.translate_delay = translate_delay
+        self.site = site
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.reset()
+
+    def reset(self) -> None:
+        # reply-токен -> время получения ответа (time.time())
+        self.replies = {}
+        self.pushes = 0
+        self.push_texts = []
+        self.openai_calls = 0
+        self.translate_calls = 0
+        self.site_requests = 0
+        self.errors = 0
+
+    async def pause(self, delay: float) -> None:
+        if delay > 0:
+            await asyncio.sleep(delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def fail(self) -> bool:
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+
+async def line_reply(request: web.Request) -> web.Response:
+    state = request.app['state']
+    payload = await request.json()
+    await state.pause(state.line_delay)
+    if state.fail():
+        return web.json_response({'message': 'stub error'}, status=500)
+    state.replies[payload['replyToken']] = time.time()
+    return web.json_response({})
+
+
+async def line_push(request: web.Request) -> web.Response:
+    state = request.app['state']
+    payload = await request.json()
+    await state.pause(state.line_delay)
+    state.pushes += 1
+    state.push_texts.extend(message.get('text') for message in payload['messages'])
+    return web.json_response({})
+
+
+async def openai_chat(request: web.Request) -> web.StreamResponse:
+    state = request.app['state']
+    payload = await request.json()
+    delay = state.model_delays.get(payload.get('model'), state.openai_delay)
+    prompt = payload['messages'][-1]['content']
+    content = f'Ответ на: {prompt[:200]}'
+    if payload.get('stream'):
+        return await openai_chat_stream(request, payload, content, delay)
+    await state.pause(delay)
+    state.openai_calls += 1
+    if state.fail():
+        return web.json_response({'error': {'message': 'stub error'}}, status=500)
+    return web.json_response({
+        'id': 'chatcmpl-stub',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': payload.get('model', 'stub'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop',
+        }],
+        'usage': {'prompt_tokens': len(prompt) // 3, 'completion_tokens': 10, 'total_tokens': len(prompt) // 3 + 10},
+    })
+
+
+async def openai_chat_stream(request: web.Request, payload: dict, content: str, delay: float) -> web.StreamResponse:
+    """Ответ server-sent events: первый фрагмент через 20% задержки, остальные равномерно."""
+    state = request.app['state']
+    state.openai_calls += 1
+    if state.fail():
+        await state.pause(delay)
+        return web.json_response({'error': {'message': 'stub error'}}, status=500)
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+    words = content.split(' ')
+    await state.pause(delay * 0.2)
+    for i, word in enumerate(words):
+        if i:
+            await state.pause(delay * 0.8 / len(words))
+        chunk = {
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': payload.get('model', 'stub'),
+            'choices': [{'index': 0, 'delta': {'content': word if i == 0 else f' {word}'}, 'finish_reason': None}],
+        }
+        await response.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+    await response.write(b'data: [DONE]\n\n')
+    await response.write_eof()
+    return response
+
+
+async def translate(request: web.Request) -> web.Response:
+    """LibreTranslate POST /translate: q — строка или список строк."""
+    state = request.app['state']
+    payload = await request.json()
+    await state.pause(state.translate_delay)
+    state.translate_calls += 1
+    if state.fail():
+        return web.json_response({'error': 'stub error'}, status=500)
+    target = payload.get('target', 'en')
+    source = payload.get('source', 'auto')
+    detected = {'language': 'ru' if source == 'auto' else source, 'confidence': 90.0}
+    query = payload.get('q', '')
+    if isinstance(query, list):
+        return web.json_response({
+            'translatedText': [f'[{target}] {text}' for text in query],
+            'detectedLanguage': [detected] * len(query),
+        })
+    return web.json_response({'translatedText': f'[{target}] {query}', 'detectedLanguage': detected})
+
+
+async def site_catalog(request: web.Request) -> web.Response:
+    """Страница каталога: за последней страницей — 404, повторный запрос с ETag — 304."""
+    state = request.app['state']
+    state.site_requests += 1
+    site = state.site
+    try:
+        page = int(request.query.get('page', '1'))
+    except ValueError:
+        raise web.HTTPBadRequest()
+    if not 1 <= page <= site.pages:
+        raise web.HTTPNotFound()
+    await state.pause(site.delay)
+    etag = f'"catalog-{page}-{site.products}"'
+    if request.headers.get('If-None-Match') == etag:
+        return web.Response(status=304, headers={'ETag': etag})
+    return web.Response(body=_catalog_html(page, site), content_type='text/html', charset='utf-8',
+                        headers={'ETag': etag})
+
+
+async def site_article(request: web.Request) -> web.Response:
+    """Статья с абзацами <p>; размер — ?kb=N или --article-kb."""
+    state = request.app['state']
+    state.site_requests += 1
+    try:
+        number = int(request.match_info['number'])
+        size_kb = int(request.query.get('kb', state.site.article_kb))
+    except ValueError:
+        raise web.HTTPBadRequest()
+    await state.pause(state.site.delay)
+    return web.Response(body=_article_html(number, size_kb), content_type='text/html', charset='utf-8')
+
+
+async def stats(request: web.Request) -> web.Response:
+    state = request.app['state']
+    return web.json_response({
+        'replies': state.replies,
+        'pushes': state.pushes,
+        'push_texts': state.push_texts,
+        'openai_calls': state.openai_calls,
+        'translate_calls': state.translate_calls,
+        'site_requests': state.site_requests,
+        'errors': state.errors,
+    })
+
+
+async def reset(request: web.Request) -> web.Response:
+    request.app['state'].reset()
+    return web.json_response({})
+
+
+def make_app(openai_delay: float = 0.5, line_delay: float = 0.02, jitter: float = 0.2,
+             error_rate: float = 0.0, model_delays: Optional[Dict[str, float]] = None,
+             translate_delay: float = 0.05, site: SiteOptions = SiteOptions()) -> web.Application:
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app['state'] = StubState(openai_delay, line_delay, jitter, error_rate, model_delays, translate_delay, site)
+    app.router.add_post('/v2/bot/message/reply', line_reply)
+    app.router.add_post('/v2/bot/message/push', line_push)
+    app.router.add_post('/v1/chat/completions', openai_chat)
+    app.router.add_post('/translate', translate)
+    app.router.add_get('/catalog', site_catalog)
+    app.router.add_get('/article/{number}', site_article)
+    app.router.add_get('/_stats', stats)
+    app.router.add_post('/_reset', reset)
+    return app
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='Заглушки LINE API, OpenAI, переводчика и сайта для бенчмарков.')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=9100)
+    arg_parser.add_argument('--openai-delay', type=float, default=0.5, help='Задержка ответа OpenAI, с')
+    arg_parser.add_argument('--line-delay', type=float, default=0.02, help='Задержка ответа LINE API, с')
+    arg_parser.add_argument('--jitter', type=float, default=0.2, help='Разброс задержек (доля)')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов с ошибкой 500')
+    arg_parser.add_argument('--model-delay', action='append', default=[], metavar='MODEL=SECONDS',
+                            help='Задержка ответа OpenAI для отдельной модели (можно повторять)')
+    arg_parser.add_argument('--translate-delay', type=float, default=0.05, help='Задержка ответа переводчика, с')
+    arg_parser.add_argument('--site-products', type=int, default=24, help='Продуктов на странице каталога')
+    arg_parser.add_argument('--site-pages', type=int, default=100, help='Страниц в каталоге')
+    arg_parser.add_argument('--site-specs', type=int, default=6, help='Строк характеристик в карточке')
+    arg_parser.add_argument('--article-kb', type=int, default=64, help='Размер статьи по умолчанию, КБ')
+    arg_parser.add_argument('--site-delay', type=float, default=0.0, help='Задержка ответа сайта, с')
+    args = arg_parser.parse_args()
+    model_delays = {}
+    for item in args.model_delay:
+        model, _, seconds = item.partition('=')
+        model_delays[model] = float(seconds)
+    web.run_app(
+        make_app(
+            args.openai_delay, args.line_delay, args.jitter, args.error_rate, model_delays, args.translate_delay,
+            SiteOptions(args.site_products, args.site_pages, args.site_specs, args.article_kb, args.site_delay)
+        ),
+        host=args.host, port=args.port, print=None, access_log=None
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Генератор подписанных тел вебхуков LINE для бенчмарков и нагрузочных тестов.
+"""
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+_counter = itertools.count()
+
+
+def text_event(text: str, user_id: str, reply_token: Optional[str] = None) -> Dict:
+    """
+    Событие текстового сообщения.
+
+    :param text: Текст сообщения.
+    :param user_id: Идентификатор пользователя.
+    :param reply_token: Reply-токен; по умолчанию уникальный.
+    """
+    number = next(_counter)
+    return {
+        'type': 'message',
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'webhookEventId': f'01BENCH{number:020d}',
+        'deliveryContext': {'isRedelivery': False},
+        'replyToken': reply_token or f'rt-{number:012d}',
+        'source': {'type': 'user', 'userId': user_id},
+        'message': {'id': str(10 ** 12 + number), 'type': 'text', 'text': text},
+    }
+
+
+def sign(body: bytes, channel_secret: str) -> str:
+    """Подпись X-Line-Signature для тела запроса."""
+    digest = hmac.new(channel_secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def webhook_body(events: List[Dict], destination: str = 'Ubench') -> bytes:
+    return json.dumps({'destination': destination, 'events': events}, ensure_ascii=False).encode('utf-8')
+
+
+def signed_payload(events: List[Dict], channel_secret: str) -> Tuple[bytes, Dict[str, str]]:
+    """
+    :return: Тело запроса и заголовки (Content-Type и X-Line-Signature).
+    """
+    body = webhook_body(events)
+    return body, {'Content-Type': 'application/json', 'X-Line-Signature': sign(body, channel_secret)}
+
+
+def text_payloads(
+    count: int,
+    channel_secret: str,
+    events_per_request: int = 1,
+    template: str = 'вопрос номер {n}',
+    users: int = 1000
+) -> List[Tuple[bytes, Dict[str, str], List[str]]]:
+    """
+    Набор подписанных запросов с уникальными текстами (чтобы не срабатывал кэш ответов).
+
+    :param count: Число запросов.
+    :param channel_secret: Секрет канала.
+    :param events_per_request: Событий в одном запросе.
+    :param template: Шаблон текста с {n}.
+    :param users: Число разных пользователей (для лимитов на пользователя).
+    :return: Список (тело, заголовки, reply-токены событий).
+    """
+    payloads = []
+    n = 0
+    for _ in range(count):
+        events = []
+        for _ in range(events_per_request):
+            events.append(text_event(template.format(n=n), f'U{n % users:032x}'))
+            n += 1
+        body, headers = signed_payload(events, channel_secret)
+        payloads.append((body, headers, [event['replyToken'] for event in events]))
+    return payloads
@@ -0,0 +1,201 @@
+"""
+Общие для app.py и app_async.py настройки, кэш ответов, лимиты и шаблоны команд.
+
+Импорт модуля не запускает потоков и не регистрирует обработчиков atexit: пулы событий
+и генераций создаёт app.py, а асинхронный сервер обходится без них.
+"""
+import os
+import logging
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+from cache import ResponseCache, SQLiteCache, canonical_url, normalize_text
+from llm_stream import ModelTiers
+from metrics import count_upstream_error, register_stats
+from rate_limit import RateLimiter, SQLiteBucketStore, per_minute
+from translation import create_engine
+from webhook import WebhookParser
+
+# Загрузка переменных окружения из файла .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Получение токенов и ключей API из переменных окружения
+LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
+LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+
+
+def check_credentials():
+    """Завершает процесс, если не заданы ключи LINE или OpenAI."""
+    if not (LINE_CHANNEL_ACCESS_TOKEN and LINE_CHANNEL_SECRET and OPENAI_API_KEY):
+        logger.error("Один или несколько ключей/токенов не заданы!")
+        exit(1)
+
+
+# Проверка подписи и разбор вебхука по исходным байтам тела (ключ HMAC подготовлен заранее)
+parser = WebhookParser(LINE_CHANNEL_SECRET or '')
+
+# Перевод: пакеты строк по целевому языку, кэш языков и переводов, пул клиентов
+# на цепочку бэкендов TRANSLATE_BACKENDS (API из TRANSLATE_API_BASE, googletrans, офлайн-модель).
+# Потоки движка запускаются при первом переводе
+translation_engine = create_engine()
+
+# EVENT_OVERLOAD_POLICY: 'busy' — ответить пользователю, что бот занят; 'shed' — молча сбросить.
+EVENT_OVERLOAD_POLICY = os.getenv('EVENT_OVERLOAD_POLICY', 'busy')
+BUSY_REPLY = "Бот сейчас перегружен, попробуйте чуть позже."
+
+# Модели OpenAI: если OPENAI_FAST_PROMPT_CHARS > 0, запросы не длиннее стольких символов
+# отвечает быстрая модель OPENAI_FAST_MODEL; по умолчанию (0) все запросы идут в OPENAI_MODEL.
+# Быстрая модель также отвечает, когда основная не успевает к OPENAI_REPLY_DEADLINE.
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', "gpt-4")
+OPENAI_FAST_MODEL = os.getenv('OPENAI_FAST_MODEL', "gpt-3.5-turbo")
+OPENAI_FAST_PROMPT_CHARS = int(os.getenv('OPENAI_FAST_PROMPT_CHARS', 0))
+OPENAI_TEMPERATURE = 0.7
+OPENAI_TIERS = ModelTiers(OPENAI_MODEL, OPENAI_FAST_MODEL, OPENAI_FAST_PROMPT_CHARS)
+
+# Потоковая генерация: через OPENAI_REPLY_DEADLINE секунд по reply-токену уходит уже готовая часть
+# ответа (или ответ быстрой модели), остальное досылается push-сообщением (OPENAI_PUSH_FOLLOWUP).
+# Reply-токен действует ограниченное время, поэтому срок вместе с OPENAI_FALLBACK_TIMEOUT
+# должен оставаться заметно меньше минуты.
+OPENAI_REPLY_DEADLINE = float(os.getenv('OPENAI_REPLY_DEADLINE', 20))
+OPENAI_FALLBACK_TIMEOUT = float(os.getenv('OPENAI_FALLBACK_TIMEOUT', 8))
+OPENAI_READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', 30))
+OPENAI_STREAM_TIMEOUT = float(os.getenv('OPENAI_STREAM_TIMEOUT', 120))
+OPENAI_PUSH_FOLLOWUP = os.getenv('OPENAI_PUSH_FOLLOWUP', '1').lower() not in ('0', 'false', 'no')
+PENDING_REPLY = "Ответ ещё готовится, пришлю его отдельным сообщением."
+OPENAI_ERROR_REPLY = "Извините, произошла ошибка при обработке вашего запроса."
+
+# Кэш ответов: время жизни по командам, LRU в памяти и (опционально) общий SQLite-файл
+CACHE_PATH = os.getenv('CACHE_PATH')  # например, /tmp/line_bot_cache.sqlite3
+response_cache = ResponseCache(
+    ttls={
+        'ask': float(os.getenv('CACHE_TTL_ASK', 300)),
+        'translate': float(os.getenv('CACHE_TTL_TRANSLATE', 86400)),
+        'parse': float(os.getenv('CACHE_TTL_PARSE', 600)),
+    },
+    max_entries=int(os.getenv('CACHE_MAX_ENTRIES', 1024)),
+    shared=SQLiteCache(CACHE_PATH) if CACHE_PATH else None,
+)
+
+# /parse: лимит загружаемых байт, длина текста в ответе, таймаут запроса и предел ожидания ответа;
+# загрузка страниц — самая тяжёлая команда, поэтому у неё свой лимит на пользователя
+PARSE_MAX_BYTES = int(os.getenv('PARSE_MAX_BYTES', 2 * 1024 * 1024))
+PARSE_REPLY_CHARS = 1000
+PARSE_TIMEOUT = 10
+PARSE_COMMAND_TIMEOUT = float(os.getenv('PARSE_COMMAND_TIMEOUT', 20))
+PARSE_RATE_PER_MIN = float(os.getenv('PARSE_RATE_PER_MIN', 5))
+
+# Лимиты: на пользователя и группу (в минуту) и общий бюджет OpenAI (запросы и токены в минуту).
+# RATE_LIMIT_PATH задаёт общий SQLite-файл, чтобы все воркеры соблюдали один бюджет.
+USER_RATE_PER_MIN = float(os.getenv('USER_RATE_PER_MIN', 10))
+GROUP_RATE_PER_MIN = float(os.getenv('GROUP_RATE_PER_MIN', 30))
+OPENAI_RPM = float(os.getenv('OPENAI_RPM', 200))
+OPENAI_TPM = float(os.getenv('OPENAI_TPM', 40000))
+OPENAI_MAX_TOKENS = 150
+RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH')
+RATE_LIMITED_REPLY = "Слишком много запросов, попробуйте через минуту."
+OPENAI_BUDGET_REPLY = "Лимит обращений к ассистенту исчерпан, попробуйте чуть позже."
+rate_limiter = RateLimiter(SQLiteBucketStore(RATE_LIMIT_PATH) if RATE_LIMIT_PATH else None)
+
+# Ведро лимита пользователя для обращений к OpenAI: обычный текст и /ask расходуют один лимит
+CHAT_BUCKET = 'chat'
+
+
+
+def ask_cache_key(prompt):
+    """Ключ кэша ответа OpenAI: модель, температура и вопрос без лишних пробелов."""
+    return OPENAI_TIERS.choose(prompt), OPENAI_TEMPERATURE, normalize_text(prompt)
+
+
+def parse_cache_key(match):
+    """Ключ кэша /parse: канонический URL (для некорректного URL — как есть)."""
+    url = match.group(1)
+    try:
+        return (canonical_url(url),)
+    except ValueError:
+        return (url,)
+
+
+# Текстовые команды: шаблон и метаданные (аргументы CommandRouter.command), которые
+# CommandRouter.run применяет сам: кэш ответов, схлопывание одинаковых вызовов, timeout.
+# Обработчики регистрируют app.py и app_async.py
+COMMANDS = {
+    # /translate <язык> <текст>
+    'translate': {
+        'pattern': r'^/translate\s+(\w{2})\s+(.+)',
+        'cache': 'translate',
+        'cache_key': lambda match: ('auto', match.group(1).lower(), normalize_text(match.group(2))),
+    },
+    # /parse <URL>
+    'parse': {
+        'pattern': r'^/parse\s+(.+)',
+        'rate_limit': PARSE_RATE_PER_MIN,
+        'cache': 'parse',
+        'cache_key': parse_cache_key,
+        'timeout': PARSE_COMMAND_TIMEOUT,
+    },
+    # /ask <вопрос>
+    'ask': {
+        'pattern': r'^/ask\s+(.+)',
+        'bucket': CHAT_BUCKET,
+        'cache': 'ask',
+        'cache_key': lambda match: ask_cache_key(match.group(1)),
+    },
+}
+# Текст без команды — вопрос ассистенту с общими с /ask кэшем и лимитом (аргументы CommandRouter.default)
+CHAT_COMMAND = {'bucket': CHAT_BUCKET, 'cache': 'ask', 'cache_key': ask_cache_key}
+
+# Метрики Prometheus общих объектов (/metrics обоих серверов)
+register_stats('linebot_cache_stats', 'Попадания и промахи кэша ответов', 'namespace', response_cache.stats)
+register_stats('linebot_translation_stats', 'Пакеты и кэш переводчика', 'engine',
+               lambda: {'translate': translation_engine.stats()})
+register_stats('linebot_rate_limit_stats', 'Решения ограничителя частоты', 'limiter',
+               lambda: {'requests': rate_limiter.stats()})
+
+
+def push_target(source):
+    """Адресат push-сообщения: группа, комната или пользователь."""
+    return getattr(source, 'group_id', None) or getattr(source, 'room_id', None) or getattr(source, 'user_id', None)
+
+
+def allow_message(source, command):
+    """Проверяет лимиты пользователя (по ведру команды, для текста без команды — CHAT_BUCKET) и группы/комнаты."""
+    bucket = (command.bucket or command.name) if command else CHAT_BUCKET
+    rate = command.rate_limit if command and command.rate_limit else USER_RATE_PER_MIN
+    limits = []
+    user_id = getattr(source, 'user_id', None)
+    if user_id:
+        limits.append(per_minute(f'user:{user_id}:{bucket}', rate))
+    chat_id = getattr(source, 'group_id', None) or getattr(source, 'room_id', None)
+    if chat_id:
+        limits.append(per_minute(f'group:{chat_id}', GROUP_RATE_PER_MIN))
+    return rate_limiter.allow(*limits) if limits else True
+
+
+def estimate_openai_tokens(prompt):
+    """Грубая оценка расхода токенов запроса: промпт (~3 символа на токен) плюс max_tokens."""
+    return len(prompt) // 3 + OPENAI_MAX_TOKENS
+
+
+def is_valid_url(url):
+    """Базовая проверка валидности URL."""
+    parsed = urlparse(url)
+    return all([parsed.scheme in ('http', 'https'), parsed.netloc])
+
+
+def chat_messages(prompt):
+    return [
+        {"role": "system", "content": "Ты помогающий ассистент."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def finish_completion(stream):
+    """Учитывает ошибку генерации (полный ответ кэширует CommandRouter)."""
+    if stream.error is None:
+        return
+    count_upstream_error('openai', stream.error)
+    logger.error(f"Ошибка при обращении к OpenAI: {stream.error}")
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def make_key(namespace: str, *parts: Any) -> str:
+    """
+    Строит нормализованный ключ кэша.
+
+    :param namespace: Пространство имён (например, 'ask', 'translate', 'parse').
+    :param parts: Значимые части запроса (модель, температура, текст и т.д.).
+    :return: Ключ вида '<namespace>:<sha256>'.
+    """
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    digest = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    return f'{namespace}:{digest}'
+
+
+def normalize_text(text: str) -> str:
+    """Схлопывает пробелы, чтобы 'a  b' и 'a b' давали один ключ."""
+    return ' '.join(text.split())
+
+
+def canonical_url(url: str) -> str:
+    """
+    Приводит URL к каноническому виду: схема и хост в нижнем регистре,
+    без порта по умолчанию и фрагмента, с отсортированными параметрами запроса.
+
+    :param url: Исходный URL.
+    :return: Канонический URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+class MemoryCache:
+    """Потокобезопасный LRU-кэш в памяти с временем жизни записей."""
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        """
+        :param max_entries: Максимальное число записей; при превышении вытесняются самые старые.
+        """
+        self.max_entries = max_entries
+        self._data: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        :return: Кортеж (найдено, значение).
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """
+    Общий кэш на диске (SQLite), доступный нескольким процессам (например, воркерам gunicorn).
+    Значения хранятся в JSON.
+    """
+
+    # Как часто (в записях) удалять просроченные строки
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Путь к файлу базы данных.
+        """
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Tuple[bool, Any, float]:
+        """
+        :return: Кортеж (найдено, значение, оставшееся время жизни в секундах).
+        """
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT value, expires_at FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return False, None, 0.0
+        value, expires_at = row
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return False, None, 0.0
+        return True, json.loads(value), remaining
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+            conn.commit()
+
+
+class ResponseCache:
+    """
+    Двухуровневый кэш ответов: LRU в памяти процесса и (опционально) общий SQLite-бэкенд.
+    Время жизни задаётся отдельно для каждого пространства имён.
+    """
+
+    def __init__(
+        self,
+        ttls: Dict[str, float],
+        max_entries: int = 1024,
+        shared: Optional[SQLiteCache] = None,
+        default_ttl: float = 300.0
+    ) -> None:
+        """
+        :param ttls: Время жизни записей по пространствам имён, например {'ask': 300}.
+        :param max_entries: Ограничение LRU-кэша в памяти.
+        :param shared: Необязательный общий бэкенд.
+        :param default_ttl: Время жизни для пространств имён, отсутствующих в ttls.
+        """
+        self.ttls = dict(ttls)
+        self.default_ttl = default_ttl
+        self.memory = MemoryCache(max_entries)
+        self.shared = shared
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace: str, field: str) -> None:
+        with self._lock:
+            counters = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counters[field] += 1
+
+    def ttl_for(self, namespace: str) -> float:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def get(self, namespace: str, *parts: Any) -> Tuple[bool, Any]:
+        """
+        Ищет значение сначала в памяти, затем в общем бэкенде.
+
+        :return: Кортеж (найдено, значение).
+        """
+        key = make_key(namespace, *parts)
+        found, value = self.memory.get(key)
+        if not found and self.shared is not None:
+            try:
+                found, value, remaining = self.shared.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Ошибка чтения общего кэша: {e}")
+                found = False
+            if found:
+                self.memory.set(key, value, remaining)
+        self._count(namespace, 'hits' if found else 'misses')
+        return found, value
+
+    def set(self, namespace: str, value: Any, *parts: Any) -> None:
+        """Сохраняет значение в обоих уровнях кэша."""
+        ttl = self.ttl_for(namespace)
+        if ttl <= 0:
+            return
+        key = make_key(namespace, *parts)
+        self.memory.set(key, value, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"Ошибка записи в общий кэш: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        :return: Счётчики попаданий и промахов по пространствам имён.
+        """
+        with self._lock:
+            return {ns: dict(counters) for ns, counters in self._stats.items()}
@@ -0,0 +1,292 @@
+import asyncio
+import re
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Pattern, Tuple
+
+from cache import make_key
+from singleflight import AsyncSingleFlight, SingleFlight
+
+# Имя команды для текста без '/' (обработчик по умолчанию)
+DEFAULT_COMMAND = 'chat'
+TIMEOUT_REPLY = "Команда выполняется слишком долго, попробуйте позже."
+
+
+class CommandError(Exception):
+    """Команда не выполнена; reply — ответ пользователю. Такие ответы не кэшируются."""
+
+    def __init__(self, reply: str) -> None:
+        super().__init__(reply)
+        self.reply = reply
+
+
+class Command(NamedTuple):
+    """Описание команды бота и её метаданные."""
+    name: str
+    # Шаблон аргументов (None у обработчика по умолчанию)
+    pattern: Optional[Pattern]
+    handler: Callable[[Any], Any]
+    # Допустимое число вызовов на пользователя в минуту (None — без отдельного лимита)
+    rate_limit: Optional[float] = None
+    # Ведро лимита пользователя (None — своё ведро по имени команды); команды с одним ведром делят лимит
+    bucket: Optional[str] = None
+    # Пространство имён кэша ответов (None — ответ не кэшируется)
+    cache: Optional[str] = None
+    # Части ключа кэша по аргументу обработчика (Match или текст сообщения)
+    cache_key: Optional[Callable[[Any], Tuple]] = None
+    # Сколько ждать ответ, секунды (None — без предела); сам обработчик не прерывается
+    timeout: Optional[float] = None
+
+
+class CommandRouter:
+    """
+    Реестр команд вида '/word ...' с заранее скомпилированными шаблонами.
+
+    Команда выбирается по первому слову за O(1) (поиск в словаре), после чего
+    проверяется только её шаблон. Текст без '/' сразу уходит в обработчик по умолчанию.
+
+    Метаданные команды применяет run(): ответ берётся из кэша (cache, cache_key), одинаковые
+    одновременные вызовы схлопываются, ожидание ограничено timeout. Кэшируются строки и
+    итоговый текст отложенных ответов (объектов с методом when_final(callback)).
+    """
+
+    def __init__(self, cache=None, pool=None, timeout_reply: str = TIMEOUT_REPLY) -> None:
+        """
+        :param cache: Кэш ответов (cache.ResponseCache); без него метаданные cache не применяются.
+        :param pool: Пул потоков (worker_pool.BoundedWorkerPool) для команд с timeout;
+                     без него timeout не применяется.
+        :param timeout_reply: Ответ, если команда не уложилась в timeout.
+        """
+        self.commands: Dict[str, Command] = {}
+        self.default_command: Optional[Command] = None
+        self.cache = cache
+        self.pool = pool
+        self.timeout_reply = timeout_reply
+        self._flights: Dict[str, Any] = {}
+
+    def _new_flight(self):
+        return SingleFlight()
+
+    def _register(self, command: Command) -> Command:
+        if command.cache is not None:
+            if command.cache_key is None:
+                raise ValueError(f'Command {command.name} has cache but no cache_key')
+            self._flights.setdefault(command.cache, self._new_flight())
+        return command
+
+    def command(
+        self,
+        name: str,
+        pattern: str,
+        flags: int = re.IGNORECASE,
+        rate_limit: Optional[float] = None,
+        bucket: Optional[str] = None,
+        cache: Optional[str] = None,
+        cache_key: Optional[Callable[[Any], Tuple]] = None,
+        timeout: Optional[float] = None
+    ) -> Callable:
+        """
+        Декоратор регистрации команды.
+
+        :param name: Имя команды без '/' (например, 'translate').
+        :param pattern: Регулярное выражение для разбора аргументов.
+        :param flags: Флаги компиляции шаблона.
+        :param rate_limit: Лимит вызовов на пользователя в минуту.
+        :param bucket: Общее с другими командами ведро лимита пользователя.
+        :param cache: Пространство имён кэша ответов.
+        :param cache_key: Функция match -> части ключа кэша (обязательна вместе с cache).
+        :param timeout: Предел ожидания ответа, секунды.
+        :return: Декоратор, принимающий handler(match) -> str.
+        """
+        def decorator(func: Callable[[Any], Any]) -> Callable[[Any], Any]:
+            key = name.lower()
+            if key in self.commands:
+                raise ValueError(f'Command /{key} is already registered')
+            self.commands[key] = self._register(Command(
+                key, re.compile(pattern, flags), func, rate_limit=rate_limit, bucket=bucket,
+                cache=cache, cache_key=cache_key, timeout=timeout
+            ))
+            return func
+        return decorator
+
+    def default(self, func: Optional[Callable[[str], Any]] = None, **metadata: Any) -> Callable:
+        """
+        Декоратор обработчика текста, не являющегося командой: @router.default
+        или @router.default(cache=..., cache_key=...) с метаданными как у command().
+        """
+        def decorator(func: Callable[[str], Any]) -> Callable[[str], Any]:
+            self.default_command = self._register(Command(DEFAULT_COMMAND, None, func, **metadata))
+            return func
+        return decorator(func) if func is not None else decorator
+
+    def resolve(self, text: str) -> Tuple[Optional[Command], Any]:
+        """
+        Находит команду для сообщения.
+
+        :param text: Текст сообщения (уже без пробелов по краям).
+        :return: (команда, объект Match) или (None, None), если это не команда
+                 либо аргументы не соответствуют шаблону.
+        """
+        if not text.startswith('/'):
+            return None, None
+        word = text[1:].split(None, 1)[0].lower() if len(text) > 1 else ''
+        command = self.commands.get(word)
+        if command is None:
+            return None, None
+        match = command.pattern.match(text)
+        if match is None:
+            return None, None
+        return command, match
+
+    def dispatch(self, text: str) -> Any:
+        """
+        Выполняет обработчик команды или обработчик по умолчанию.
+
+        :param text: Текст сообщения.
+        :return: Текст ответа.
+        :raises LookupError: Если команда не найдена и обработчик по умолчанию не задан.
+        """
+        command, match = self.resolve(text)
+        return self.run(command, match, text)
+
+    def _target(self, command: Optional[Command], match: Any, text: str) -> Tuple[Command, Any]:
+        if command is not None:
+            return command, match
+        if self.default_command is None:
+            raise LookupError('No default handler registered')
+        return self.default_command, text
+
+    def run(self, command: Optional[Command], match: Any, text: str) -> Any:
+        """
+        Выполняет уже найденную через resolve() команду с учётом её метаданных.
+
+        :param command: Команда или None для обработчика по умолчанию.
+        :param match: Результат сопоставления шаблона.
+        :param text: Исходный текст сообщения.
+        :return: Ответ обработчика, из кэша, CommandError.reply или timeout_reply.
+        :raises LookupError: Если команда не найдена и обработчик по умолчанию не задан.
+        """
+        command, arg = self._target(command, match, text)
+        try:
+            if command.cache is None or self.cache is None:
+                return self._wait(command, command.handler, arg)
+            parts = command.cache_key(arg)
+            found, cached = self.cache.get(command.cache, *parts)
+            if found:
+                return cached
+            return self._wait(
+                command, self._flights[command.cache].do,
+                make_key(command.cache, *parts), self._fill, command, arg, parts
+            )
+        except CommandError as e:
+            return e.reply
+
+    def _wait(self, command: Command, func: Callable[..., Any], *args: Any) -> Any:
+        """func(*args) в пуле с ожиданием не дольше command.timeout; без timeout — в текущем потоке."""
+        if command.timeout is None or self.pool is None:
+            return func(*args)
+        future: Future = Future()
+
+        def work() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        if not self.pool.submit(work):
+            # Пул заполнен: выполняем в текущем потоке, без предела ожидания
+            return func(*args)
+        try:
+            return future.result(command.timeout)
+        except FutureTimeout:
+            # Ещё не начатая задача снимается; начатая доработает и сохранит ответ в кэш
+            future.cancel()
+            return self.timeout_reply
+
+    def _fill(self, command: Command, arg: Any, parts: Tuple) -> Any:
+        result = command.handler(arg)
+        if isinstance(result, str):
+            self.cache.set(command.cache, result, *parts)
+        elif hasattr(result, 'when_final'):
+            result.when_final(lambda text: self.cache.set(command.cache, text, *parts))
+        return result
+
+    def flight_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        :return: Счётчики схлопывания одинаковых вызовов по пространствам имён кэша.
+        """
+        return {namespace: flight.stats() for namespace, flight in self._flights.items()}
+
+
+class AsyncCommandRouter(CommandRouter):
+    """
+    Вариант CommandRouter для asyncio: обработчики — корутинные функции, run() — корутина,
+    timeout применяется через asyncio.wait_for. Обращения к кэшу идут через blocking,
+    чтобы общий SQLite-файл не блокировал цикл событий.
+    """
+
+    def __init__(
+        self,
+        cache=None,
+        timeout_reply: str = TIMEOUT_REPLY,
+        blocking: Optional[Callable[..., Awaitable[Any]]] = None
+    ) -> None:
+        """
+        :param cache: Кэш ответов (cache.ResponseCache).
+        :param timeout_reply: Ответ, если команда не уложилась в timeout.
+        :param blocking: Корутинная функция blocking(func, *args) для синхронных вызовов кэша
+                         (например, через asyncio.to_thread); по умолчанию вызов в цикле событий.
+        """
+        super().__init__(cache, timeout_reply=timeout_reply)
+        self.blocking = blocking
+        self._pending = set()
+
+    def _new_flight(self):
+        return AsyncSingleFlight()
+
+    async def _blocking(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.blocking is None:
+            return func(*args)
+        return await self.blocking(func, *args)
+
+    async def run(self, command: Optional[Command], match: Any, text: str) -> Any:
+        """Асинхронный вариант CommandRouter.run."""
+        command, arg = self._target(command, match, text)
+        try:
+            if command.cache is None or self.cache is None:
+                return await self._wait(command, command.handler(arg))
+            parts = command.cache_key(arg)
+            found, cached = await self._blocking(self.cache.get, command.cache, *parts)
+            if found:
+                return cached
+            return await self._wait(command, self._flights[command.cache].do(
+                make_key(command.cache, *parts), self._fill, command, arg, parts
+            ))
+        except CommandError as e:
+            return e.reply
+
+    async def _wait(self, command: Command, awaitable: Awaitable[Any]) -> Any:
+        if command.timeout is None:
+            return await awaitable
+        task = asyncio.ensure_future(awaitable)
+        try:
+            # shield: после истечения срока вызов доработает и сохранит ответ в кэш
+            return await asyncio.wait_for(asyncio.shield(task), command.timeout)
+        except asyncio.TimeoutError:
+            # Исключение (например, CommandError) доработавшего вызова уже никому не нужно
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return self.timeout_reply
+
+    async def _fill(self, command: Command, arg: Any, parts: Tuple) -> Any:
+        result = await command.handler(arg)
+        if isinstance(result, str):
+            await self._blocking(self.cache.set, command.cache, result, *parts)
+        elif hasattr(result, 'when_final'):
+            result.when_final(lambda text: self._spawn(self._blocking(self.cache.set, command.cache, text, *parts)))
+        return result
+
+    def _spawn(self, coro: Awaitable[Any]) -> None:
+        task = asyncio.ensure_future(coro)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _NotModified:
+    """Страница не изменилась с прошлого обхода (304 или совпал хеш содержимого)."""
+
+    def __repr__(self) -> str:
+        return 'NOT_MODIFIED'
+
+
+# Возвращается функциями загрузки вместо HTML, если страницу не нужно разбирать повторно
+NOT_MODIFIED = _NotModified()
+
+
+class PageRecord(NamedTuple):
+    url: str
+    status: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+    products: int
+    crawled_at: Optional[float]
+
+
+class CrawlRun(NamedTuple):
+    id: int
+    started_at: float
+
+
+def content_hash(body) -> str:
+    """
+    Хеш содержимого страницы.
+
+    :param body: Текст или байты страницы.
+    :return: Шестнадцатеричный SHA-256.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+
+class CrawlState:
+    """
+    Состояние обхода в SQLite: статус каждого URL, валидаторы кэша (ETag, Last-Modified),
+    хеш содержимого и извлечённые продукты. Позволяет отправлять условные запросы,
+    не разбирать неизменившиеся страницы (их продукты берутся из состояния)
+    и продолжать прерванный обход.
+    """
+
+    STATUS_DONE = 'done'
+    STATUS_FETCHED = 'fetched'
+    STATUS_FAILED = 'failed'
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Путь к файлу базы данных.
+        """
+        self.path = path
+        self._local = threading.local()
+        self.run: Optional[CrawlRun] = None
+        conn = self._connection()
+        conn.executescript(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            ' url TEXT PRIMARY KEY, status TEXT NOT NULL, etag TEXT, last_modified TEXT,'
+            ' content_hash TEXT, products INTEGER NOT NULL DEFAULT 0, crawled_at REAL, rows TEXT);'
+            'CREATE TABLE IF NOT EXISTS runs ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT, started_at REAL NOT NULL, finished_at REAL);'
+        )
+        # Файлы состояния прежних версий: продукты страниц не сохранялись
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(pages)')}
+        if 'rows' not in columns:
+            conn.execute('ALTER TABLE pages ADD COLUMN rows TEXT')
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # --- запуски обхода ---
+
+    def start_run(self, resume: bool = False) -> CrawlRun:
+        """
+        Начинает обход или продолжает последний незавершённый.
+
+        :param resume: Продолжить незавершённый обход, если он есть.
+        :return: Текущий запуск.
+        """
+        conn = self._connection()
+        row = None
+        if resume:
+            row = conn.execute(
+                'SELECT id, started_at FROM runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1'
+            ).fetchone()
+        if row is None:
+            started_at = time.time()
+            cursor = conn.execute('INSERT INTO runs (started_at) VALUES (?)', (started_at,))
+            conn.commit()
+            row = (cursor.lastrowid, started_at)
+        else:
+            logger.info(f"Продолжение обхода #{row[0]}")
+        self.run = CrawlRun(*row)
+        return self.run
+
+    def finish_run(self) -> None:
+        """Отмечает текущий обход завершённым."""
+        if self.run is None:
+            return
+        conn = self._connection()
+        conn.execute('UPDATE runs SET finished_at = ? WHERE id = ?', (time.time(), self.run.id))
+        conn.commit()
+
+    def pending(self, urls: Iterable[str]) -> List[str]:
+        """
+        Отбрасывает URL, уже обработанные в текущем запуске.
+
+        :param urls: Все URL обхода.
+        :return: URL, которые ещё нужно загрузить.
+        """
+        urls = list(urls)
+        if self.run is None:
+            return urls
+        done = {
+            row[0] for row in self._connection().execute(
+                'SELECT url FROM pages WHERE status = ? AND crawled_at >= ?',
+                (self.STATUS_DONE, self.run.started_at)
+            )
+        }
+        if done:
+            logger.info(f"Пропуск уже обработанных страниц: {len(done)}")
+        return [url for url in urls if url not in done]
+
+    # --- страницы ---
+
+    def get(self, url: str) -> Optional[PageRecord]:
+        row = self._connection().execute(
+            'SELECT url, status, etag, last_modified, content_hash, products, crawled_at '
+            'FROM pages WHERE url = ?', (url,)
+        ).fetchone()
+        return PageRecord(*row) if row else None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """
+        Заголовки условного запроса по сохранённым валидаторам.
+
+        :param url: URL страницы.
+        :return: If-None-Match и/или If-Modified-Since (пустой словарь, если страница новая).
+        """
+        record = self.get(url)
+        headers = {}
+        if record is None or record.status != self.STATUS_DONE:
+            return headers
+        if record.etag:
+            headers['If-None-Match'] = record.etag
+        if record.last_modified:
+            headers['If-Modified-Since'] = record.last_modified
+        return headers
+
+    def record_response(self, url: str, etag: Optional[str], last_modified: Optional[str], body_hash: str) -> bool:
+        """
+        Сохраняет валидаторы полученной страницы.
+
+        :return: True, если содержимое изменилось (или страница новая), False — если хеш совпал.
+        """
+        record = self.get(url)
+        if record is not None and record.status == self.STATUS_DONE and record.content_hash == body_hash:
+            self._update(url, etag=etag, last_modified=last_modified)
+            return False
+        conn = self._connection()
+        conn.execute(
+            'INSERT INTO pages (url, status, etag, last_modified, content_hash) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(url) DO UPDATE SET status = excluded.status, etag = excluded.etag, '
+            'last_modified = excluded.last_modified, content_hash = excluded.content_hash',
+            (url, self.STATUS_FETCHED, etag, last_modified, body_hash)
+        )
+        conn.commit()
+        return True
+
+    def mark_done(self, url: str, products: List[Dict[str, Any]]) -> None:
+        """
+        Страница разобрана, продукты записаны. Продукты сохраняются, чтобы при следующем
+        обходе выдать их для неизменившейся страницы без повторного разбора.
+
+        :param url: URL страницы.
+        :param products: Продукты страницы (в формате parse_page).
+        """
+        self._update(
+            url, status=self.STATUS_DONE, products=len(products), crawled_at=time.time(),
+            rows=json.dumps(products, ensure_ascii=False)
+        )
+
+    def page_products(self, url: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        :return: Продукты, сохранённые при последнем разборе страницы, или None,
+                 если их нет (страница не разбиралась или состояние прежней версии).
+        """
+        row = self._connection().execute('SELECT rows FROM pages WHERE url = ?', (url,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def mark_unchanged(self, url: str) -> None:
+        """Страница не изменилась с прошлого обхода, её продукты записаны."""
+        self._update(url, status=self.STATUS_DONE, crawled_at=time.time())
+
+    def mark_failed(self, url: str) -> None:
+        """Страницу не удалось загрузить; при следующем запуске она будет загружена снова."""
+        conn = self._connection()
+        conn.execute(
+            'INSERT INTO pages (url, status) VALUES (?, ?) '
+            'ON CONFLICT(url) DO UPDATE SET status = excluded.status',
+            (url, self.STATUS_FAILED)
+        )
+        conn.commit()
+
+    def _update(self, url: str, **fields) -> None:
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        conn = self._connection()
+        conn.execute(f'UPDATE pages SET {assignments} WHERE url = ?', (*fields.values(), url))
+        conn.commit()
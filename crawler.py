@@ -0,0 +1,230 @@
+import logging
+import multiprocessing
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from crawl_state import NOT_MODIFIED
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Экспоненциальная задержка с полным джиттером: случайное значение из [0, min(cap, base * 2^attempt)].
+
+    :param attempt: Номер повторной попытки, начиная с 0.
+    :param base: Базовая задержка в секундах.
+    :param cap: Максимальная задержка в секундах.
+    :return: Время ожидания в секундах.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class _HostState:
+    __slots__ = ('semaphore', 'next_slot', 'lock')
+
+    def __init__(self, concurrency: int) -> None:
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+
+class HostThrottle:
+    """
+    Вежливость по отношению к хостам: не более rate запросов в секунду
+    и не более concurrency одновременных запросов к одному хосту.
+    """
+
+    def __init__(self, rate: float = 2.0, concurrency: int = 2, jitter: float = 0.2) -> None:
+        """
+        :param rate: Запросов в секунду к одному хосту.
+        :param concurrency: Одновременных запросов к одному хосту.
+        :param jitter: Случайное отклонение интервала между запросами (доля интервала).
+        """
+        if rate <= 0:
+            raise ValueError('rate must be > 0')
+        if concurrency < 1:
+            raise ValueError('concurrency must be >= 1')
+        self.rate = rate
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self._hosts: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, host: str) -> _HostState:
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.concurrency)
+            return state
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """
+        Контекст, внутри которого разрешено выполнить один запрос к хосту url.
+        Блокирует поток до освобождения слота.
+        """
+        state = self._state(urlsplit(url).netloc.lower())
+        state.semaphore.acquire()
+        try:
+            interval = random.uniform(1 - self.jitter, 1 + self.jitter) / self.rate
+            with state.lock:
+                now = time.monotonic()
+                start = max(now, state.next_slot)
+                state.next_slot = start + interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+        finally:
+            state.semaphore.release()
+
+    def penalize(self, url: str, delay: float) -> None:
+        """
+        Откладывает следующие запросы к хосту (например, после 429 или Retry-After).
+
+        :param url: URL, к хосту которого применяется задержка.
+        :param delay: Пауза в секундах.
+        """
+        state = self._state(urlsplit(url).netloc.lower())
+        with state.lock:
+            state.next_slot = max(state.next_slot, time.monotonic() + delay)
+
+
+class SharedHostThrottle:
+    """
+    HostThrottle, общий для нескольких процессов: пределы rate и concurrency действуют на хост
+    для всего обхода, а не для каждого процесса. Хосты распределяются по slots ячейкам
+    (семафор и время следующего запроса в общей памяти); хосты с одной ячейкой делят её предел,
+    так что пределы могут только ужесточиться, но не превыситься.
+
+    Передаётся рабочим процессам при их запуске (например, через initargs пула процессов).
+    """
+
+    def __init__(
+        self,
+        rate: float = 2.0,
+        concurrency: int = 2,
+        jitter: float = 0.2,
+        slots: int = 128,
+        context=None
+    ) -> None:
+        """
+        :param rate: Запросов в секунду к одному хосту.
+        :param concurrency: Одновременных запросов к одному хосту.
+        :param jitter: Случайное отклонение интервала между запросами (доля интервала).
+        :param slots: Число ячеек для хостов.
+        :param context: Контекст multiprocessing (по умолчанию текущий).
+        """
+        if rate <= 0:
+            raise ValueError('rate must be > 0')
+        if concurrency < 1:
+            raise ValueError('concurrency must be >= 1')
+        context = context or multiprocessing.get_context()
+        self.rate = rate
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self._semaphores = [context.BoundedSemaphore(concurrency) for _ in range(slots)]
+        # time.monotonic() общий для процессов одной машины
+        self._next_slots = context.Array('d', slots)
+
+    def _slot_index(self, url: str) -> int:
+        # hash() строк различается между процессами, crc32 — нет
+        return zlib.crc32(urlsplit(url).netloc.lower().encode('utf-8')) % len(self._semaphores)
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """
+        Контекст, внутри которого разрешено выполнить один запрос к хосту url.
+        Блокирует поток до освобождения слота.
+        """
+        index = self._slot_index(url)
+        semaphore = self._semaphores[index]
+        semaphore.acquire()
+        try:
+            interval = random.uniform(1 - self.jitter, 1 + self.jitter) / self.rate
+            with self._next_slots.get_lock():
+                now = time.monotonic()
+                start = max(now, self._next_slots[index])
+                self._next_slots[index] = start + interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+        finally:
+            semaphore.release()
+
+    def penalize(self, url: str, delay: float) -> None:
+        """
+        Откладывает следующие запросы к хосту во всех процессах.
+
+        :param url: URL, к хосту которого применяется задержка.
+        :param delay: Пауза в секундах.
+        """
+        index = self._slot_index(url)
+        with self._next_slots.get_lock():
+            self._next_slots[index] = max(self._next_slots[index], time.monotonic() + delay)
+
+
+class CrawlEngine:
+    """
+    Многопоточный обход списка URL: загрузка и разбор страниц выполняются
+    в пуле потоков, результаты отдаются по мере готовности.
+    Число задач в работе ограничено, поэтому список URL может быть сколь угодно длинным.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Optional[str]],
+        parse: Callable[[str], List[Dict[str, Any]]],
+        workers: int = 4
+    ) -> None:
+        """
+        :param fetch: Функция загрузки страницы: url -> HTML, None или NOT_MODIFIED.
+        :param parse: Функция разбора страницы: HTML -> список продуктов.
+        :param workers: Количество рабочих потоков.
+        """
+        self.fetch = fetch
+        self.parse = parse
+        self.workers = workers
+
+    def _process(self, url: str) -> Optional[List[Dict[str, Any]]]:
+        html = self.fetch(url)
+        if html is None or html is NOT_MODIFIED:
+            return html
+        return self.parse(html)
+
+    def run(self, urls: Iterable[str]) -> Iterator[Tuple[str, Optional[List[Dict[str, Any]]]]]:
+        """
+        Обходит страницы.
+
+        :param urls: URL страниц.
+        :return: Итератор пар (url, продукты); продукты равны None, если страницу загрузить не удалось,
+                 и NOT_MODIFIED, если она не изменилась с прошлого обхода.
+        """
+        url_iter = iter(urls)
+        max_in_flight = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='crawl') as executor:
+            pending = {}
+            for url in url_iter:
+                pending[executor.submit(self._process, url)] = url
+                if len(pending) >= max_in_flight:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Ошибка при обработке {url}: {e}")
+                        result = None
+                    yield url, result
+                for url in url_iter:
+                    pending[executor.submit(self._process, url)] = url
+                    if len(pending) >= max_in_flight:
+                        break
@@ -0,0 +1,228 @@
+"""
+Пакетное шифрование сообщений AES (pycryptodome).
+
+Необязательная зависимость: cryptography (pip install cryptography) ускоряет режим GCM.
+Она импортируется только при создании движка в режиме GCM, процессы с CBC её не загружают.
+"""
+import base64
+import binascii
+import os
+import threading
+from typing import List, Sequence
+
+from Crypto.Cipher import AES
+
+BLOCK_SIZE = AES.block_size
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+
+MODE_CBC = 'cbc'
+MODE_GCM = 'gcm'
+
+
+class DecryptionError(ValueError):
+    """Шифротекст повреждён, подделан или зашифрован другим ключом."""
+
+
+def _load_aesgcm():
+    """
+    AESGCM из cryptography хранит ключ между вызовами, поэтому GCM заметно быстрее;
+    без него каждое сообщение шифруется новым объектом pycryptodome.
+
+    :return: (AESGCM, InvalidTag) или (None, None), если cryptography не установлена.
+    """
+    try:
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    except ImportError:  # pragma: no cover - cryptography необязательна
+        return None, None
+    return AESGCM, InvalidTag
+
+
+def _pad(data: bytes) -> bytes:
+    n = BLOCK_SIZE - len(data) % BLOCK_SIZE
+    return data + bytes((n,)) * n
+
+
+def _unpad(data: bytes) -> bytes:
+    if not data or len(data) % BLOCK_SIZE:
+        raise DecryptionError('Invalid padded data length')
+    n = data[-1]
+    if not 1 <= n <= BLOCK_SIZE or data[-n:] != bytes((n,)) * n:
+        raise DecryptionError('Invalid padding')
+    return data[:-n]
+
+
+class EncryptionEngine:
+    """
+    Шифрование текстовых сообщений AES с переиспользованием расписания ключей.
+
+    Режим CBC (по умолчанию, совместим с форматом encrypt_text: base64(IV + шифротекст)).
+    Каждый поток держит по объекту AES в режиме CBC для шифрования и расшифровки, созданному
+    один раз, и пропускает через него все сообщения одной непрерывной цепочкой. Перед каждым
+    сообщением шифруется случайный блок: его шифротекст непредсказуем и служит IV сообщения,
+    поэтому каждое сообщение расшифровывается обычным CBC независимо от остальных,
+    а пакет шифруется и расшифровывается одним вызовом AES.
+
+    Режим GCM даёт аутентифицированное шифрование: base64(nonce + шифротекст + тег).
+    """
+
+    def __init__(self, key: bytes, mode: str = MODE_CBC) -> None:
+        """
+        :param key: Ключ длиной 16, 24 или 32 байта.
+        :param mode: 'cbc' или 'gcm'.
+        :raises ValueError: При неверной длине ключа или неизвестном режиме.
+        """
+        if len(key) not in (16, 24, 32):
+            raise ValueError('Key must be 16, 24, or 32 bytes long.')
+        if mode not in (MODE_CBC, MODE_GCM):
+            raise ValueError(f'Unsupported mode: {mode}')
+        self.mode = mode
+        self._key = bytes(key)
+        self._aesgcm = None
+        self._invalid_tag = None
+        if mode == MODE_GCM:
+            aesgcm, self._invalid_tag = _load_aesgcm()
+            if aesgcm is not None:
+                self._aesgcm = aesgcm(self._key)
+        self._local = threading.local()
+
+    # --- одиночные сообщения ---
+
+    def encrypt_text(self, plain_text: str) -> str:
+        """
+        Шифрует строку.
+
+        :param plain_text: Открытый текст.
+        :return: Base64-строка с шифротекстом.
+        """
+        data = plain_text.encode('utf-8')
+        if self.mode == MODE_GCM:
+            return self._encrypt_gcm(data, os.urandom(GCM_NONCE_SIZE))
+        return base64.b64encode(self._cbc_encryptor().encrypt(os.urandom(BLOCK_SIZE) + _pad(data))).decode('ascii')
+
+    def decrypt_text(self, token: str) -> str:
+        """
+        Расшифровывает строку, полученную от encrypt_text.
+
+        :param token: Base64-строка с шифротекстом.
+        :return: Открытый текст.
+        :raises DecryptionError: Если данные повреждены или не прошли проверку подлинности.
+        """
+        return self.decrypt_many([token])[0]
+
+    # --- пакетная обработка ---
+
+    def encrypt_many(self, plain_texts: Sequence[str]) -> List[str]:
+        """
+        Шифрует список строк.
+
+        :param plain_texts: Открытые тексты.
+        :return: Список base64-строк в том же порядке.
+        """
+        if not plain_texts:
+            return []
+        if self.mode == MODE_GCM:
+            nonces = os.urandom(GCM_NONCE_SIZE * len(plain_texts))
+            return [
+                self._encrypt_gcm(text.encode('utf-8'), nonces[i * GCM_NONCE_SIZE:(i + 1) * GCM_NONCE_SIZE])
+                for i, text in enumerate(plain_texts)
+            ]
+        return self._encrypt_cbc_batch([_pad(text.encode('utf-8')) for text in plain_texts])
+
+    def decrypt_many(self, tokens: Sequence[str]) -> List[str]:
+        """
+        Расшифровывает список base64-строк.
+
+        :param tokens: Шифротексты.
+        :return: Открытые тексты в том же порядке.
+        :raises DecryptionError: Если хотя бы одно сообщение повреждено.
+        """
+        if not tokens:
+            return []
+        try:
+            raw = [base64.b64decode(token, validate=True) for token in tokens]
+        except (binascii.Error, ValueError) as e:
+            raise DecryptionError(f'Invalid base64: {e}') from e
+        if self.mode == MODE_GCM:
+            return [self._decrypt_gcm(data) for data in raw]
+        return self._decrypt_cbc_batch(raw)
+
+    # --- CBC ---
+
+    def _cbc_encryptor(self):
+        encryptor = getattr(self._local, 'encryptor', None)
+        if encryptor is None:
+            encryptor = self._local.encryptor = AES.new(self._key, AES.MODE_CBC, os.urandom(BLOCK_SIZE))
+        return encryptor
+
+    def _cbc_decryptor(self):
+        decryptor = getattr(self._local, 'decryptor', None)
+        if decryptor is None:
+            decryptor = self._local.decryptor = AES.new(self._key, AES.MODE_CBC, bytes(BLOCK_SIZE))
+        return decryptor
+
+    def _encrypt_cbc_batch(self, padded: List[bytes]) -> List[str]:
+        seeds = os.urandom(BLOCK_SIZE * len(padded))
+        # Случайный блок перед сообщением: C_0 = E(R xor C_пред) становится IV сообщения
+        stream = b''.join([
+            part for i, data in enumerate(padded) for part in (seeds[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE], data)
+        ])
+        encrypted = self._cbc_encryptor().encrypt(stream)
+
+        results = []
+        offset = 0
+        for data in padded:
+            end = offset + BLOCK_SIZE + len(data)
+            results.append(base64.b64encode(encrypted[offset:end]).decode('ascii'))
+            offset = end
+        return results
+
+    def _decrypt_cbc_batch(self, raw: List[bytes]) -> List[str]:
+        for data in raw:
+            if len(data) < 2 * BLOCK_SIZE or len(data) % BLOCK_SIZE:
+                raise DecryptionError('Invalid CBC ciphertext length')
+        # P_j = D(C_j) xor C_{j-1}: в общей цепочке перед блоками сообщения стоит его IV,
+        # поэтому неверным выходит только первый блок (сам IV), он отбрасывается
+        plain = self._cbc_decryptor().decrypt(b''.join(raw))
+
+        results = []
+        offset = 0
+        for data in raw:
+            end = offset + len(data)
+            try:
+                results.append(_unpad(plain[offset + BLOCK_SIZE:end]).decode('utf-8'))
+            except UnicodeDecodeError as e:
+                raise DecryptionError(f'Invalid plaintext encoding: {e}') from e
+            offset = end
+        return results
+
+    # --- GCM ---
+
+    def _encrypt_gcm(self, data: bytes, nonce: bytes) -> str:
+        if self._aesgcm is not None:
+            return base64.b64encode(nonce + self._aesgcm.encrypt(nonce, data, None)).decode('ascii')
+        cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+        cipher_text, tag = cipher.encrypt_and_digest(data)
+        return base64.b64encode(nonce + cipher_text + tag).decode('ascii')
+
+    def _decrypt_gcm(self, data: bytes) -> str:
+        if len(data) < GCM_NONCE_SIZE + GCM_TAG_SIZE:
+            raise DecryptionError('Invalid GCM ciphertext length')
+        nonce = data[:GCM_NONCE_SIZE]
+        if self._aesgcm is not None:
+            try:
+                plain = self._aesgcm.decrypt(nonce, data[GCM_NONCE_SIZE:], None)
+            except self._invalid_tag as e:
+                raise DecryptionError('Authentication failed') from e
+        else:
+            cipher_text, tag = data[GCM_NONCE_SIZE:-GCM_TAG_SIZE], data[-GCM_TAG_SIZE:]
+            cipher = AES.new(self._key, AES.MODE_GCM, nonce=nonce)
+            try:
+                plain = cipher.decrypt_and_verify(cipher_text, tag)
+            except ValueError as e:
+                raise DecryptionError('Authentication failed') from e
+        try:
+            return plain.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise DecryptionError(f'Invalid plaintext encoding: {e}') from e
@@ -1,24 +1,24 @@
 import os
 import json
-import base64
-import hmac
-import hashlib
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 from flask import Flask, request, abort, Response
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from crypto_engine import EncryptionEngine, MODE_CBC
+from http_client import LINE_API_BASE, get_session
+from logging_setup import SAMPLED, preview, setup_logging
+from metrics import install_metrics_endpoint, stage_timer, timed
+from reply_batcher import PendingReply, ReplyBatcher, ReplyResult
+from webhook import InvalidBodyError, WebhookParser
+
+# Логирование через фоновый поток (LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_BODY_LIMIT)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Метрики Prometheus: задержки проверки подписи, шифрования и отправки ответов (/metrics)
+install_metrics_endpoint(app)
 
 
 def load_env_variables() -> (str, str, bytes):
@@ -48,69 +48,70 @@ def load_env_variables() -> (str, str, bytes):
 
 CHANNEL_SECRET, CHANNEL_ACCESS_TOKEN, ENCRYPTION_KEY = load_env_variables()
 
+# ENCRYPTION_MODE: 'cbc' (по умолчанию, прежний формат) или 'gcm' (с проверкой целостности)
+encryption_engine = EncryptionEngine(ENCRYPTION_KEY, mode=os.environ.get('ENCRYPTION_MODE', MODE_CBC))
 
-def verify_line_signature(body_bytes: bytes, signature_header: str) -> bool:
+# Проверка подписи и разбор тела вебхука (ключ HMAC подготавливается один раз).
+# События остаются словарями: объекты Event на больших телах дороже, чем прежний json.loads
+webhook_parser = WebhookParser(CHANNEL_SECRET)
+
+
+def encrypt_text(plain_text: str) -> str:
     """
-    Проверяет корректность подписи, полученной от LINE.
+    Шифрует строку с использованием AES (режим задаётся ENCRYPTION_MODE).
 
-    :param body_bytes: Тело запроса в байтах.
-    :param signature_header: Подпись из заголовка X-Line-Signature.
-    :return: True, если подпись корректна, иначе False.
+    :param plain_text: Открытый текст.
+    :return: Base64-кодированная строка, содержащая IV (nonce) и зашифрованный текст.
     """
-    hmac_digest = hmac.new(
-        CHANNEL_SECRET.encode('utf-8'),
-        body_bytes,
-        hashlib.sha256
-    ).digest()
-    calculated_signature = base64.b64encode(hmac_digest).decode('utf-8')
-    valid = hmac.compare_digest(calculated_signature, signature_header)
-    if not valid:
-        logger.warning("Подпись не прошла валидацию.")
-    return valid
+    return encryption_engine.encrypt_text(plain_text)
 
 
-def encrypt_text(plain_text: str) -> str:
+def decrypt_text(encoded: str) -> str:
     """
-    Шифрует строку с использованием AES в режиме CBC.
+    Расшифровывает строку, полученную от encrypt_text.
 
-    :param plain_text: Открытый текст.
-    :return: Base64-кодированная строка, содержащая IV и зашифрованный текст.
+    :param encoded: Base64-кодированная строка.
+    :return: Открытый текст.
+    :raises crypto_engine.DecryptionError: Если данные повреждены или подделаны.
     """
-    iv = os.urandom(16)
-    cipher = AES.new(ENCRYPTION_KEY, AES.MODE_CBC, iv)
-    padded_text = pad(plain_text.encode('utf-8'), AES.block_size)
-    cipher_text = cipher.encrypt(padded_text)
-    combined = iv + cipher_text
-    encoded = base64.b64encode(combined).decode('utf-8')
-    return encoded
+    return encryption_engine.decrypt_text(encoded)
 
 
-def send_reply(reply_token: str, original_text: str) -> Optional[requests.Response]:
+def build_text_message(encrypted_text: str) -> Dict[str, str]:
     """
-    Отправляет зашифрованный ответ с помощью LINE Messaging API.
+    Формирует текстовое сообщение LINE.
+
+    :param encrypted_text: Уже зашифрованный текст.
+    :return: Объект сообщения для LINE Messaging API.
+    """
+    return {
+        'type': 'text',
+        'text': encrypted_text
+    }
+
+
+@timed('send_reply')
+def send_reply_messages(reply_token: str, messages: List[Dict[str, Any]]) -> requests.Response:
+    """
+    Отправляет до 5 сообщений одним вызовом reply API.
 
     :param reply_token: Токен для ответа.
-    :param original_text: Исходный текст, который необходимо зашифровать и отправить.
-    :return: Объект ответа от API, либо None при ошибке.
+    :param messages: Список объектов сообщений.
+    :return: Объект ответа от API.
     :raises Exception: Если API возвращает ошибку.
     """
-    encrypted = encrypt_text(original_text)
-    url = 'https://api.line.me/v2/bot/message/reply'
+    url = f'{LINE_API_BASE}/v2/bot/message/reply'
     headers = {
         'Content-Type': 'application/json',
         'Authorization': f'Bearer {CHANNEL_ACCESS_TOKEN}'
     }
     message_data = {
         'replyToken': reply_token,
-        'messages': [
-            {
-                'type': 'text',
-                'text': encrypted
-            }
-        ]
+        'messages': messages
     }
-    logger.info(f"Отправка ответа через LINE API: {message_data}")
-    response = requests.post(url, headers=headers, data=json.dumps(message_data))
+    logger.info("Отправка ответа через LINE API: сообщений %d", len(messages), extra=SAMPLED)
+    logger.debug("Тело ответа LINE API: %s", preview(message_data))
+    response = get_session().post(url, headers=headers, data=json.dumps(message_data))
     if response.status_code != 200:
         msg = f'Error from LINE API: {response.status_code} {response.text}'
         logger.error(msg)
@@ -118,42 +119,79 @@ def send_reply(reply_token: str, original_text: str) -> Optional[requests.Respon
     return response
 
 
-def process_event(event: Dict[str, Any]) -> None:
+def send_reply(reply_token: str, original_text: str) -> Optional[requests.Response]:
+    """
+    Отправляет зашифрованный ответ с помощью LINE Messaging API.
+
+    :param reply_token: Токен для ответа.
+    :param original_text: Исходный текст, который необходимо зашифровать и отправить.
+    :return: Объект ответа от API, либо None при ошибке.
+    :raises Exception: Если API возвращает ошибку.
+    """
+    return send_reply_messages(reply_token, [build_text_message(encrypt_text(original_text))])
+
+
+# Параллельная отправка ответов на независимые reply-токены
+REPLY_CONCURRENCY = int(os.environ.get('REPLY_CONCURRENCY', 8))
+reply_batcher = ReplyBatcher(send_reply_messages, max_concurrency=REPLY_CONCURRENCY)
+
+
+def process_event(event: Dict[str, Any]) -> Optional[Tuple[str, str]]:
     """
     Обрабатывает отдельное событие, если оно соответствует критериям.
 
     :param event: Словарь с данными события.
+    :return: Пара (reply-токен, текст для шифрования и ответа) либо None, если отвечать не нужно.
     """
     if event.get('type') != 'message':
         logger.debug("Событие не является сообщением, пропуск.")
-        return
+        return None
 
     reply_token = event.get('replyToken')
     if not reply_token:
         logger.debug("Нет replyToken в событии, пропуск.")
-        return
+        return None
 
-    message = event.get('message', {})
+    message = event.get('message') or {}
     if message.get('type') != 'text':
         logger.debug("Сообщение не текстовое, пропуск.")
-        return
+        return None
 
-    text_content = message.get('text', '')
-    logger.info(f"Получено текстовое сообщение: {text_content}")
-    try:
-        send_reply(reply_token, text_content)
-    except Exception as e:
-        logger.exception(f"Ошибка при отправке ответа: {e}")
+    text_content = message.get('text') or ''
+    logger.info("Получено текстовое сообщение (%d симв.)", len(text_content), extra=SAMPLED)
+    return reply_token, text_content
 
 
-def handle_events(events: List[Dict[str, Any]]) -> None:
+def handle_events(events: List[Dict[str, Any]]) -> List[ReplyResult]:
     """
-    Обрабатывает список событий.
+    Обрабатывает список событий: тексты ответов шифруются одним пакетом,
+    группируются по reply-токену и отправляются параллельно.
 
     :param events: Список событий, полученных от LINE API.
+    :return: Результат отправки по каждому событию, на которое формировался ответ.
     """
-    for event in events:
-        process_event(event)
+    replies = []
+    for index, event in enumerate(events):
+        reply = process_event(event)
+        if reply is not None:
+            replies.append((index, *reply))
+
+    try:
+        with stage_timer('encrypt'):
+            encrypted = encryption_engine.encrypt_many([text for _, _, text in replies])
+    except Exception as e:
+        logger.exception(f"Ошибка при шифровании ответов: {e}")
+        return [ReplyResult(index, token, False, str(e)) for index, token, _ in replies]
+
+    pending = [
+        PendingReply(index, token, build_text_message(cipher_text))
+        for (index, token, _), cipher_text in zip(replies, encrypted)
+    ]
+    results = reply_batcher.dispatch(pending)
+    failed = [result for result in results if not result.ok]
+    if failed:
+        logger.error(f"Не удалось отправить ответы на {len(failed)} из {len(results)} событий.")
+    return results
 
 
 @app.route('/callback', methods=['POST'])
@@ -162,23 +200,22 @@ def callback() -> Response:
     Точка входа для обработки запросов от LINE.
     Проверяет подпись запроса, парсит JSON и передаёт события на обработку.
     """
-    request_body = request.get_data()
+    # Тело не копируется в кэш запроса и не декодируется в str: подпись и JSON — по исходным байтам
+    request_body = request.get_data(cache=False)
     signature = request.headers.get('X-Line-Signature', '')
-    logger.debug(f"Получен запрос: {request_body}")
+    logger.debug("Получен запрос: %s", preview(request_body))
 
-    if not verify_line_signature(request_body, signature):
+    with stage_timer('verify_line_signature'):
+        valid = webhook_parser.verify(request_body, signature)
+    if not valid:
         logger.error("Подпись не соответствует, прерывание обработки.")
         abort(400)
 
     try:
-        body_dict = json.loads(request_body.decode('utf-8'))
-    except json.JSONDecodeError as e:
-        logger.error(f"Ошибка декодирования JSON: {e}")
-        abort(400)
-
-    events = body_dict.get('events')
-    if events is None:
-        logger.error("Отсутствует ключ 'events' в запросе.")
+        with stage_timer('parse_events'):
+            events = webhook_parser.load_body(request_body)
+    except InvalidBodyError as e:
+        logger.error(f"Некорректное тело запроса: {e}")
         abort(400)
 
     handle_events(events)
@@ -0,0 +1,136 @@
+"""
+Асинхронный вариант encryption.py на aiohttp: ответы на все reply-токены запроса
+отправляются одновременно в цикле событий, без пула потоков.
+
+Ключи, режим шифрования и разбор событий общие с encryption.py.
+Запуск: python encryption_async.py [--port 5000] [--processes 4]
+"""
+import argparse
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+import encryption
+from aio_web import AsyncLineClient, create_session, metrics_view, serve
+from logging_setup import preview
+from metrics import stage_timer
+from reply_batcher import PendingReply, ReplyResult, group_replies
+from webhook import InvalidBodyError
+
+logger = logging.getLogger(__name__)
+
+
+async def send_batch(token: str, batch: List[PendingReply]) -> List[ReplyResult]:
+    """Отправляет сообщения одного reply-токена и возвращает результат по каждому событию."""
+    try:
+        with stage_timer('send_reply'):
+            await line_client.reply(token, [reply.message for reply in batch])
+    except Exception as e:
+        logger.error(f"Ошибка при отправке ответа ({len(batch)} сообщ.): {e}")
+        return [ReplyResult(reply.event_index, token, False, str(e)) for reply in batch]
+    return [ReplyResult(reply.event_index, token, True) for reply in batch]
+
+
+async def handle_events(events: List[Dict[str, Any]]) -> List[ReplyResult]:
+    """
+    Асинхронный вариант encryption.handle_events.
+
+    :param events: Список событий, полученных от LINE API.
+    :return: Результат отправки по каждому событию, на которое формировался ответ.
+    """
+    replies = []
+    for index, event in enumerate(events):
+        reply = encryption.process_event(event)
+        if reply is not None:
+            replies.append((index, *reply))
+    if not replies:
+        return []
+
+    try:
+        with stage_timer('encrypt'):
+            encrypted = encryption.encryption_engine.encrypt_many([text for _, _, text in replies])
+    except Exception as e:
+        logger.exception(f"Ошибка при шифровании ответов: {e}")
+        return [ReplyResult(index, token, False, str(e)) for index, token, _ in replies]
+
+    batches, results = group_replies([
+        PendingReply(index, token, encryption.build_text_message(cipher_text))
+        for (index, token, _), cipher_text in zip(replies, encrypted)
+    ])
+    for batch_results in await asyncio.gather(*(send_batch(token, batch) for token, batch in batches)):
+        results.extend(batch_results)
+    results.sort(key=lambda result: result.event_index)
+    failed = [result for result in results if not result.ok]
+    if failed:
+        logger.error(f"Не удалось отправить ответы на {len(failed)} из {len(results)} событий.")
+    return results
+
+
+async def callback(request: web.Request) -> web.Response:
+    """
+    Точка входа для обработки запросов от LINE.
+    Проверяет подпись запроса, парсит JSON и отвечает на события.
+    """
+    request_body = await request.read()
+    signature = request.headers.get('X-Line-Signature', '')
+    logger.debug("Получен запрос: %s", preview(request_body))
+
+    with stage_timer('verify_line_signature'):
+        valid = encryption.webhook_parser.verify(request_body, signature)
+    if not valid:
+        logger.error("Подпись не соответствует, прерывание обработки.")
+        raise web.HTTPBadRequest()
+
+    try:
+        with stage_timer('parse_events'):
+            events = encryption.webhook_parser.load_body(request_body)
+    except InvalidBodyError as e:
+        logger.error(f"Некорректное тело запроса: {e}")
+        raise web.HTTPBadRequest()
+
+    await handle_events(events)
+    return web.Response(status=200)
+
+
+http_session = None
+line_client = None
+
+
+async def on_startup(application: web.Application) -> None:
+    global http_session, line_client
+    http_session = create_session()
+    line_client = AsyncLineClient(http_session, encryption.CHANNEL_ACCESS_TOKEN)
+
+
+async def on_cleanup(application: web.Application) -> None:
+    await http_session.close()
+
+
+def make_app() -> web.Application:
+    application = web.Application()
+    application.router.add_post('/callback', callback)
+    application.router.add_get('/metrics', metrics_view)
+    application.on_startup.append(on_startup)
+    application.on_cleanup.append(on_cleanup)
+    return application
+
+
+def main(argv=None) -> None:
+    """
+    Запускает асинхронный сервер на указанном порту.
+    """
+    arg_parser = argparse.ArgumentParser(description='Асинхронный сервер шифрующего LINE-бота.')
+    arg_parser.add_argument('--host', default='0.0.0.0')
+    arg_parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    arg_parser.add_argument('--processes', type=int, default=int(os.environ.get('WEB_PROCESSES', 1)),
+                            help='Число процессов, слушающих порт')
+    args = arg_parser.parse_args(argv)
+    logger.info(f"Запуск приложения на порту {args.port}")
+    serve(make_app, args.host, args.port, args.processes)
+
+
+if __name__ == '__main__':
+    main()
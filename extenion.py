@@ -1,77 +1,227 @@
+import argparse
 import asyncio
+import os
 import aiohttp
-from bs4 import BeautifulSoup
-import pandas as pd
 import logging
 import random
+from concurrent.futures import ProcessPoolExecutor
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from crawl_state import NOT_MODIFIED, CrawlState, content_hash
+from extraction import extract_products
+from logging_setup import SAMPLED, setup_logging
+from product_index import ProductDeduplicator, ProductIndex
+from sinks import SINK_FORMATS, open_sink
 
-async def fetch(session, url):
+setup_logging()
+
+async def fetch(session, url, state=None):
+    """
+    Загружает страницу. При наличии state отправляет условный запрос и возвращает
+    NOT_MODIFIED, если страница не изменилась с прошлого обхода.
+    """
+    headers = state.conditional_headers(url) if state is not None else None
     try:
-        async with session.get(url, timeout=10) as response:
+        async with session.get(url, timeout=10, headers=headers) as response:
+            if response.status == 304 and state is not None:
+                logging.info("Страница не изменилась: %s", url, extra=SAMPLED)
+                return NOT_MODIFIED
             response.raise_for_status()
-            return await response.text()
+            body = await response.read()
+            if state is not None and not state.record_response(
+                url, response.headers.get('ETag'), response.headers.get('Last-Modified'), content_hash(body)
+            ):
+                logging.info("Содержимое страницы не изменилось: %s", url, extra=SAMPLED)
+                return NOT_MODIFIED
+            return body.decode(response.get_encoding(), errors='replace')
     except Exception as e:
         logging.error(f"Ошибка при запросе {url}: {e}")
+        if state is not None:
+            state.mark_failed(url)
         return None
 
 def parse_page(html):
-    soup = BeautifulSoup(html, 'lxml')
-    products = []
-    
-    for item in soup.find_all('div', class_='product-item'):
+    return extract_products(html)
+
+async def fetch_stage(session, urls, semaphore, html_queue, delay_range, state=None):
+    """
+    Загрузка страниц: одновременно выполняется не больше запросов, чем позволяет семафор.
+    Если очередь разбора заполнена, загрузчики ждут, и новые запросы не начинаются.
+    """
+    async def fetch_one(page_number, url):
         try:
-            name = item.find('h2', class_='product-name').get_text(strip=True)
-            price = item.find('span', class_='price').get_text(strip=True)
-            image_url = item.find('img', class_='product-image')['src']
-            product_url = item.find('a', class_='product-link')['href']
-            
-            products.append({
-                'name': name,
-                'price': price,
-                'image_url': image_url,
-                'product_url': product_url
-            })
-        except AttributeError as e:
-            logging.warning(f"Не удалось спарсить элемент: {e}")
+            await asyncio.sleep(random.uniform(*delay_range))
+            html = await fetch(session, url, state)
+            if html is NOT_MODIFIED:
+                # Разбирать нечего, но индекс продуктов должен узнать, что страница на месте
+                await html_queue.put((page_number, url, NOT_MODIFIED))
+            elif html:
+                await html_queue.put((page_number, url, html))
+            else:
+                logging.warning(f"Пропуск страницы {page_number} из-за ошибки загрузки.")
+                # Продукты страницы не должны попасть в удалённые только из-за сбоя загрузки
+                await html_queue.put((page_number, url, None))
+        finally:
+            semaphore.release()
+
+    tasks = set()
+    for page_number, url in urls:
+        await semaphore.acquire()
+        task = asyncio.create_task(fetch_one(page_number, url))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def parse_stage(executor, html_queue, products_queue):
+    """Разбор страниц в пуле процессов: разбор HTML нагружает CPU и не должен блокировать цикл событий."""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await html_queue.get()
+        if item is None:
+            break
+        page_number, url, html = item
+        if html is NOT_MODIFIED or html is None:
+            await products_queue.put(item)
+            continue
+        try:
+            products = await loop.run_in_executor(executor, parse_page, html)
+        except Exception as e:
+            logging.error(f"Ошибка при разборе страницы {page_number}: {e}")
+            await products_queue.put((page_number, url, None))
             continue
-    return products
+        await products_queue.put((page_number, url, products))
 
-async def main_async():
-    base_url = 'https://example.com/products?page={}'
+
+async def sink_stage(products_queue, sink, checkpoint_every, state=None, dedup=None, index=None):
+    """
+    Запись продуктов порциями по мере поступления страниц с периодическим fsync.
+    Страницы отмечаются обработанными в state только после fsync их строк.
+    Повторы продуктов отсеиваются dedup, изменения относительно прошлого обхода ведёт index.
+    """
+    pages = 0
+    # Для неизменившейся страницы вместо продуктов None: они уже сохранены в state
+    uncommitted = []
+    while True:
+        item = await products_queue.get()
+        if item is None:
+            break
+        page_number, url, products = item
+        if products is None:
+            # Страница не загружена или не разобрана: её продукты в индексе считаются на месте
+            if index is not None:
+                index.touch_page(url)
+            continue
+        parsed = products
+        if products is NOT_MODIFIED:
+            # Продукты неизменившейся страницы берутся из прошлого разбора, чтобы файл был полным
+            parsed, products = None, state.page_products(url)
+            if products is None:
+                logging.warning(f"Нет сохранённых продуктов для неизменившейся страницы {url}")
+                if index is not None:
+                    index.touch_page(url)
+                products = []
+        unique = products
+        if dedup is not None:
+            unique = dedup.filter(unique, url)
+        if index is not None and products:
+            unique = index.observe(url, unique)
+        sink.write(unique)
+        uncommitted.append((url, parsed))
+        pages += 1
+        if pages % checkpoint_every == 0:
+            commit_pages(sink, state, uncommitted)
+        logging.info("Найдено продуктов на странице %d: %d", page_number, len(products), extra=SAMPLED)
+    commit_pages(sink, state, uncommitted)
+
+
+def commit_pages(sink, state, uncommitted):
+    sink.checkpoint()
+    if state is not None:
+        for url, products in uncommitted:
+            if products is None:
+                state.mark_unchanged(url)
+            else:
+                state.mark_done(url, products)
+    uncommitted.clear()
+
+
+def parse_args(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Асинхронный парсер каталога продуктов.')
+    arg_parser.add_argument('--base-url', default='https://example.com/products?page={}',
+                            help='Шаблон URL страницы каталога с {} вместо номера страницы')
+    arg_parser.add_argument('--pages', type=int, default=10, help='Количество страниц')
+    arg_parser.add_argument('--start-page', type=int, default=1, help='Номер первой страницы')
+    arg_parser.add_argument('--concurrency', type=int, default=8, help='Одновременных загрузок')
+    arg_parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1,
+                            help='Процессов для разбора HTML')
+    arg_parser.add_argument('--queue-size', type=int, default=16,
+                            help='Ёмкость очередей между стадиями (ограничивает память)')
+    arg_parser.add_argument('--delay-min', type=float, default=0.5, help='Минимальная пауза перед запросом, с')
+    arg_parser.add_argument('--delay-max', type=float, default=1.5, help='Максимальная пауза перед запросом, с')
+    arg_parser.add_argument('--output', default='products_async.csv', help='Файл для сохранения результатов')
+    arg_parser.add_argument('--format', choices=sorted(SINK_FORMATS),
+                            help='Формат вывода (по умолчанию по расширению файла)')
+    arg_parser.add_argument('--checkpoint-every', type=int, default=50,
+                            help='Через сколько страниц сбрасывать данные на диск (fsync)')
+    arg_parser.add_argument('--state', help='Файл SQLite с состоянием обхода (условные запросы, возобновление)')
+    arg_parser.add_argument('--resume', action='store_true',
+                            help='Продолжить прерванный обход (требует --state), результаты дописываются')
+    arg_parser.add_argument('--bloom-capacity', type=int,
+                            help='Отсеивать повторы фильтром Блума на столько продуктов (для очень больших каталогов)')
+    arg_parser.add_argument('--index', help='Файл SQLite с индексом продуктов для сравнения с прошлым обходом')
+    arg_parser.add_argument('--diff', help='Файл JSON Lines для изменений относительно прошлого обхода (требует --index)')
+    return arg_parser.parse_args(argv)
+
+
+async def main_async(argv=None):
+    args = parse_args(argv)
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
                       'AppleWebKit/537.36 (KHTML, like Gecko) '
                       'Chrome/85.0.4183.102 Safari/537.36'
     }
-    total_pages = 10
-    all_products = []
-
-    async with aiohttp.ClientSession(headers=headers) as session:
-        tasks = []
-        for page in range(1, total_pages + 1):
-            url = base_url.format(page)
-            tasks.append(fetch(session, url))
-        
-        pages_content = await asyncio.gather(*tasks)
-        
-        for page_number, html in enumerate(pages_content, start=1):
-            if html:
-                products = parse_page(html)
-                all_products.extend(products)
-                logging.info(f"Найдено продуктов на странице {page_number}: {len(products)}")
-            else:
-                logging.warning(f"Пропуск страницы {page_number} из-за ошибки загрузки.")
-            
-            await asyncio.sleep(random.uniform(1, 3))
-    
-    df = pd.DataFrame(all_products)
-    df.to_csv('products_async.csv', index=False, encoding='utf-8-sig')
-    logging.info("Данные успешно сохранены в products_async.csv")
+    urls = [(page, args.base_url.format(page)) for page in range(args.start_page, args.start_page + args.pages)]
+    state = CrawlState(args.state) if args.state else None
+    if state is not None:
+        state.start_run(resume=args.resume)
+        pending = set(state.pending(url for _, url in urls))
+        urls = [(page, url) for page, url in urls if url in pending]
+    sink_options = {'append': True} if args.resume else {}
+    dedup = ProductDeduplicator(bloom_capacity=args.bloom_capacity)
+    index = ProductIndex(args.index) if args.index else None
+    if index is not None:
+        index.start_run(resume=args.resume)
+    html_queue = asyncio.Queue(maxsize=args.queue_size)
+    products_queue = asyncio.Queue(maxsize=args.queue_size)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+
+    with ProcessPoolExecutor(max_workers=args.parse_workers) as executor, \
+            open_sink(args.output, args.format, **sink_options) as sink:
+        async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+            writer = asyncio.create_task(
+                sink_stage(products_queue, sink, args.checkpoint_every, state, dedup, index)
+            )
+            parsers = [
+                asyncio.create_task(parse_stage(executor, html_queue, products_queue))
+                for _ in range(args.parse_workers)
+            ]
+            await fetch_stage(session, urls, semaphore, html_queue, (args.delay_min, args.delay_max), state)
+            for _ in parsers:
+                await html_queue.put(None)
+            await asyncio.gather(*parsers)
+            await products_queue.put(None)
+            await writer
+    if state is not None:
+        state.finish_run()
+    if dedup.stats['duplicates']:
+        logging.info(f"Отброшено повторов продуктов: {dedup.stats['duplicates']}")
+    if index is not None:
+        index.finish_run()
+        if args.diff:
+            counts = index.write_diff(args.diff)
+            logging.info(f"Изменения относительно прошлого обхода ({args.diff}): {counts}")
 
 if __name__ == '__main__':
     asyncio.run(main_async())
@@ -0,0 +1,185 @@
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from lxml import etree, html as lxml_html
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as _SelectolaxParser
+except ImportError:  # pragma: no cover - зависит от версии selectolax
+    try:
+        from selectolax.parser import HTMLParser as _SelectolaxParser
+    except ImportError:
+        _SelectolaxParser = None
+
+logger = logging.getLogger(__name__)
+
+_SIMPLE_SELECTOR_RE = re.compile(r'^(?P<tag>[a-zA-Z][\w-]*|\*)?(?P<classes>(?:\.[\w-]+)*)$')
+
+
+class FieldSpec(NamedTuple):
+    """Описание извлекаемого поля."""
+    name: str
+    # Простой CSS-селектор вида 'tag.class' относительно элемента продукта
+    selector: str
+    # Имя атрибута; None — текст элемента (как get_text(strip=True) в BeautifulSoup)
+    attr: Optional[str] = None
+    # Без обязательного поля запись отбрасывается, без необязательного — сохраняется с None
+    required: bool = False
+
+
+# Разметка карточек товара в каталоге
+PRODUCT_ITEM_SELECTOR = 'div.product-item'
+PRODUCT_FIELDS = (
+    FieldSpec('name', 'h2.product-name'),
+    FieldSpec('price', 'span.price'),
+    FieldSpec('image_url', 'img.product-image', attr='src'),
+    FieldSpec('product_url', 'a.product-link', attr='href', required=True),
+)
+
+
+def css_to_xpath(selector: str, descendant: bool = True) -> str:
+    """
+    Переводит простой CSS-селектор ('tag', '.class', 'tag.class1.class2') в XPath.
+
+    :param selector: CSS-селектор.
+    :param descendant: Искать среди потомков контекстного узла ('.//'), иначе во всём документе ('//').
+    :return: Выражение XPath.
+    :raises ValueError: Если селектор сложнее поддерживаемого.
+    """
+    match = _SIMPLE_SELECTOR_RE.match(selector.strip())
+    if not match or not (match.group('tag') or match.group('classes')):
+        raise ValueError(f'Unsupported selector: {selector}')
+    tag = match.group('tag') or '*'
+    conditions = ''.join(
+        f"[contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')]"
+        for cls in match.group('classes').split('.') if cls
+    )
+    return f"{'.//' if descendant else '//'}{tag}{conditions}"
+
+
+def _element_text(element) -> str:
+    return ''.join(part.strip() for part in element.itertext())
+
+
+class ProductExtractor:
+    """
+    Извлечение продуктов по декларативным описаниям полей.
+    Селекторы компилируются один раз при создании объекта.
+
+    Бэкенды: 'lxml' (XPath, по умолчанию) и 'selectolax' (если установлен).
+    """
+
+    def __init__(
+        self,
+        item_selector: str = PRODUCT_ITEM_SELECTOR,
+        fields: Sequence[FieldSpec] = PRODUCT_FIELDS,
+        backend: str = 'lxml'
+    ) -> None:
+        """
+        :param item_selector: Селектор элемента одного продукта.
+        :param fields: Описания полей.
+        :param backend: 'lxml' или 'selectolax'.
+        :raises ValueError: Если бэкенд неизвестен или не установлен.
+        """
+        self.item_selector = item_selector
+        self.fields = tuple(fields)
+        self.backend = backend
+        self.stats = {'items': 0, 'partial': 0, 'dropped': 0}
+        if backend == 'lxml':
+            self._item_xpath = etree.XPath(css_to_xpath(item_selector, descendant=False))
+            self._field_xpaths = [
+                etree.XPath(f'({css_to_xpath(field.selector)})[1]') for field in self.fields
+            ]
+            self._extract: Callable[[str], List[Dict[str, Any]]] = self._extract_lxml
+        elif backend == 'selectolax':
+            if _SelectolaxParser is None:
+                raise ValueError('selectolax is not installed')
+            self._extract = self._extract_selectolax
+        else:
+            raise ValueError(f'Unknown backend: {backend}')
+
+    def extract(self, html: str) -> List[Dict[str, Any]]:
+        """
+        Извлекает продукты со страницы.
+
+        :param html: HTML-код страницы.
+        :return: Список словарей; отсутствующие необязательные поля равны None.
+        """
+        if not html or not html.strip():
+            return []
+        return self._extract(html)
+
+    def _build(self, values: List[Optional[str]]) -> Optional[Dict[str, Any]]:
+        self.stats['items'] += 1
+        missing = [field.name for field, value in zip(self.fields, values) if value is None]
+        if missing:
+            if any(field.required and value is None for field, value in zip(self.fields, values)):
+                self.stats['dropped'] += 1
+                logger.warning(f"Не удалось спарсить элемент: нет полей {', '.join(missing)}")
+                return None
+            self.stats['partial'] += 1
+            logger.debug(f"Неполная запись о продукте, нет полей: {', '.join(missing)}")
+        return {field.name: value for field, value in zip(self.fields, values)}
+
+    def _extract_lxml(self, html: str) -> List[Dict[str, Any]]:
+        try:
+            root = lxml_html.fromstring(html)
+        except (etree.ParserError, ValueError) as e:
+            logger.warning(f"Не удалось разобрать HTML: {e}")
+            return []
+        products = []
+        for item in self._item_xpath(root):
+            values = []
+            for field, xpath in zip(self.fields, self._field_xpaths):
+                found = xpath(item)
+                if not found:
+                    values.append(None)
+                elif field.attr is None:
+                    values.append(_element_text(found[0]))
+                else:
+                    values.append(found[0].get(field.attr))
+            product = self._build(values)
+            if product is not None:
+                products.append(product)
+        return products
+
+    def _extract_selectolax(self, html: str) -> List[Dict[str, Any]]:
+        tree = _SelectolaxParser(html)
+        products = []
+        for item in tree.css(self.item_selector):
+            values = []
+            for field in self.fields:
+                node = item.css_first(field.selector)
+                if node is None:
+                    values.append(None)
+                elif field.attr is None:
+                    values.append(node.text(deep=True, strip=True))
+                else:
+                    values.append(node.attributes.get(field.attr))
+            product = self._build(values)
+            if product is not None:
+                products.append(product)
+        return products
+
+
+# Бэкенд по умолчанию; переменная окружения наследуется и процессами пула разбора
+DEFAULT_BACKEND = os.environ.get('EXTRACTION_BACKEND', 'lxml')
+
+# Скомпилированные XPath-выражения lxml не разделяются между потоками — экстрактор на поток
+_local = threading.local()
+
+
+def extract_products(html: str) -> List[Dict[str, Any]]:
+    """
+    Извлекает продукты экстрактором по умолчанию (DEFAULT_BACKEND), общим для текущего потока.
+
+    :param html: HTML-код страницы.
+    :return: Список словарей с полями name, price, image_url, product_url.
+    """
+    extractor = getattr(_local, 'extractor', None)
+    if extractor is None:
+        extractor = _local.extractor = ProductExtractor(backend=DEFAULT_BACKEND)
+    return extractor.extract(html)
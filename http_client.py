@@ -0,0 +1,150 @@
+import os
+import random
+import threading
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class HostPolicy(NamedTuple):
+    """
+    Параметры соединений с конкретным хостом.
+    retry_post: повторять POST, но только когда запрос заведомо не выполнен
+    (ошибка соединения или 429) — см. PostSafeRetry.
+    """
+    pool_maxsize: int = 10
+    timeout: float = 10.0
+    retries: int = 0
+    backoff_factor: float = 0.5
+    retry_post: bool = False
+
+
+class JitteredRetry(Retry):
+    """Retry с экспоненциальной задержкой и случайной добавкой, чтобы повторы воркеров не совпадали."""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return 0
+        return backoff + random.uniform(0, backoff)
+
+
+class PostSafeRetry(JitteredRetry):
+    """
+    Повторы, при которых POST не отправляется дважды: после ошибки чтения или 5xx
+    запрос мог быть выполнен (например, push-сообщение уже доставлено), поэтому POST
+    повторяется только при ошибке соединения (urllib3 повторяет их для любого метода)
+    и при статусах из POST_RETRY_STATUSES.
+    """
+
+    POST_RETRY_STATUSES = frozenset({429})
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method.upper() == 'POST':
+            return status_code in self.POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+# Базовый адрес LINE Messaging API (переопределяется для локальных заглушек и нагрузочных тестов)
+LINE_API_BASE = os.environ.get('LINE_API_BASE', 'https://api.line.me').rstrip('/')
+
+# Политики по умолчанию; размеры пулов и таймауты переопределяются переменными окружения
+DEFAULT_POLICY = HostPolicy(
+    pool_maxsize=_env_int('HTTP_POOL_SIZE', 10),
+    timeout=_env_float('HTTP_TIMEOUT', 10.0),
+)
+HOST_POLICIES: Dict[str, HostPolicy] = {
+    urlsplit(LINE_API_BASE).hostname: HostPolicy(
+        pool_maxsize=_env_int('LINE_API_POOL_SIZE', 20),
+        timeout=_env_float('LINE_API_TIMEOUT', 5.0),
+        retries=_env_int('LINE_API_RETRIES', 3),
+        backoff_factor=0.3,
+        retry_post=True,
+    ),
+}
+
+
+def _make_adapter(policy: HostPolicy) -> HTTPAdapter:
+    # POST не входит в allowed_methods: ошибки чтения для него не повторяются
+    retry_cls = PostSafeRetry if policy.retry_post else JitteredRetry
+    retry = retry_cls(
+        total=policy.retries,
+        connect=policy.retries,
+        read=policy.retries,
+        status=policy.retries,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        backoff_factor=policy.backoff_factor,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    return HTTPAdapter(pool_connections=4, pool_maxsize=policy.pool_maxsize, max_retries=retry)
+
+
+class PooledSession(requests.Session):
+    """
+    Сессия requests с keep-alive пулами соединений, отдельными для каждого известного хоста,
+    повторами для 429/5xx и таймаутами по умолчанию в зависимости от хоста.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, HostPolicy]] = None,
+                 default: HostPolicy = DEFAULT_POLICY) -> None:
+        super().__init__()
+        self.policies = dict(HOST_POLICIES if policies is None else policies)
+        self.default_policy = default
+        self.mount('https://', _make_adapter(default))
+        self.mount('http://', _make_adapter(default))
+        self._host_adapters = {host: _make_adapter(policy) for host, policy in self.policies.items()}
+
+    def policy_for(self, url: str) -> HostPolicy:
+        host = (urlsplit(url).hostname or '').lower()
+        return self.policies.get(host, self.default_policy)
+
+    def get_adapter(self, url: str) -> HTTPAdapter:
+        # Выбор по имени хоста, а не по префиксу URL, чтобы учитывать и адреса с портом
+        adapter = self._host_adapters.get((urlsplit(url).hostname or '').lower())
+        if adapter is not None:
+            return adapter
+        return super().get_adapter(url)
+
+    def close(self) -> None:
+        super().close()
+        for adapter in self._host_adapters.values():
+            adapter.close()
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.policy_for(url).timeout
+        return super().request(method, url, *args, **kwargs)
+
+
+_session: Optional[PooledSession] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> PooledSession:
+    """
+    Возвращает общую для процесса сессию (создаётся при первом обращении).
+
+    :return: Экземпляр PooledSession.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = PooledSession()
+    return _session
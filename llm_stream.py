@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+
+class ModelTiers(NamedTuple):
+    """Выбор модели по длине запроса: короткие вопросы уходят в быструю модель."""
+    default: str
+    fast: str
+    # Запросы не длиннее стольких символов отвечает быстрая модель (0 — всегда default)
+    fast_prompt_chars: int = 0
+
+    def choose(self, prompt: str) -> str:
+        if self.fast_prompt_chars and len(prompt) <= self.fast_prompt_chars:
+            return self.fast
+        return self.default
+
+
+class _StreamBase:
+    """Общая часть потоковых ответов: накопленный текст, признак завершения и ошибка."""
+
+    def __init__(self, max_duration: float) -> None:
+        self.max_duration = max_duration
+        self.error: Optional[BaseException] = None
+        self.started_at = time.monotonic()
+        self._parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """Текст, сгенерированный к текущему моменту."""
+        return ''.join(self._parts)
+
+    @property
+    def ok(self) -> bool:
+        """Генерация завершилась без ошибки."""
+        return self.done and self.error is None
+
+    @property
+    def done(self) -> bool:
+        raise NotImplementedError
+
+    def _append(self, delta: str) -> None:
+        self._parts.append(delta)
+        if time.monotonic() - self.started_at > self.max_duration:
+            raise TimeoutError(f'Completion took longer than {self.max_duration:.0f}s')
+
+
+class CompletionStream(_StreamBase):
+    """
+    Потоковая генерация в отдельном потоке: текст доступен по мере поступления,
+    вызывающий ждёт не дольше заданного срока и может забрать то, что уже готово.
+    """
+
+    def __init__(self, deltas: Callable[[], Iterable[str]], max_duration: float = 120.0) -> None:
+        """
+        :param deltas: Функция, возвращающая итератор фрагментов текста.
+        :param max_duration: Предельная длительность генерации, секунды.
+        """
+        super().__init__(max_duration)
+        self._deltas = deltas
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[['CompletionStream'], Any]] = []
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def run(self) -> None:
+        """Читает фрагменты до конца генерации (выполняется в пуле потоков)."""
+        try:
+            for delta in self._deltas():
+                self._append(delta)
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._lock:
+                self._done.set()
+                callbacks, self._callbacks = self._callbacks, []
+            for callback in callbacks:
+                _run_callback(callback, self)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """
+        :param timeout: Сколько ждать, секунды.
+        :return: True, если генерация завершилась.
+        """
+        return self._done.wait(timeout)
+
+    def add_done_callback(self, callback: Callable[['CompletionStream'], Any]) -> None:
+        """Вызывает callback(stream) по завершении генерации (сразу, если она уже завершена)."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        _run_callback(callback, self)
+
+
+class AsyncCompletionStream(_StreamBase):
+    """Вариант CompletionStream для asyncio: генерация читается в отдельной задаче."""
+
+    def __init__(self, deltas: Callable[[], AsyncIterator[str]], max_duration: float = 120.0) -> None:
+        """
+        :param deltas: Функция, возвращающая асинхронный итератор фрагментов текста.
+        :param max_duration: Предельная длительность генерации, секунды.
+        """
+        super().__init__(max_duration)
+        self._deltas = deltas
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    def start(self) -> 'AsyncCompletionStream':
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def _run(self) -> None:
+        try:
+            await asyncio.wait_for(self._consume(), self.max_duration)
+        except Exception as e:
+            self.error = e
+
+    async def _consume(self) -> None:
+        async for delta in self._deltas():
+            self._parts.append(delta)
+
+    async def wait(self, timeout: Optional[float]) -> bool:
+        """
+        :param timeout: Сколько ждать, секунды.
+        :return: True, если генерация завершилась.
+        """
+        await asyncio.wait({self._task}, timeout=timeout)
+        return self._task.done()
+
+    def add_done_callback(self, callback: Callable[['AsyncCompletionStream'], Any]) -> None:
+        """Вызывает callback(stream) по завершении генерации."""
+        self._task.add_done_callback(lambda _: _run_callback(callback, self))
+
+
+def _run_callback(callback: Callable, stream: _StreamBase) -> None:
+    try:
+        callback(stream)
+    except Exception as e:
+        logger.exception(f"Ошибка в обработчике завершения генерации: {e}")
+
+
+class PartialAnswer(NamedTuple):
+    """
+    Ответ, отправленный до завершения генерации. Остаток (или полный ответ основной модели)
+    досылается push-сообщением, когда stream завершится.
+    """
+    # Текст для отправки по reply-токену
+    text: str
+    stream: Any
+    # 'partial' — начало ответа, 'fallback' — ответ быстрой модели, 'pending' — только уведомление
+    mode: str
+    # Сколько символов stream.text уже отправлено (для mode='partial')
+    sent_chars: int = 0
+
+    def followup_text(self) -> Optional[str]:
+        """
+        :return: Текст push-сообщения или None, если досылать нечего.
+        """
+        if not self.stream.ok:
+            return None
+        full = self.stream.text.strip()
+        if self.mode == 'partial':
+            rest = self.stream.text[self.sent_chars:].strip()
+            return f'…{rest}' if rest else None
+        return full or None
+
+    def when_final(self, callback: Callable[[str], Any]) -> None:
+        """Вызывает callback(полный ответ), если генерация завершится без ошибки (для кэша ответов)."""
+        self.stream.add_done_callback(lambda stream: callback(stream.text.strip()) if stream.ok else None)
+
+
+def openai_deltas(model: str, messages: List[dict], max_tokens: int, temperature: float,
+                  read_timeout: float) -> Iterator[str]:
+    """
+    Фрагменты ответа ChatCompletion в режиме stream.
+
+    :param read_timeout: Таймаут ожидания очередного фрагмента, секунды.
+    """
+    response = openai.ChatCompletion.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        n=1,
+        temperature=temperature,
+        stream=True,
+        request_timeout=read_timeout,
+    )
+    for chunk in response:
+        delta = chunk['choices'][0].get('delta', {}).get('content')
+        if delta:
+            yield delta
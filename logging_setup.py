@@ -0,0 +1,194 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+from typing import Any, List, Optional
+
+# Переменные окружения, общие для всех скриптов
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# 'text' — прежний формат строк, 'json' — одна JSON-запись на строку
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+# Доля сообщений с пометкой sampled (по одному на сообщение/страницу), которые попадут в лог
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+# Максимальная длина тел запросов и ответов в логе
+LOG_BODY_LIMIT = int(os.environ.get('LOG_BODY_LIMIT', 200))
+# Скрывать пользовательский текст и токены в телах
+LOG_REDACT = os.environ.get('LOG_REDACT', '1').lower() not in ('0', 'false', 'no')
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Передавайте в extra, чтобы строка учитывалась выборкой LOG_SAMPLE_RATE
+SAMPLED = {'sampled': True}
+
+# Ключи JSON, значения которых не должны попадать в лог
+_SENSITIVE_RE = re.compile(
+    r'("(?:text|replyToken|userId|groupId|roomId|Authorization|access_token)"\s*:\s*)"(?:[^"\\]|\\.)*"'
+)
+_BEARER_RE = re.compile(r'(Bearer\s+)[\w.\-+/=]+')
+
+# Стандартные атрибуты LogRecord; всё остальное из extra попадает в JSON как есть
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def redact(text: str) -> str:
+    """
+    Скрывает текст сообщений, reply-токены, идентификаторы и Bearer-токены.
+
+    :param text: Строка (как правило, JSON тела запроса или ответа).
+    :return: Строка с заменёнными значениями.
+    """
+    text = _SENSITIVE_RE.sub(r'\1"***"', text)
+    return _BEARER_RE.sub(r'\1***', text)
+
+
+class BodyPreview:
+    """
+    Отложенное представление тела для логов: обрезка и скрытие данных выполняются
+    только если запись действительно будет выведена.
+    """
+
+    __slots__ = ('body', 'limit')
+
+    def __init__(self, body: Any, limit: Optional[int] = None) -> None:
+        self.body = body
+        self.limit = LOG_BODY_LIMIT if limit is None else limit
+
+    def __str__(self) -> str:
+        body = self.body
+        if isinstance(body, (bytes, bytearray)):
+            body = bytes(body[:self.limit * 4]).decode('utf-8', 'replace')
+        elif not isinstance(body, str):
+            body = json.dumps(body, ensure_ascii=False, default=str)
+        size = len(body)
+        if LOG_REDACT:
+            body = redact(body)
+        if len(body) > self.limit:
+            body = f'{body[:self.limit]}… ({size} chars)'
+        return body
+
+
+def preview(body: Any, limit: Optional[int] = None) -> BodyPreview:
+    """
+    Безопасное для логов представление тела (обрезанное и без пользовательских данных).
+
+    :param body: Строка, байты или JSON-совместимый объект.
+    :param limit: Максимальная длина (по умолчанию LOG_BODY_LIMIT).
+    """
+    return BodyPreview(body, limit)
+
+
+class JsonFormatter(logging.Formatter):
+    """Структурированные записи: время, уровень, логгер, сообщение и поля из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key != 'sampled':
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей уровня INFO и ниже с пометкой sampled."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno > logging.INFO or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке: сообщение собирается
+    уже в потоке QueueListener, а в очередь кладётся запись с исходными аргументами.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            # Трассировку нужно снять сейчас: объект исключения может измениться
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        # msg и args не трогаем: строка (и BodyPreview) собирается в потоке записи,
+        # поэтому в args нельзя передавать объекты, которые потом изменяются
+        return record
+
+
+def _build_handlers(log_file: Optional[str], fmt: str) -> List[logging.Handler]:
+    formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def setup_logging(
+    log_file: Optional[str] = None,
+    level: str = LOG_LEVEL,
+    fmt: str = LOG_FORMAT,
+    sample_rate: float = LOG_SAMPLE_RATE
+) -> None:
+    """
+    Настраивает корневой логгер: записи кладутся в очередь и выводятся фоновым
+    потоком QueueListener, так что запись на диск не блокирует обработку запросов.
+
+    :param log_file: Необязательный файл журнала (в дополнение к stderr).
+    :param level: Уровень логирования.
+    :param fmt: 'text' или 'json'.
+    :param sample_rate: Доля записей с пометкой sampled, попадающих в лог.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    handlers = _build_handlers(log_file, fmt)
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = _LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+
+    def _after_fork_in_child() -> None:
+        # В дочернем процессе (пул разбора) нет потока-слушателя — пишем напрямую
+        global _listener
+        _listener = None
+        root.removeHandler(queue_handler)
+        for handler in handlers:
+            handler.addFilter(SamplingFilter(sample_rate))
+            root.addHandler(handler)
+
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
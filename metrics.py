@@ -0,0 +1,330 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# METRICS_ENABLED=0 отключает сбор: декораторы возвращают функции без обёртки
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+# Границы корзин гистограмм задержек, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}' for key, value in items]
+
+
+class Gauge(Counter):
+    """Значение, которое может как расти, так и уменьшаться."""
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами (накопительные счётчики, как в Prometheus)."""
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # На набор меток: [счётчики по корзинам (последняя — +Inf), сумма]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        bucket_labels = self.label_names + ('le',)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(bucket_labels, key + (_format_value(bound),))} {cumulative}'
+                )
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class _Collected(_Metric):
+    """Метрика, значения которой читаются из функции в момент запроса /metrics."""
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        labels: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Sequence[Any], float]]]
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.label_names, values)} {_format_value(value)}'
+            for values, value in self.collect()
+        ]
+
+
+class Registry:
+    """Набор метрик приложения с выводом в текстовом формате Prometheus."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f'Metric {metric.name} is already registered with another type or labels')
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def collector(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        labels: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[Sequence[Any], float]]]
+    ) -> None:
+        """
+        Регистрирует метрику, вычисляемую при каждом запросе /metrics (статистика кэша, очередей).
+
+        :param name: Имя метрики.
+        :param kind: 'counter' или 'gauge'.
+        :param help_text: Описание.
+        :param labels: Имена меток.
+        :param collect: Функция, возвращающая пары (значения меток, значение).
+        """
+        self._register(_Collected(name, kind, help_text, labels, collect))
+
+    def render(self) -> str:
+        """
+        :return: Все метрики в текстовом формате Prometheus.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.render()
+            except Exception:
+                # Сбой одного сборщика не должен ломать весь ответ /metrics
+                continue
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    'linebot_stage_duration_seconds', 'Длительность этапов обработки запроса', ('stage',)
+)
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    'linebot_stage_in_flight', 'Число выполняющихся в данный момент этапов', ('stage',)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    'linebot_stage_errors_total', 'Исключения, вышедшие из этапа обработки', ('stage', 'error')
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'linebot_upstream_errors_total', 'Ошибки обращений к внешним сервисам', ('service', 'error')
+)
+
+
+@contextmanager
+def _stage_timer(stage: str) -> Iterator[None]:
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        STAGE_ERRORS.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage=stage)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+
+@contextmanager
+def _noop_timer(stage: str) -> Iterator[None]:
+    yield
+
+
+def stage_timer(stage: str):
+    """
+    Контекстный менеджер замера этапа: гистограмма длительности, число выполняющихся
+    и счётчик исключений. При METRICS_ENABLED=0 ничего не измеряет.
+
+    :param stage: Имя этапа (метка stage).
+    """
+    return _stage_timer(stage) if METRICS_ENABLED else _noop_timer(stage)
+
+
+def timed(stage: Optional[str] = None) -> Callable:
+    """
+    Декоратор замера функции как этапа stage (по умолчанию — имя функции).
+    При METRICS_ENABLED=0 возвращает исходную функцию без обёртки.
+
+    :param stage: Имя этапа.
+    :return: Декоратор.
+    """
+    def decorator(func: Callable) -> Callable:
+        if not METRICS_ENABLED:
+            return func
+        name = stage or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _stage_timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_upstream_error(service: str, error: BaseException) -> None:
+    """
+    Учитывает ошибку внешнего сервиса, обработанную без выброса исключения.
+
+    :param service: Имя сервиса ('openai', 'translate', 'parse', 'line').
+    :param error: Пойманное исключение.
+    """
+    if METRICS_ENABLED:
+        UPSTREAM_ERRORS.inc(service=service, error=type(error).__name__)
+
+
+def register_stats(name: str, help_text: str, label: str, stats: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+    """
+    Публикует счётчики stats() компонентов (пулов, кэшей, SingleFlight) как gauge-метрику
+    с метками <label> и 'field'. Значения читаются при каждом запросе /metrics.
+
+    :param name: Имя метрики.
+    :param help_text: Описание.
+    :param label: Имя метки, различающей источники (пространство имён кэша, команду, пул).
+    :param stats: Функция, возвращающая {источник: {поле: число}}.
+    """
+    def collect():
+        for source, fields in stats().items():
+            for field, value in fields.items():
+                if isinstance(value, (int, float)):
+                    yield (source, field), value
+    REGISTRY.collector(name, 'gauge', help_text, (label, 'field'), collect)
+
+
+def install_metrics_endpoint(app, path: str = '/metrics', registry: Registry = REGISTRY) -> None:
+    """
+    Добавляет во Flask-приложение точку выдачи метрик в формате Prometheus.
+
+    :param app: Flask-приложение.
+    :param path: URL точки.
+    :param registry: Реестр метрик.
+    """
+    from flask import Response
+
+    def metrics_view():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule(path, 'metrics', metrics_view, methods=['GET'])
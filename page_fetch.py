@@ -0,0 +1,181 @@
+import codecs
+import logging
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Типы содержимого, которые имеет смысл разбирать как HTML
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# Теги, открытие которых неявно закрывает <p> (по спецификации HTML)
+_P_CLOSING_TAGS = frozenset({
+    'address', 'article', 'aside', 'blockquote', 'details', 'div', 'dl', 'fieldset',
+    'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hgroup', 'hr', 'main', 'menu', 'nav', 'ol', 'pre', 'section', 'table', 'ul',
+})
+_SKIPPED_TAGS = frozenset({'script', 'style', 'template'})
+
+
+class UnsupportedContentError(Exception):
+    """Ответ сервера не является HTML-документом."""
+
+
+class ParagraphExtractor(HTMLParser):
+    """
+    Потоковый извлекатель текста из тегов <p>.
+
+    Принимает HTML по частям через feed() и не строит DOM: хранится только текст
+    уже найденных абзацев. После набора max_chars символов устанавливается флаг done.
+    """
+
+    def __init__(self, max_chars: int = 1000) -> None:
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.paragraphs: List[str] = []
+        self.done = False
+        self._length = 0
+        self._current: Optional[List[str]] = None
+        self._skip_depth = 0
+
+    @property
+    def text(self) -> str:
+        """Найденные абзацы, разделённые переводом строки."""
+        return '\n'.join(self.paragraphs)
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == 'p' or tag in _P_CLOSING_TAGS:
+            self._finish_paragraph()
+            if tag == 'p':
+                self._current = []
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == 'p':
+            self._finish_paragraph()
+
+    def handle_data(self, data: str) -> None:
+        if self._current is not None and not self._skip_depth:
+            stripped = data.strip()
+            if stripped:
+                self._current.append(stripped)
+
+    def close(self) -> None:
+        super().close()
+        self._finish_paragraph()
+
+    def _finish_paragraph(self) -> None:
+        if self._current is None:
+            return
+        paragraph = ''.join(self._current)
+        self._current = None
+        if paragraph and not self.done:
+            self.paragraphs.append(paragraph)
+            self._length += len(paragraph) + 1
+            if self._length >= self.max_chars:
+                self.done = True
+
+
+def _html_decoder(url: str, headers, encoding: Optional[str], max_bytes: int) -> codecs.IncrementalDecoder:
+    """
+    Проверяет заголовки ответа и создаёт инкрементальный декодер тела.
+
+    :raises UnsupportedContentError: Если ответ не является HTML.
+    """
+    content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type and content_type not in HTML_CONTENT_TYPES:
+        raise UnsupportedContentError(f'Unsupported content type: {content_type}')
+
+    declared_length = headers.get('Content-Length')
+    if declared_length and declared_length.isdigit() and int(declared_length) > max_bytes:
+        logger.info(f"Страница {url} больше лимита ({declared_length} байт), читаем первые {max_bytes}")
+
+    # Без явного charset считаем страницу UTF-8 (requests подставил бы ISO-8859-1)
+    has_charset = 'charset=' in headers.get('Content-Type', '').lower()
+    encoding = encoding if has_charset and encoding else 'utf-8'
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+def fetch_paragraph_text(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 10,
+    max_bytes: int = 2 * 1024 * 1024,
+    max_chars: int = 1000,
+    chunk_size: int = 16 * 1024,
+    session=requests
+) -> str:
+    """
+    Загружает страницу потоково и извлекает текст абзацев, не загружая документ целиком.
+
+    Чтение прекращается, как только набрано max_chars символов или прочитано max_bytes байт.
+
+    :param url: URL страницы.
+    :param headers: Заголовки запроса.
+    :param timeout: Таймаут запроса в секундах.
+    :param max_bytes: Максимальный объём загружаемых данных.
+    :param max_chars: Сколько символов текста достаточно для ответа.
+    :param chunk_size: Размер читаемого блока.
+    :param session: Объект с методом get() (requests или requests.Session).
+    :return: Текст абзацев, разделённых переводом строки.
+    :raises UnsupportedContentError: Если ответ не является HTML.
+    :raises requests.RequestException: При ошибке запроса.
+    """
+    response = session.get(url, headers=headers, timeout=timeout, stream=True)
+    try:
+        response.raise_for_status()
+        decoder = _html_decoder(url, response.headers, response.encoding, max_bytes)
+        extractor = ParagraphExtractor(max_chars=max_chars)
+        received = 0
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            received += len(chunk)
+            extractor.feed(decoder.decode(chunk))
+            if extractor.done or received >= max_bytes:
+                break
+        else:
+            extractor.feed(decoder.decode(b'', final=True))
+        extractor.close()
+        return extractor.text
+    finally:
+        response.close()
+
+
+async def fetch_paragraph_text_async(
+    session,
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 10,
+    max_bytes: int = 2 * 1024 * 1024,
+    max_chars: int = 1000,
+    chunk_size: int = 16 * 1024
+) -> str:
+    """
+    Асинхронный вариант fetch_paragraph_text поверх aiohttp.ClientSession.
+
+    :param session: Сессия aiohttp.
+    :return: Текст абзацев, разделённых переводом строки.
+    :raises UnsupportedContentError: Если ответ не является HTML.
+    :raises aiohttp.ClientError: При ошибке запроса.
+    """
+    async with session.get(url, headers=headers, timeout=timeout) as response:
+        response.raise_for_status()
+        decoder = _html_decoder(url, response.headers, response.charset, max_bytes)
+        extractor = ParagraphExtractor(max_chars=max_chars)
+        received = 0
+        async for chunk in response.content.iter_chunked(chunk_size):
+            received += len(chunk)
+            extractor.feed(decoder.decode(chunk))
+            if extractor.done or received >= max_bytes:
+                break
+        else:
+            extractor.feed(decoder.decode(b'', final=True))
+        extractor.close()
+        return extractor.text
@@ -1,92 +1,132 @@
+import argparse
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
 import time
-import random
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("parser.log"),
-        logging.StreamHandler()
-    ]
-)
+from crawl_state import NOT_MODIFIED, CrawlState, content_hash
+from crawler import CrawlEngine, HostThrottle, backoff_delay
+from extraction import extract_products
+from http_client import HostPolicy, PooledSession
+from logging_setup import SAMPLED, setup_logging
+from product_index import ProductDeduplicator, ProductIndex
+from sinks import SINK_FORMATS, open_sink
 
-def get_page(session: requests.Session, url: str, headers: Dict[str, str], retries: int = 3) -> Optional[str]:
+# Статусы, при которых сервер просит повторить запрос позже
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def get_page(
+    session: requests.Session,
+    url: str,
+    headers: Dict[str, str],
+    retries: int = 3,
+    throttle: Optional[HostThrottle] = None,
+    state: Optional[CrawlState] = None
+):
     """
     Получает HTML-страницу по заданному URL с заданным числом попыток.
+    Между попытками выдерживается экспоненциальная задержка со случайной добавкой.
+    При наличии state отправляется условный запрос (If-None-Match / If-Modified-Since).
     
     :param session: Объект requests.Session для выполнения запроса.
     :param url: URL страницы для запроса.
     :param headers: Заголовки для запроса.
-    :param retries: Количество оставшихся попыток.
-    :return: HTML-текст страницы или None в случае ошибки.
+    :param retries: Количество повторных попыток.
+    :param throttle: Ограничитель частоты запросов к хосту.
+    :param state: Хранилище состояния обхода.
+    :return: HTML-текст страницы, NOT_MODIFIED, если страница не изменилась, или None в случае ошибки.
     """
-    try:
-        response = session.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        logging.info(f"Успешно получена страница: {url}")
-        return response.text
-    except requests.RequestException as e:
-        if retries > 0:
-            logging.warning(f"Ошибка при запросе {url}: {e}. Повторная попытка ({retries})...")
-            time.sleep(2)
-            return get_page(session, url, headers, retries - 1)
-        else:
-            logging.error(f"Не удалось получить страницу {url} после нескольких попыток.")
-            return None
+    if state is not None:
+        headers = {**headers, **state.conditional_headers(url)}
+    for attempt in range(retries + 1):
+        try:
+            if throttle is not None:
+                with throttle.slot(url):
+                    response = session.get(url, headers=headers, timeout=10)
+            else:
+                response = session.get(url, headers=headers, timeout=10)
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                retry_after = response.headers.get('Retry-After', '')
+                delay = float(retry_after) if retry_after.isdigit() else backoff_delay(attempt, base=2.0)
+                logging.warning(f"Сервер вернул {response.status_code} для {url}, повтор через {delay:.1f} с")
+                if throttle is not None:
+                    throttle.penalize(url, delay)
+                else:
+                    time.sleep(delay)
+                continue
+            if response.status_code == 304 and state is not None:
+                logging.info("Страница не изменилась: %s", url, extra=SAMPLED)
+                return NOT_MODIFIED
+            response.raise_for_status()
+            if state is not None and not state.record_response(
+                url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                content_hash(response.content)
+            ):
+                logging.info("Содержимое страницы не изменилось: %s", url, extra=SAMPLED)
+                return NOT_MODIFIED
+            logging.info("Успешно получена страница: %s", url, extra=SAMPLED)
+            return response.text
+        except requests.RequestException as e:
+            if attempt < retries:
+                delay = backoff_delay(attempt, base=2.0)
+                logging.warning(f"Ошибка при запросе {url}: {e}. Повторная попытка ({retries - attempt}) через {delay:.1f} с...")
+                time.sleep(delay)
+    logging.error(f"Не удалось получить страницу {url} после нескольких попыток.")
+    if state is not None:
+        state.mark_failed(url)
+    return None
 
 def parse_page(html: str) -> List[Dict[str, str]]:
     """
     Парсит HTML-страницу, извлекая данные о продуктах.
+    Недостающие необязательные поля сохраняются как None, см. extraction.PRODUCT_FIELDS.
     
     :param html: HTML-код страницы.
     :return: Список словарей с данными о продуктах.
     """
-    soup = BeautifulSoup(html, 'lxml')
-    products = []
-    
-    for item in soup.find_all('div', class_='product-item'):
-        try:
-            name = item.find('h2', class_='product-name').get_text(strip=True)
-            price = item.find('span', class_='price').get_text(strip=True)
-            image_url = item.find('img', class_='product-image')['src']
-            product_url = item.find('a', class_='product-link')['href']
-            
-            products.append({
-                'name': name,
-                'price': price,
-                'image_url': image_url,
-                'product_url': product_url
-            })
-        except (AttributeError, TypeError) as e:
-            logging.warning(f"Не удалось спарсить элемент: {e}")
-            continue
-    return products
+    return extract_products(html)
 
-def save_to_csv(data: List[Dict[str, str]], filename: str) -> None:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     """
-    Сохраняет данные в CSV-файл.
-    
-    :param data: Список словарей с данными о продуктах.
-    :param filename: Имя файла для сохранения.
+    Разбирает аргументы командной строки.
+
+    :param argv: Список аргументов (по умолчанию sys.argv).
+    :return: Пространство имён с параметрами обхода.
     """
-    try:
-        df = pd.DataFrame(data)
-        df.to_csv(filename, index=False, encoding='utf-8-sig')
-        logging.info(f"Данные успешно сохранены в {filename}")
-    except Exception as e:
-        logging.error(f"Ошибка при сохранении данных в CSV: {e}")
+    arg_parser = argparse.ArgumentParser(description='Парсер каталога продуктов.')
+    arg_parser.add_argument('--base-url', default='https://example.com/products?page={}',
+                            help='Шаблон URL страницы каталога с {} вместо номера страницы')
+    arg_parser.add_argument('--pages', type=int, default=10, help='Количество страниц для парсинга')
+    arg_parser.add_argument('--start-page', type=int, default=1, help='Номер первой страницы')
+    arg_parser.add_argument('--workers', type=int, default=4, help='Количество параллельных загрузок')
+    arg_parser.add_argument('--rps', type=float, default=1.0, help='Запросов в секунду к одному хосту')
+    arg_parser.add_argument('--host-concurrency', type=int, default=2,
+                            help='Одновременных запросов к одному хосту')
+    arg_parser.add_argument('--retries', type=int, default=3, help='Повторных попыток на страницу')
+    arg_parser.add_argument('--output', default='products.csv', help='Файл для сохранения результатов')
+    arg_parser.add_argument('--format', choices=sorted(SINK_FORMATS),
+                            help='Формат вывода (по умолчанию по расширению файла)')
+    arg_parser.add_argument('--checkpoint-every', type=int, default=50,
+                            help='Через сколько страниц сбрасывать данные на диск (fsync)')
+    arg_parser.add_argument('--state', help='Файл SQLite с состоянием обхода (условные запросы, возобновление)')
+    arg_parser.add_argument('--resume', action='store_true',
+                            help='Продолжить прерванный обход (требует --state), результаты дописываются')
+    arg_parser.add_argument('--bloom-capacity', type=int,
+                            help='Отсеивать повторы фильтром Блума на столько продуктов (для очень больших каталогов)')
+    arg_parser.add_argument('--index', help='Файл SQLite с индексом продуктов для сравнения с прошлым обходом')
+    arg_parser.add_argument('--diff', help='Файл JSON Lines для изменений относительно прошлого обхода (требует --index)')
+    return arg_parser.parse_args(argv)
+
 
-def main() -> None:
+def main(argv: Optional[List[str]] = None) -> None:
     """
     Основная функция для парсинга страниц сайта и сохранения данных в CSV.
     """
-    base_url = 'https://example.com/products?page={}'
+    # Настройка логирования: запись в parser.log и на консоль выполняет фоновый поток.
+    # Здесь, а не при импорте, чтобы get_page и parse_page можно было импортировать без побочных эффектов.
+    setup_logging(log_file='parser.log')
+    args = parse_args(argv)
     headers = {
         'User-Agent': (
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
@@ -95,28 +135,80 @@ def main() -> None:
         )
     }
     
-    total_pages = 10  # Количество страниц для парсинга; можно сделать параметром командной строки или переменной окружения
-    all_products: List[Dict[str, str]] = []
+    throttle = HostThrottle(rate=args.rps, concurrency=args.host_concurrency)
+    urls = [args.base_url.format(page) for page in range(args.start_page, args.start_page + args.pages)]
+    state = CrawlState(args.state) if args.state else None
+    if state is not None:
+        state.start_run(resume=args.resume)
+        urls = state.pending(urls)
+    sink_options = {'append': True} if args.resume else {}
+    dedup = ProductDeduplicator(bloom_capacity=args.bloom_capacity)
+    index = ProductIndex(args.index) if args.index else None
+    if index is not None:
+        index.start_run(resume=args.resume)
     
-    # Создание сессии для повторного использования HTTP-соединения
-    with requests.Session() as session:
-        for page in range(1, total_pages + 1):
-            url = base_url.format(page)
-            logging.info(f"Парсинг страницы {page}: {url}")
-            html = get_page(session, url, headers)
-            if html:
-                products = parse_page(html)
-                all_products.extend(products)
-                logging.info(f"Найдено продуктов на странице {page}: {len(products)}")
+    # Общая сессия с пулом соединений на все рабочие потоки
+    with PooledSession(policies={}, default=HostPolicy(pool_maxsize=args.workers)) as session, \
+            open_sink(args.output, args.format, **sink_options) as sink:
+        engine = CrawlEngine(
+            fetch=lambda url: get_page(session, url, headers, retries=args.retries, throttle=throttle, state=state),
+            parse=parse_page,
+            workers=args.workers
+        )
+        started = time.monotonic()
+        # Страницы отмечаются обработанными только после fsync их строк, чтобы --resume не терял данные.
+        # Для неизменившейся страницы вместо продуктов None: они уже сохранены в state.
+        uncommitted: List[Tuple[str, Optional[List[Dict[str, str]]]]] = []
+
+        def emit(url: str, products: List[Dict[str, str]]) -> None:
+            unique = dedup.filter(products, url)
+            if index is not None:
+                unique = index.observe(url, unique)
+            sink.write(unique)
+
+        for done, (url, products) in enumerate(engine.run(urls), start=1):
+            if products is NOT_MODIFIED:
+                # Продукты неизменившейся страницы берутся из прошлого разбора, чтобы файл был полным
+                stored = state.page_products(url)
+                if stored is not None:
+                    emit(url, stored)
+                else:
+                    logging.warning(f"Нет сохранённых продуктов для неизменившейся страницы {url}")
+                    if index is not None:
+                        index.touch_page(url)
+                uncommitted.append((url, None))
+            elif products is not None:
+                emit(url, products)
+                uncommitted.append((url, products))
+                logging.info("Найдено продуктов на странице %s: %d (%d/%d)", url, len(products), done, len(urls),
+                             extra=SAMPLED)
             else:
-                logging.warning(f"Пропуск страницы {page} из-за ошибки загрузки.")
-            
-            # Случайная задержка между запросами для избежания блокировок
-            time.sleep(random.uniform(1, 3))
+                logging.warning(f"Пропуск страницы {url} из-за ошибки загрузки.")
+                # Продукты страницы не должны попасть в удалённые только из-за сбоя загрузки
+                if index is not None:
+                    index.touch_page(url)
+            if done % args.checkpoint_every == 0 or done == len(urls):
+                sink.checkpoint()
+                if state is not None:
+                    for page_url, page_products in uncommitted:
+                        if page_products is None:
+                            state.mark_unchanged(page_url)
+                        else:
+                            state.mark_done(page_url, page_products)
+                uncommitted.clear()
+        elapsed = time.monotonic() - started
+        logging.info(f"Обработано страниц: {len(urls)} за {elapsed:.1f} с ({len(urls) / max(elapsed, 1e-9):.2f} стр./с)")
+    if state is not None:
+        state.finish_run()
+    if dedup.stats['duplicates']:
+        logging.info(f"Отброшено повторов продуктов: {dedup.stats['duplicates']}")
+    if index is not None:
+        index.finish_run()
+        if args.diff:
+            counts = index.write_diff(args.diff)
+            logging.info(f"Изменения относительно прошлого обхода ({args.diff}): {counts}")
     
-    if all_products:
-        save_to_csv(all_products, 'products.csv')
-    else:
+    if not sink.rows_written:
         logging.warning("Нет данных для сохранения.")
 
 if __name__ == '__main__':
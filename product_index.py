@@ -0,0 +1,353 @@
+import hashlib
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from cache import canonical_url
+from sinks import parse_price
+
+logger = logging.getLogger(__name__)
+
+# Параметры, не влияющие на то, какой товар открывается по ссылке
+_TRACKING_PARAMS = ('utm_', 'gclid', 'fbclid', 'yclid', '_openstat')
+
+
+def normalize_product_url(url: Optional[str], base_url: Optional[str] = None) -> Optional[str]:
+    """
+    Ключ идентичности продукта: абсолютный канонический URL без меток отслеживания
+    и без завершающего '/'.
+
+    :param url: Ссылка на продукт (может быть относительной).
+    :param base_url: URL страницы каталога, на которой найдена ссылка.
+    :return: Нормализованный URL или None, если ссылки нет.
+    """
+    if not url or not url.strip():
+        return None
+    if base_url:
+        url = urljoin(base_url, url.strip())
+    parts = urlsplit(canonical_url(url))
+    query = urlencode([
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith(_TRACKING_PARAMS)
+    ])
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme, parts.netloc, path, query, ''))
+
+
+def product_fingerprint(product: Dict[str, Any]) -> str:
+    """
+    Отпечаток содержимого продукта: меняется при изменении названия, цены или изображения.
+
+    :param product: Словарь из parse_page.
+    :return: 16 шестнадцатеричных символов.
+    """
+    raw = '\x1f'.join(product.get(field) or '' for field in ('name', 'price', 'image_url'))
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+class ExactSeenSet:
+    """Точное множество увиденных ключей: хранит 64-битные хеши вместо строк URL."""
+
+    def __init__(self) -> None:
+        self._seen = set()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def add(self, key: str) -> bool:
+        """
+        :return: True, если ключ встретился впервые.
+        """
+        value = int.from_bytes(_digest(key)[:8], 'little')
+        if value in self._seen:
+            return False
+        self._seen.add(value)
+        return True
+
+
+class BloomFilter:
+    """
+    Фильтр Блума для очень больших каталогов: память фиксирована и не зависит от длины URL.
+    Ложные срабатывания (новый продукт принят за дубликат) возможны с вероятностью error_rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-6) -> None:
+        """
+        :param capacity: Ожидаемое число уникальных продуктов.
+        :param error_rate: Допустимая доля ложных срабатываний при заполнении до capacity.
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be >= 1')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # Двойное хеширование (Kirsch–Mitzenmacher): k позиций из двух 64-битных хешей
+        digest = _digest(key)
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> bool:
+        """
+        :return: True, если ключ (вероятно) встретился впервые.
+        """
+        added = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            mask = 1 << bit
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                added = True
+        if added:
+            self._count += 1
+        return added
+
+
+class ProductDeduplicator:
+    """
+    Отсеивает повторы продуктов в пределах одного обхода (товар на нескольких страницах
+    или сдвинувшийся между страницами во время обхода). Ключ — нормализованный product_url.
+    """
+
+    def __init__(self, bloom_capacity: Optional[int] = None, error_rate: float = 1e-6) -> None:
+        """
+        :param bloom_capacity: Если задано — фильтр Блума на столько продуктов, иначе точное множество.
+        :param error_rate: Доля ложных срабатываний фильтра Блума.
+        """
+        self._seen = BloomFilter(bloom_capacity, error_rate) if bloom_capacity else ExactSeenSet()
+        self.stats = {'seen': 0, 'duplicates': 0}
+
+    def filter(self, products: Iterable[Dict[str, Any]], base_url: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        :param products: Продукты со страницы.
+        :param base_url: URL страницы для разрешения относительных ссылок.
+        :return: Продукты, ещё не встречавшиеся в этом обходе.
+        """
+        unique = []
+        for product in products:
+            key = normalize_product_url(product.get('product_url'), base_url)
+            self.stats['seen'] += 1
+            if key is not None and not self._seen.add(key):
+                self.stats['duplicates'] += 1
+                continue
+            unique.append(product)
+        return unique
+
+
+class ProductChange(NamedTuple):
+    change: str
+    # Нормализованный URL продукта
+    product_url: str
+    name: Optional[str]
+    old_price: Optional[float]
+    price: Optional[float]
+
+
+class ProductIndex:
+    """
+    Индекс продуктов между обходами в SQLite: ключ, отпечаток, цена, страница
+    и номера обходов, в которых продукт появился и был замечен последний раз.
+    По нему строится разница с прошлым обходом (новые, исчезнувшие, изменившиеся в цене)
+    без загрузки прошлого результата в память.
+
+    Таблицы не пересекаются с CrawlState, поэтому можно использовать тот же файл.
+    """
+
+    CHANGE_NEW = 'new'
+    CHANGE_REMOVED = 'removed'
+    CHANGE_PRICE = 'price_changed'
+    CHANGE_CONTENT = 'changed'
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Путь к файлу базы данных.
+        """
+        self.path = path
+        self._local = threading.local()
+        self.run_id: Optional[int] = None
+        self.previous_run_id: Optional[int] = None
+        conn = self._connection()
+        conn.executescript(
+            'CREATE TABLE IF NOT EXISTS products ('
+            ' key TEXT PRIMARY KEY, name TEXT, fingerprint TEXT NOT NULL,'
+            ' price REAL, old_price REAL, page_url TEXT, first_seen_run INTEGER NOT NULL,'
+            ' last_seen_run INTEGER NOT NULL, changed_run INTEGER, change TEXT);'
+            'CREATE INDEX IF NOT EXISTS products_page ON products (page_url);'
+            'CREATE INDEX IF NOT EXISTS products_last_seen ON products (last_seen_run);'
+            'CREATE TABLE IF NOT EXISTS product_runs ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT, started_at REAL NOT NULL, finished_at REAL);'
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def start_run(self, resume: bool = False) -> int:
+        """
+        Начинает обход или продолжает последний незавершённый.
+
+        :param resume: Продолжить незавершённый обход, если он есть.
+        :return: Номер текущего обхода.
+        """
+        conn = self._connection()
+        row = None
+        if resume:
+            row = conn.execute(
+                'SELECT id FROM product_runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1'
+            ).fetchone()
+        if row is None:
+            cursor = conn.execute('INSERT INTO product_runs (started_at) VALUES (?)', (time.time(),))
+            conn.commit()
+            self.run_id = cursor.lastrowid
+        else:
+            self.run_id = row[0]
+            logger.info(f"Продолжение индекса продуктов, обход #{self.run_id}")
+        previous = conn.execute(
+            'SELECT MAX(id) FROM product_runs WHERE finished_at IS NOT NULL AND id < ?', (self.run_id,)
+        ).fetchone()
+        self.previous_run_id = previous[0]
+        return self.run_id
+
+    def finish_run(self) -> None:
+        """Отмечает текущий обход завершённым."""
+        conn = self._connection()
+        conn.execute('UPDATE product_runs SET finished_at = ? WHERE id = ?', (time.time(), self.run_id))
+        conn.commit()
+
+    def observe(self, page_url: str, products: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Записывает продукты страницы в индекс.
+
+        :param page_url: URL страницы каталога.
+        :param products: Продукты со страницы.
+        :return: Продукты, ещё не встречавшиеся в текущем обходе (в том числе до --resume).
+        """
+        if self.run_id is None:
+            raise RuntimeError('start_run() must be called first')
+        keyed = {}
+        for product in products:
+            key = normalize_product_url(product.get('product_url'), page_url)
+            if key is not None and key not in keyed:
+                keyed[key] = product
+        if not keyed:
+            return []
+        conn = self._connection()
+        known = {}
+        keys = list(keyed)
+        # Ограничение SQLite на число параметров запроса
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            known.update(
+                (row[0], row[1:]) for row in conn.execute(
+                    'SELECT key, fingerprint, price, last_seen_run, page_url FROM products '
+                    f"WHERE key IN ({', '.join('?' * len(chunk))})", chunk
+                )
+            )
+        unique, inserts, updates = [], [], []
+        for key, product in keyed.items():
+            fingerprint = product_fingerprint(product)
+            price = parse_price(product.get('price'))
+            row = known.get(key)
+            if row is None:
+                inserts.append((
+                    key, product.get('name'), fingerprint, price,
+                    page_url, self.run_id, self.run_id
+                ))
+            elif row[2] == self.run_id:
+                # Та же страница повторно после --resume: строки могли не попасть в файл до сбоя
+                if row[3] == page_url:
+                    unique.append(product)
+                continue
+            elif row[0] != fingerprint:
+                change = self.CHANGE_PRICE if row[1] != price else self.CHANGE_CONTENT
+                updates.append((
+                    product.get('name'), fingerprint, price, row[1], page_url,
+                    self.run_id, self.run_id, change, key
+                ))
+            else:
+                updates.append((product.get('name'), fingerprint, price, None, page_url, self.run_id, None, None, key))
+            unique.append(product)
+        conn.executemany(
+            'INSERT INTO products (key, name, fingerprint, price, page_url, first_seen_run, last_seen_run) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', inserts
+        )
+        conn.executemany(
+            'UPDATE products SET name = ?, fingerprint = ?, price = ?, old_price = ?, page_url = ?, '
+            'last_seen_run = ?, changed_run = ?, change = ? WHERE key = ?', updates
+        )
+        conn.commit()
+        return unique
+
+    def touch_page(self, page_url: str) -> None:
+        """
+        Страница не изменилась с прошлого обхода или не загрузилась в этом — её продукты
+        считаются замеченными и в этом обходе, а не удалёнными.
+
+        :param page_url: URL страницы каталога.
+        """
+        conn = self._connection()
+        conn.execute(
+            'UPDATE products SET last_seen_run = ?, changed_run = NULL, change = NULL '
+            'WHERE page_url = ? AND last_seen_run < ?',
+            (self.run_id, page_url, self.run_id)
+        )
+        conn.commit()
+
+    def diff(self) -> Iterator[ProductChange]:
+        """
+        Изменения текущего обхода относительно предыдущего завершённого.
+        Читает базу курсором, не загружая весь каталог в память.
+        """
+        conn = self._connection()
+        params = {'run': self.run_id, 'new': self.CHANGE_NEW}
+        yield from map(ProductChange._make, conn.execute(
+            'SELECT :new, key, name, NULL, price FROM products WHERE first_seen_run = :run '
+            'UNION ALL '
+            'SELECT change, key, name, old_price, price FROM products '
+            'WHERE changed_run = :run AND first_seen_run < :run', params
+        ))
+        if self.previous_run_id is not None:
+            yield from map(ProductChange._make, conn.execute(
+                'SELECT ?, key, name, price, NULL FROM products WHERE last_seen_run = ?',
+                (self.CHANGE_REMOVED, self.previous_run_id)
+            ))
+
+    def write_diff(self, path: str) -> Dict[str, int]:
+        """
+        Записывает изменения в файл JSON Lines.
+
+        :param path: Путь к файлу.
+        :return: Число изменений по типам.
+        """
+        counts = {self.CHANGE_NEW: 0, self.CHANGE_REMOVED: 0, self.CHANGE_PRICE: 0, self.CHANGE_CONTENT: 0}
+        with open(path, 'w', encoding='utf-8') as file:
+            for change in self.diff():
+                counts[change.change] += 1
+                file.write(json.dumps(change._asdict(), ensure_ascii=False) + '\n')
+        return counts
@@ -0,0 +1,207 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Limit(NamedTuple):
+    """Проверка одного «ведра с токенами»."""
+    key: str
+    # Скорость пополнения, токенов в секунду
+    rate: float
+    # Ёмкость ведра (допустимый всплеск)
+    capacity: float
+    # Сколько токенов списывает запрос
+    cost: float = 1.0
+
+
+def per_minute(key: str, limit: float, cost: float = 1.0) -> Limit:
+    """
+    Лимит вида «limit единиц в минуту» с всплеском до limit единиц.
+
+    :param key: Ключ ведра (например, 'user:U123:ask').
+    :param limit: Допустимое количество единиц в минуту.
+    :param cost: Стоимость текущего запроса.
+    """
+    return Limit(key, limit / 60.0, float(limit), cost)
+
+
+# Как часто удалять заполнившиеся вёдра, секунды
+PRUNE_INTERVAL = 60.0
+
+
+def _refill(tokens: float, updated: float, now: float, limit: Limit) -> float:
+    return min(limit.capacity, tokens + max(0.0, now - updated) * limit.rate)
+
+
+def _full_at(tokens: float, now: float, limit: Limit) -> float:
+    """Момент, когда ведро снова заполнится; заполненное ведро не отличается от отсутствующего."""
+    if limit.rate <= 0:
+        return float('inf')
+    return now + max(0.0, limit.capacity - tokens) / limit.rate
+
+
+class MemoryBucketStore:
+    """
+    Вёдра в памяти процесса. Раз в prune_interval секунд заполнившиеся вёдра удаляются,
+    чтобы словарь не рос с числом пользователей и групп.
+    """
+
+    def __init__(self, prune_interval: float = PRUNE_INTERVAL) -> None:
+        """
+        :param prune_interval: Период удаления заполнившихся вёдер, секунды.
+        """
+        # key -> (токены, время обновления, время заполнения)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self.prune_interval = prune_interval
+        self._next_prune = time.time() + prune_interval
+
+    def acquire(self, limits: Sequence[Limit]) -> bool:
+        """
+        Списывает токены сразу из всех вёдер либо не списывает ничего.
+
+        :param limits: Проверяемые лимиты.
+        :return: True, если запрос укладывается во все лимиты.
+        """
+        now = time.time()
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            levels = []
+            for limit in limits:
+                tokens, updated, _ = self._buckets.get(limit.key, (limit.capacity, now, now))
+                level = _refill(tokens, updated, now, limit)
+                if level < limit.cost:
+                    return False
+                levels.append(level)
+            for limit, level in zip(limits, levels):
+                tokens = level - limit.cost
+                self._buckets[limit.key] = (tokens, now, _full_at(tokens, now, limit))
+        return True
+
+    def _prune(self, now: float) -> None:
+        self._next_prune = now + self.prune_interval
+        full = [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]
+        for key in full:
+            del self._buckets[key]
+
+
+class SQLiteBucketStore:
+    """
+    Вёдра в общем SQLite-файле: несколько процессов-воркеров соблюдают один бюджет.
+    Проверка и списание выполняются в одной транзакции BEGIN IMMEDIATE.
+    Каждый процесс раз в prune_interval секунд удаляет строки заполнившихся вёдер.
+    """
+
+    def __init__(self, path: str, prune_interval: float = PRUNE_INTERVAL) -> None:
+        """
+        :param path: Путь к файлу базы данных.
+        :param prune_interval: Период удаления заполнившихся вёдер, секунды.
+        """
+        self.path = path
+        self.prune_interval = prune_interval
+        self._next_prune = time.time() + prune_interval
+        self._prune_lock = threading.Lock()
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL DEFAULT 0)'
+        )
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(buckets)')}
+        if 'full_at' not in columns:
+            # Файл от прежней версии: старые строки считаются заполнившимися и удаляются при очистке
+            conn.execute('ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, limits: Sequence[Limit]) -> bool:
+        """
+        Списывает токены сразу из всех вёдер либо не списывает ничего.
+
+        :param limits: Проверяемые лимиты.
+        :return: True, если запрос укладывается во все лимиты.
+        """
+        conn = self._connection()
+        self._maybe_prune(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            levels = []
+            for limit in limits:
+                row = conn.execute(
+                    'SELECT tokens, updated FROM buckets WHERE key = ?', (limit.key,)
+                ).fetchone()
+                tokens, updated = row if row else (limit.capacity, now)
+                level = _refill(tokens, updated, now, limit)
+                if level < limit.cost:
+                    conn.execute('ROLLBACK')
+                    return False
+                levels.append(level)
+            conn.executemany(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                [
+                    (limit.key, level - limit.cost, now, _full_at(level - limit.cost, now, limit))
+                    for limit, level in zip(limits, levels)
+                ]
+            )
+            conn.execute('COMMIT')
+            return True
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _maybe_prune(self, conn: sqlite3.Connection) -> None:
+        now = time.time()
+        with self._prune_lock:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + self.prune_interval
+        try:
+            conn.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось удалить заполнившиеся вёдра: {e}")
+
+
+class RateLimiter:
+    """Ограничитель запросов на основе token bucket с подсчётом отказов."""
+
+    def __init__(self, store=None) -> None:
+        """
+        :param store: Хранилище вёдер (MemoryBucketStore по умолчанию или SQLiteBucketStore).
+        """
+        self.store = store if store is not None else MemoryBucketStore()
+        self._stats = {'allowed': 0, 'limited': 0}
+        self._lock = threading.Lock()
+
+    def allow(self, *limits: Limit) -> bool:
+        """
+        Проверяет запрос по всем лимитам. При ошибке общего хранилища запрос пропускается.
+
+        :return: True, если запрос разрешён.
+        """
+        try:
+            allowed = self.store.acquire(limits)
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка хранилища лимитов, запрос пропущен: {e}")
+            allowed = True
+        with self._lock:
+            self._stats['allowed' if allowed else 'limited'] += 1
+        return allowed
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Счётчики разрешённых и отклонённых запросов.
+        """
+        with self._lock:
+            return dict(self._stats)
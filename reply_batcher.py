@@ -0,0 +1,96 @@
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ограничение LINE Messaging API: не более 5 сообщений в одном reply-вызове
+MAX_MESSAGES_PER_REPLY = 5
+
+
+class PendingReply(NamedTuple):
+    """Сообщение, которое нужно отправить в ответ на событие."""
+    event_index: int
+    reply_token: str
+    message: Dict[str, Any]
+
+
+class ReplyResult(NamedTuple):
+    """Итог отправки ответа для одного события."""
+    event_index: int
+    reply_token: str
+    ok: bool
+    error: Optional[str] = None
+
+
+def group_replies(replies: List[PendingReply]) -> Tuple[List[Tuple[str, List[PendingReply]]], List[ReplyResult]]:
+    """
+    Группирует сообщения по reply-токену в порядке первого появления токена.
+
+    Reply-токен одноразовый, поэтому сообщения сверх лимита для одного токена
+    не отправляются и сразу помечаются как ошибка.
+
+    :param replies: Список ожидающих отправки сообщений.
+    :return: Пары (токен, сообщения для одного вызова) и результаты для отброшенных сообщений.
+    """
+    groups: 'OrderedDict[str, List[PendingReply]]' = OrderedDict()
+    for reply in replies:
+        groups.setdefault(reply.reply_token, []).append(reply)
+
+    batches = []
+    overflow_results = []
+    for token, group in groups.items():
+        batch, overflow = group[:MAX_MESSAGES_PER_REPLY], group[MAX_MESSAGES_PER_REPLY:]
+        for reply in overflow:
+            overflow_results.append(ReplyResult(
+                reply.event_index, token, False,
+                f'more than {MAX_MESSAGES_PER_REPLY} messages for one reply token'
+            ))
+        batches.append((token, batch))
+    return batches, overflow_results
+
+
+class ReplyBatcher:
+    """
+    Группирует исходящие сообщения по reply-токену (до 5 сообщений на вызов)
+    и отправляет независимые токены параллельно с ограничением числа одновременных запросов.
+    """
+
+    def __init__(self, send: Callable[[str, List[Dict[str, Any]]], Any], max_concurrency: int = 8) -> None:
+        """
+        :param send: Функция send(reply_token, messages), выбрасывающая исключение при ошибке.
+        :param max_concurrency: Максимальное число одновременных вызовов API.
+        """
+        self._send = send
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='line-reply')
+
+    def dispatch(self, replies: List[PendingReply]) -> List[ReplyResult]:
+        """
+        Отправляет ответы и дожидается завершения всех вызовов.
+        Сообщения сверх лимита для одного токена помечаются как ошибка (см. group_replies).
+
+        :param replies: Список ожидающих отправки сообщений.
+        :return: Результаты по каждому событию в порядке следования событий.
+        """
+        batches, results = group_replies(replies)
+        futures = [
+            (batch, self._executor.submit(self._send, token, [r.message for r in batch]))
+            for token, batch in batches
+        ]
+
+        for batch, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Ошибка при отправке ответа ({len(batch)} сообщ.): {e}")
+                results.extend(ReplyResult(r.event_index, r.reply_token, False, str(e)) for r in batch)
+            else:
+                results.extend(ReplyResult(r.event_index, r.reply_token, True) for r in batch)
+
+        results.sort(key=lambda result: result.event_index)
+        return results
+
+    def shutdown(self) -> None:
+        """Дожидается завершения отправок и останавливает потоки."""
+        self._executor.shutdown(wait=True)
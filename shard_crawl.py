@@ -0,0 +1,347 @@
+"""
+Обход каталога на нескольких процессах: диапазон страниц (или список URL) делится на шарды,
+каждый шард загружается и разбирается в отдельном процессе, результаты шардов сливаются
+в один файл без повторов продуктов.
+
+Запуск:
+  python shard_crawl.py --base-url 'https://example.com/products?page={}' --pages 5000 --processes 8
+  python shard_crawl.py --urls urls.txt --processes 4 --output products.jsonl --index index.sqlite3
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, NamedTuple, Optional
+
+from crawler import CrawlEngine, HostThrottle, SharedHostThrottle
+from http_client import HostPolicy, PooledSession
+from logging_setup import setup_logging
+from parser import get_page, parse_page
+from product_index import ProductDeduplicator, ProductIndex
+from sinks import SINK_FORMATS, open_sink
+
+DEFAULT_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/85.0.4183.102 Safari/537.36'
+    )
+}
+
+# Очередь прогресса и общий для процессов ограничитель запросов к хостам (задаются инициализатором пула)
+_progress_queue = None
+_throttle = None
+
+
+class Shard(NamedTuple):
+    """Часть обхода: подряд идущие страницы одного процесса."""
+    index: int
+    urls: List[str]
+
+
+class WorkerOptions(NamedTuple):
+    """Параметры загрузки в рабочем процессе (rps и host_concurrency — на весь обход)."""
+    threads: int
+    rps: float
+    host_concurrency: int
+    retries: int
+    headers: Dict[str, str]
+
+
+class ShardResult(NamedTuple):
+    """Итог шарда: файл с продуктами по страницам и счётчики."""
+    index: int
+    path: str
+    pages: int
+    failed: int
+    products: int
+    elapsed: float
+
+
+def split_shards(urls: List[str], shards: int) -> List[Shard]:
+    """
+    Делит список URL на шарды из подряд идущих страниц; размеры отличаются не больше чем на одну.
+
+    :param urls: URL страниц в порядке обхода.
+    :param shards: Желаемое число шардов (не больше числа страниц).
+    :return: Список непустых шардов.
+    """
+    count = max(1, min(shards, len(urls)))
+    size, extra = divmod(len(urls), count)
+    result, start = [], 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        if end > start:
+            result.append(Shard(index, urls[start:end]))
+        start = end
+    return result
+
+
+def _init_worker(progress_queue, throttle) -> None:
+    global _progress_queue, _throttle
+    _progress_queue = progress_queue
+    _throttle = throttle
+    if not logging.getLogger().handlers:
+        # Процесс запущен через spawn и не унаследовал настройку логирования
+        setup_logging()
+
+
+def run_shard(shard: Shard, part_dir: str, options: WorkerOptions) -> ShardResult:
+    """
+    Загружает и разбирает страницы шарда (в рабочем процессе).
+    Продукты пишутся в JSON Lines по странице на строку: {"url": ..., "products": [...]},
+    чтобы при слиянии относительные ссылки разрешались от URL своей страницы.
+
+    :param shard: Шард.
+    :param part_dir: Каталог для файлов шардов.
+    :param options: Параметры загрузки.
+    :return: Итог шарда.
+    """
+    path = os.path.join(part_dir, f'shard-{shard.index:05d}.jsonl')
+    # В пуле процессов пределы по хостам общие (SharedHostThrottle из main), иначе — на этот процесс
+    throttle = _throttle or HostThrottle(rate=options.rps, concurrency=options.host_concurrency)
+    # Повторы внутри шарда отсеиваются сразу, чтобы не писать их в файл шарда
+    dedup = ProductDeduplicator()
+    pages = failed = products_count = 0
+    started = time.monotonic()
+    with PooledSession(policies={}, default=HostPolicy(pool_maxsize=options.threads)) as session, \
+            open(path, 'w', encoding='utf-8') as part:
+        engine = CrawlEngine(
+            fetch=lambda url: get_page(session, url, options.headers, retries=options.retries, throttle=throttle),
+            parse=parse_page,
+            workers=options.threads
+        )
+        for url, products in engine.run(shard.urls):
+            pages += 1
+            if products is None:
+                failed += 1
+                logging.warning(f"Пропуск страницы {url} из-за ошибки загрузки.")
+                # Сбой тоже записывается, чтобы при слиянии индекс не счёл продукты страницы удалёнными
+                part.write(json.dumps({'url': url, 'products': None}, ensure_ascii=False) + '\n')
+            else:
+                unique = dedup.filter(products, url)
+                products_count += len(unique)
+                part.write(json.dumps({'url': url, 'products': unique}, ensure_ascii=False) + '\n')
+            if _progress_queue is not None:
+                _progress_queue.put((shard.index, pages, failed, products_count))
+    return ShardResult(shard.index, path, pages, failed, products_count, time.monotonic() - started)
+
+
+class ShardProgress:
+    """Прогресс шардов по сообщениям рабочих процессов; сводка пишется в лог не чаще interval секунд."""
+
+    def __init__(self, shards: List[Shard], interval: float = 5.0) -> None:
+        """
+        :param shards: Шарды обхода.
+        :param interval: Период вывода сводки, секунды.
+        """
+        self.totals = {shard.index: len(shard.urls) for shard in shards}
+        self.done: Dict[int, tuple] = {}
+        self.started: Dict[int, float] = {}
+        self.interval = interval
+        self._started = time.monotonic()
+        self._next_report = self._started + interval
+
+    def update(self, index: int, pages: int, failed: int, products: int) -> None:
+        self.started.setdefault(index, time.monotonic())
+        # Сообщение из очереди может прийти позже итога шарда
+        if pages >= self.done.get(index, (0,))[0]:
+            self.done[index] = (pages, failed, products)
+
+    def drain(self, progress_queue) -> None:
+        """Забирает все накопившиеся сообщения из очереди."""
+        while True:
+            try:
+                self.update(*progress_queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now < self._next_report:
+            return
+        self._next_report = now + self.interval
+        for index, (pages, failed, products) in sorted(self.done.items()):
+            total = self.totals[index]
+            if pages < total:
+                rate = pages / max(now - self.started[index], 1e-9)
+                logging.info(f"Шард {index}: {pages}/{total} стр., ошибок {failed}, "
+                             f"продуктов {products}, {rate:.1f} стр./с")
+        pages = sum(done[0] for done in self.done.values())
+        total = sum(self.totals.values())
+        elapsed = now - self._started
+        logging.info(f"Всего: {pages}/{total} стр. за {elapsed:.1f} с ({pages / max(elapsed, 1e-9):.1f} стр./с), "
+                     f"шардов завершено {sum(1 for i, done in self.done.items() if done[0] == self.totals[i])}"
+                     f"/{len(self.totals)}")
+
+
+def merge_shards(results: List[ShardResult], sink, dedup: ProductDeduplicator,
+                 index: Optional[ProductIndex] = None) -> int:
+    """
+    Сливает файлы шардов в порядке страниц в один приёмник, отсеивая повторы между шардами.
+
+    :param results: Итоги шардов.
+    :param sink: Приёмник продуктов (sinks.open_sink).
+    :param dedup: Дедупликатор на весь обход.
+    :param index: Индекс продуктов для сравнения с прошлым обходом.
+    :return: Число записанных продуктов.
+    """
+    written = 0
+    for result in sorted(results, key=lambda item: item.index):
+        with open(result.path, encoding='utf-8') as part:
+            for line in part:
+                page = json.loads(line)
+                if page['products'] is None:
+                    if index is not None:
+                        index.touch_page(page['url'])
+                    continue
+                unique = dedup.filter(page['products'], page['url'])
+                if index is not None:
+                    unique = index.observe(page['url'], unique)
+                sink.write(unique)
+                written += len(unique)
+        sink.checkpoint()
+    return written
+
+
+def read_urls(path: str) -> List[str]:
+    """URL по одному на строку; пустые строки и строки с # пропускаются."""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки.
+
+    :param argv: Список аргументов (по умолчанию sys.argv).
+    :return: Пространство имён с параметрами обхода.
+    """
+    arg_parser = argparse.ArgumentParser(description='Обход каталога продуктов на нескольких процессах.')
+    arg_parser.add_argument('--base-url', default='https://example.com/products?page={}',
+                            help='Шаблон URL страницы каталога с {} вместо номера страницы')
+    arg_parser.add_argument('--pages', type=int, default=10, help='Количество страниц для парсинга')
+    arg_parser.add_argument('--start-page', type=int, default=1, help='Номер первой страницы')
+    arg_parser.add_argument('--urls', help='Файл со списком URL (вместо --base-url и --pages)')
+    arg_parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Рабочих процессов')
+    arg_parser.add_argument('--shards', type=int,
+                            help='Число шардов (по умолчанию 4 на процесс: короткие шарды выравнивают нагрузку)')
+    arg_parser.add_argument('--threads', type=int, default=4, help='Параллельных загрузок в каждом процессе')
+    arg_parser.add_argument('--rps', type=float, default=1.0,
+                            help='Запросов в секунду к одному хосту на весь обход (общий предел процессов)')
+    arg_parser.add_argument('--host-concurrency', type=int, default=2,
+                            help='Одновременных запросов к одному хосту на весь обход (общий предел процессов)')
+    arg_parser.add_argument('--retries', type=int, default=3, help='Повторных попыток на страницу')
+    arg_parser.add_argument('--output', default='products.csv', help='Файл для сохранения результатов')
+    arg_parser.add_argument('--format', choices=sorted(SINK_FORMATS),
+                            help='Формат вывода (по умолчанию по расширению файла)')
+    arg_parser.add_argument('--parts-dir', help='Каталог для файлов шардов (по умолчанию временный рядом с --output)')
+    arg_parser.add_argument('--keep-parts', action='store_true', help='Не удалять файлы шардов после слияния')
+    arg_parser.add_argument('--progress-interval', type=float, default=5.0, help='Период вывода прогресса, с')
+    arg_parser.add_argument('--bloom-capacity', type=int,
+                            help='Отсеивать повторы фильтром Блума на столько продуктов (для очень больших каталогов)')
+    arg_parser.add_argument('--index', help='Файл SQLite с индексом продуктов для сравнения с прошлым обходом')
+    arg_parser.add_argument('--diff', help='Файл JSON Lines для изменений относительно прошлого обхода (требует --index)')
+    return arg_parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Делит обход на шарды, выполняет их в пуле процессов и сливает результаты в --output.
+    """
+    setup_logging()
+    args = parse_args(argv)
+    if args.urls:
+        urls = read_urls(args.urls)
+    else:
+        urls = [args.base_url.format(page) for page in range(args.start_page, args.start_page + args.pages)]
+    # Процессов — по числу ядер для разбора страниц; пределы --rps и --host-concurrency
+    # соблюдаются для каждого хоста одним ограничителем на все процессы
+    processes = max(1, args.processes)
+    shards = split_shards(urls, args.shards or processes * 4)
+    options = WorkerOptions(
+        threads=args.threads,
+        rps=args.rps,
+        host_concurrency=max(1, args.host_concurrency),
+        retries=args.retries,
+        headers=DEFAULT_HEADERS,
+    )
+    throttle = SharedHostThrottle(rate=options.rps, concurrency=options.host_concurrency)
+    if args.parts_dir:
+        part_dir = args.parts_dir
+        os.makedirs(part_dir, exist_ok=True)
+    else:
+        part_dir = tempfile.mkdtemp(prefix='shards-', dir=os.path.dirname(os.path.abspath(args.output)))
+    logging.info(f"Страниц: {len(urls)}, шардов: {len(shards)}, процессов: {processes}, файлы шардов: {part_dir}")
+
+    progress = ShardProgress(shards, args.progress_interval)
+    progress_queue = multiprocessing.Queue()
+    results: List[ShardResult] = []
+    failed_shards = []
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(progress_queue, throttle)) as executor:
+        futures = {executor.submit(run_shard, shard, part_dir, options): shard for shard in shards}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            progress.drain(progress_queue)
+            for future in done:
+                shard = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"Шард {shard.index} ({len(shard.urls)} стр.) завершился с ошибкой: {e}")
+                    failed_shards.append(shard.index)
+                    continue
+                results.append(result)
+                progress.update(result.index, result.pages, result.failed, result.products)
+                logging.info(f"Шард {result.index} готов: {result.pages} стр. (ошибок {result.failed}), "
+                             f"продуктов {result.products} за {result.elapsed:.1f} с "
+                             f"({result.pages / max(result.elapsed, 1e-9):.1f} стр./с)")
+            progress.report()
+    crawl_elapsed = time.monotonic() - started
+    progress.report(force=True)
+
+    dedup = ProductDeduplicator(bloom_capacity=args.bloom_capacity)
+    index = ProductIndex(args.index) if args.index else None
+    if index is not None:
+        index.start_run()
+    merge_started = time.monotonic()
+    with open_sink(args.output, args.format) as sink:
+        written = merge_shards(results, sink, dedup, index)
+    if index is not None:
+        # Страницы упавших шардов не загружены: их продукты не считаются удалёнными
+        for shard in shards:
+            if shard.index in failed_shards:
+                for url in shard.urls:
+                    index.touch_page(url)
+    merge_elapsed = time.monotonic() - merge_started
+    pages = sum(result.pages for result in results)
+    logging.info(f"Обработано страниц: {pages} за {crawl_elapsed:.1f} с ({pages / max(crawl_elapsed, 1e-9):.2f} стр./с), "
+                 f"слияние {merge_elapsed:.1f} с, продуктов записано: {written}")
+    if dedup.stats['duplicates']:
+        logging.info(f"Отброшено повторов продуктов между шардами: {dedup.stats['duplicates']}")
+    if index is not None:
+        index.finish_run()
+        if args.diff:
+            counts = index.write_diff(args.diff)
+            logging.info(f"Изменения относительно прошлого обхода ({args.diff}): {counts}")
+    if not args.keep_parts and not failed_shards:
+        for result in results:
+            os.remove(result.path)
+        if not args.parts_dir:
+            shutil.rmtree(part_dir, ignore_errors=True)
+    if failed_shards:
+        logging.error(f"Шарды с ошибкой: {failed_shards}; файлы шардов оставлены в {part_dir}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Выполняющийся вызов, результат которого ждут все совпадающие запросы."""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Схлопывает одновременные одинаковые вызовы: пока вызов с ключом key выполняется,
+    остальные запросы с тем же ключом ждут и получают его результат (или исключение).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {'calls': 0, 'executed': 0, 'collapsed': 0}
+
+    def do(self, key: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Выполняет func(*args, **kwargs) не более одного раза на ключ в каждый момент времени.
+
+        :param key: Ключ, определяющий идентичность запроса.
+        :param func: Вызываемый объект, обращающийся к внешнему сервису.
+        :return: Результат func, общий для всех ожидающих.
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['collapsed'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.debug(f"Результат {key} передан {call.waiters} ожидающим запросам")
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        """Количество выполняющихся в данный момент уникальных вызовов."""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Счётчики calls (всего запросов), executed (реальных вызовов) и collapsed (схлопнутых).
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+class AsyncSingleFlight:
+    """
+    Вариант SingleFlight для asyncio: одновременные корутины с одинаковым ключом
+    ждут одну задачу. Используется из одного цикла событий, блокировки не нужны.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._stats = {'calls': 0, 'executed': 0, 'collapsed': 0}
+
+    async def do(self, key: str, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """
+        Выполняет await func(*args, **kwargs) не более одного раза на ключ в каждый момент времени.
+
+        :param key: Ключ, определяющий идентичность запроса.
+        :param func: Корутинная функция, обращающаяся к внешнему сервису.
+        :return: Результат func, общий для всех ожидающих.
+        """
+        self._stats['calls'] += 1
+        future = self._calls.get(key)
+        if future is not None:
+            self._stats['collapsed'] += 1
+            # shield: отмена одного ожидающего не должна отменять общий вызов
+            return await asyncio.shield(future)
+
+        self._stats['executed'] += 1
+        future = asyncio.ensure_future(func(*args, **kwargs))
+        self._calls[key] = future
+        future.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(future)
+
+    def in_flight(self) -> int:
+        """Количество выполняющихся в данный момент уникальных вызовов."""
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Счётчики calls (всего запросов), executed (реальных вызовов) и collapsed (схлопнутых).
+        """
+        return dict(self._stats)
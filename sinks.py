@@ -0,0 +1,223 @@
+import csv
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow необязателен
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Колонки результата: price — число, price_text — цена в исходном виде (с валютой)
+PRODUCT_COLUMNS = ['name', 'price', 'price_text', 'image_url', 'product_url']
+
+_PRICE_RE = re.compile(r'\d[\d\s  .,\']*')
+
+
+def parse_price(text: Optional[str]) -> Optional[float]:
+    """
+    Извлекает числовое значение цены из строки вида '1 299,99 ₽', '$1,299.99' или '1.299,99 €'.
+
+    Последний из разделителей '.'/',' считается десятичным, если после него 1–2 цифры.
+
+    :param text: Цена в исходном виде.
+    :return: Число или None, если цену распознать не удалось.
+    """
+    if not text:
+        return None
+    match = _PRICE_RE.search(text)
+    if not match:
+        return None
+    digits = re.sub(r"[\s  ']", '', match.group()).rstrip('.,')
+    last_sep = max(digits.rfind('.'), digits.rfind(','))
+    if last_sep != -1 and 1 <= len(digits) - last_sep - 1 <= 2:
+        integer, fraction = digits[:last_sep], digits[last_sep + 1:]
+    else:
+        integer, fraction = digits, ''
+    integer = integer.replace('.', '').replace(',', '')
+    try:
+        return float(f'{integer}.{fraction}' if fraction else integer)
+    except ValueError:
+        return None
+
+
+def normalize_product(product: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Приводит запись о продукте к схеме PRODUCT_COLUMNS.
+
+    :param product: Словарь из parse_page.
+    :return: Новый словарь с типизированной ценой.
+    """
+    price_text = product.get('price')
+    return {
+        'name': product.get('name'),
+        'price': parse_price(price_text),
+        'price_text': price_text,
+        'image_url': product.get('image_url'),
+        'product_url': product.get('product_url'),
+    }
+
+
+class ProductSink:
+    """
+    Базовый приёмник продуктов: строки буферизуются и записываются порциями по chunk_size,
+    checkpoint() сбрасывает буфер и синхронизирует файл с диском.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 500) -> None:
+        """
+        :param path: Путь к выходному файлу.
+        :param chunk_size: Сколько строк накапливать перед записью.
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._closed = False
+
+    def __enter__(self) -> 'ProductSink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, products: Iterable[Dict[str, Any]]) -> None:
+        """
+        Добавляет продукты (в формате parse_page).
+
+        :param products: Записи о продуктах.
+        """
+        self._buffer.extend(normalize_product(product) for product in products)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Записывает накопленные строки."""
+        if self._buffer:
+            self._write_chunk(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+
+    def checkpoint(self) -> None:
+        """Записывает буфер и выполняет fsync: данные переживут аварийное завершение процесса."""
+        self.flush()
+        self._sync()
+
+    def close(self) -> None:
+        """Завершает запись и закрывает файл."""
+        if self._closed:
+            return
+        self.checkpoint()
+        self._close()
+        self._closed = True
+        logger.info(f"Данные сохранены в {self.path} (строк: {self.rows_written})")
+
+    def _write_chunk(self, rows: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def _sync(self) -> None:
+        raise NotImplementedError
+
+    def _close(self) -> None:
+        raise NotImplementedError
+
+
+class _TextFileSink(ProductSink):
+    def __init__(self, path: str, chunk_size: int = 500, append: bool = False, encoding: str = 'utf-8') -> None:
+        super().__init__(path, chunk_size)
+        self._existing = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, 'a' if append else 'w', newline='', encoding=encoding)
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _close(self) -> None:
+        self._file.close()
+
+
+class CsvSink(_TextFileSink):
+    """CSV с BOM (как прежний to_csv(encoding='utf-8-sig')), дописываемый порциями."""
+
+    def __init__(self, path: str, chunk_size: int = 500, append: bool = False) -> None:
+        # При дописывании в существующий файл BOM повторно не пишется
+        encoding = 'utf-8' if append and os.path.exists(path) and os.path.getsize(path) > 0 else 'utf-8-sig'
+        super().__init__(path, chunk_size, append=append, encoding=encoding)
+        self._writer = csv.DictWriter(self._file, fieldnames=PRODUCT_COLUMNS)
+        if not self._existing:
+            self._writer.writeheader()
+
+    def _write_chunk(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.writerows(rows)
+
+
+class JsonlSink(_TextFileSink):
+    """JSON Lines: одна запись о продукте на строку."""
+
+    def _write_chunk(self, rows: List[Dict[str, Any]]) -> None:
+        self._file.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+
+
+class ParquetSink(ProductSink):
+    """
+    Колоночный Parquet (требуется pyarrow): каждая порция пишется отдельной группой строк.
+    Файл становится читаемым только после close() — при падении процесса используйте CSV/JSONL.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 5000, append: bool = False) -> None:
+        if pa is None:
+            raise ImportError('pyarrow is required for Parquet output')
+        if append:
+            raise ValueError('Parquet output cannot be appended to; use CSV or JSONL with --resume')
+        super().__init__(path, chunk_size)
+        self._schema = pa.schema([
+            ('name', pa.string()),
+            ('price', pa.float64()),
+            ('price_text', pa.string()),
+            ('image_url', pa.string()),
+            ('product_url', pa.string()),
+        ])
+        self._file = open(path, 'wb')
+        self._writer = pq.ParquetWriter(self._file, self._schema)
+
+    def _write_chunk(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.write_table(pa.Table.from_pylist(rows, schema=self._schema))
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _close(self) -> None:
+        self._writer.close()
+        self._file.close()
+
+
+SINK_FORMATS = {
+    'csv': CsvSink,
+    'jsonl': JsonlSink,
+    'parquet': ParquetSink,
+}
+
+
+def open_sink(path: str, fmt: Optional[str] = None, **kwargs: Any) -> ProductSink:
+    """
+    Создаёт приёмник по явному формату или по расширению файла.
+
+    :param path: Путь к выходному файлу.
+    :param fmt: 'csv', 'jsonl' или 'parquet'; по умолчанию определяется по расширению.
+    :return: Экземпляр ProductSink.
+    :raises ValueError: Если формат не поддерживается.
+    """
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lower().lstrip('.')
+        fmt = {'json': 'jsonl', 'ndjson': 'jsonl', 'pq': 'parquet'}.get(ext, ext or 'csv')
+    sink_cls = SINK_FORMATS.get(fmt)
+    if sink_cls is None:
+        raise ValueError(f'Unsupported output format: {fmt}')
+    return sink_cls(path, **kwargs)
@@ -0,0 +1,465 @@
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import requests
+
+from cache import MemoryCache, normalize_text
+from http_client import get_session
+from worker_pool import BoundedWorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Адрес LibreTranslate-совместимого API (свой сервер или заглушка benchmarks/stubs.py).
+# Если не задан, используется googletrans.
+TRANSLATE_API_BASE = os.environ.get('TRANSLATE_API_BASE', '').rstrip('/')
+TRANSLATE_API_KEY = os.environ.get('TRANSLATE_API_KEY')
+
+# Цепочка бэкендов через запятую: при ошибке пакет уходит следующему.
+# http — TRANSLATE_API_BASE, google — googletrans, offline — argostranslate, echo — заглушка без перевода.
+TRANSLATE_BACKENDS = os.environ.get('TRANSLATE_BACKENDS', 'http' if TRANSLATE_API_BASE else 'google')
+# Строки на один язык собираются в пакет в течение TRANSLATE_BATCH_WINDOW секунд
+TRANSLATE_BATCH_WINDOW = float(os.environ.get('TRANSLATE_BATCH_WINDOW', 0.02))
+TRANSLATE_BATCH_SIZE = int(os.environ.get('TRANSLATE_BATCH_SIZE', 32))
+# Клиентов на бэкенд (googletrans не потокобезопасен: один клиент — один пакет за раз)
+TRANSLATE_CLIENTS = int(os.environ.get('TRANSLATE_CLIENTS', 4))
+TRANSLATE_TIMEOUT = float(os.environ.get('TRANSLATE_TIMEOUT', 10))
+TRANSLATE_CACHE_ENTRIES = int(os.environ.get('TRANSLATE_CACHE_ENTRIES', 4096))
+TRANSLATE_CACHE_TTL = float(os.environ.get('TRANSLATE_CACHE_TTL', 86400))
+# Язык исходного текста для офлайн-модели, если он не указан и ещё не определён
+TRANSLATE_OFFLINE_SOURCE = os.environ.get('TRANSLATE_OFFLINE_SOURCE', 'ru')
+
+
+class Translated(NamedTuple):
+    """Результат перевода (поля совпадают с googletrans.models.Translated)."""
+    text: str
+    src: str
+    dest: str
+
+
+class HttpTranslator:
+    """Клиент LibreTranslate-совместимого API: POST /translate через общую keep-alive сессию."""
+
+    def __init__(self, api_base: str, api_key: Optional[str] = None, timeout: float = 10.0,
+                 session: Optional[requests.Session] = None) -> None:
+        """
+        :param api_base: Базовый адрес API.
+        :param api_key: Ключ API (если сервер его требует).
+        :param timeout: Таймаут запроса, секунды.
+        :param session: Сессия requests; по умолчанию общая из http_client.
+        """
+        self.api_base = api_base.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = session
+
+    def _post(self, query: Any, dest: str, src: str) -> Dict[str, Any]:
+        payload = {'q': query, 'source': src, 'target': dest, 'format': 'text'}
+        if self.api_key:
+            payload['api_key'] = self.api_key
+        response = (self.session or get_session()).post(
+            f'{self.api_base}/translate', json=payload, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def translate(self, text: str, dest: str = 'en', src: str = 'auto') -> Translated:
+        """
+        :raises requests.RequestException: Если API недоступен или вернул ошибку.
+        """
+        data = self._post(text, dest, src)
+        detected = (data.get('detectedLanguage') or {}).get('language', src)
+        return Translated(data['translatedText'], detected, dest)
+
+    def translate_batch(self, texts: Sequence[str], dest: str, src: str = 'auto') -> List[Translated]:
+        """
+        Переводит несколько строк одним запросом (q — список).
+
+        :raises requests.RequestException: Если API недоступен или вернул ошибку.
+        """
+        data = self._post(list(texts), dest, src)
+        detected = data.get('detectedLanguage') or [{}] * len(texts)
+        return [
+            Translated(text, (language or {}).get('language', src), dest)
+            for text, language in zip(data['translatedText'], detected)
+        ]
+
+
+class GoogleTranslator:
+    """Обёртка над googletrans.Translator; экземпляр не потокобезопасен, поэтому используется через пул."""
+
+    def __init__(self) -> None:
+        from googletrans import Translator
+        self._translator = Translator()
+
+    def translate_batch(self, texts: Sequence[str], dest: str, src: str = 'auto') -> List[Translated]:
+        results = self._translator.translate(list(texts), dest=dest, src=src)
+        return [Translated(result.text, result.src, dest) for result in results]
+
+
+class OfflineTranslator:
+    """Локальная модель argostranslate (пакеты языков должны быть установлены заранее)."""
+
+    def __init__(self, default_src: str = TRANSLATE_OFFLINE_SOURCE) -> None:
+        """
+        :param default_src: Язык исходного текста, если передан 'auto' (модель его не определяет).
+        """
+        from argostranslate import translate as argos_translate
+        self._translate = argos_translate.translate
+        self.default_src = default_src
+
+    def translate_batch(self, texts: Sequence[str], dest: str, src: str = 'auto') -> List[Translated]:
+        source = self.default_src if src == 'auto' else src
+        return [Translated(self._translate(text, source, dest), source, dest) for text in texts]
+
+
+class EchoTranslator:
+    """Заглушка для разработки и тестов без сети: возвращает текст без изменений."""
+
+    def translate_batch(self, texts: Sequence[str], dest: str, src: str = 'auto') -> List[Translated]:
+        return [Translated(text, src, dest) for text in texts]
+
+
+BACKENDS: Dict[str, Callable[[], Any]] = {
+    'http': lambda: HttpTranslator(TRANSLATE_API_BASE, TRANSLATE_API_KEY, TRANSLATE_TIMEOUT),
+    'google': GoogleTranslator,
+    'offline': OfflineTranslator,
+    'echo': EchoTranslator,
+}
+
+
+class TranslatorPool:
+    """
+    Потокобезопасный пул клиентов одного бэкенда: клиент выдаётся одному потоку за раз,
+    новые клиенты создаются по мере необходимости, но не больше size.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], size: int = 4) -> None:
+        """
+        :param name: Имя бэкенда (для логов и статистики).
+        :param factory: Функция создания клиента.
+        :param size: Максимальное число клиентов.
+        """
+        if size < 1:
+            raise ValueError('size must be >= 1')
+        self.name = name
+        self.size = size
+        self._factory = factory
+        self._reset()
+
+    def _reset(self) -> None:
+        # Клиенты родительского процесса (с их соединениями) в дочернем не используются
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    @contextmanager
+    def client(self) -> Iterator[Any]:
+        """Выдаёт свободный клиент (при необходимости ждёт его освобождения)."""
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    client = self._factory()
+                except BaseException:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                client = self._idle.get()
+        try:
+            yield client
+        finally:
+            self._idle.put(client)
+
+
+class _Pending:
+    """Строки, ожидающие отправки на один язык: текст -> ожидающие результата Future."""
+
+    __slots__ = ('deadline', 'items')
+
+    def __init__(self, deadline: float) -> None:
+        self.deadline = deadline
+        self.items: Dict[str, List[Future]] = {}
+
+
+class TranslationEngine:
+    """
+    Перевод с пакетированием и кэшем.
+
+    Строки с одинаковыми исходным и целевым языком копятся window секунд (или до max_batch)
+    и уходят бэкенду одним вызовом; одинаковые строки в окне переводятся один раз.
+    Пока ни один пакет не выполняется, строка отправляется сразу: окно добавляет задержку
+    только под нагрузкой, когда её окупает пакетирование. Пока заняты все клиенты,
+    пакеты продолжают расти, а не выстраиваются в очередь.
+    Определённый язык исходного текста и готовые переводы кэшируются: текст на целевом языке
+    возвращается без обращения к бэкенду. При ошибке пакет передаётся следующему бэкенду цепочки.
+    """
+
+    def __init__(self, pools: Sequence[TranslatorPool], window: float = 0.02, max_batch: int = 32,
+                 cache_entries: int = 4096, cache_ttl: float = 86400, timeout: float = 10.0) -> None:
+        """
+        :param pools: Пулы клиентов бэкендов в порядке приоритета.
+        :param window: Окно накопления пакета, секунды.
+        :param max_batch: Максимум строк в пакете.
+        :param cache_entries: Размер кэшей переводов и определённых языков.
+        :param cache_ttl: Время жизни записей кэшей, секунды (0 — без кэширования).
+        :param timeout: Время ожидания результата в translate(), секунды.
+        """
+        if not pools:
+            raise ValueError('at least one backend is required')
+        self.pools = list(pools)
+        self.window = window
+        self.max_batch = max_batch
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self.cache_entries = cache_entries
+        self._closed = False
+        # Одновременно выполняется не больше пакетов, чем клиентов у первого бэкенда
+        self._capacity = self.pools[0].size
+        self._reset()
+        # Потоки не переживают fork (aio_web.serve --processes): в дочернем процессе
+        # состояние сбрасывается, а потоки запускаются заново при первом переводе
+        after_fork = weakref.WeakMethod(self._after_fork)
+
+        def after_fork_in_child() -> None:
+            method = after_fork()
+            if method is not None:
+                method()
+        os.register_at_fork(after_in_child=after_fork_in_child)
+
+    def _reset(self) -> None:
+        self._results = MemoryCache(self.cache_entries)
+        self._languages = MemoryCache(self.cache_entries)
+        self._pending: Dict[Tuple[str, str], _Pending] = {}
+        self._cond = threading.Condition()
+        self._running = 0
+        self._stats = {'requests': 0, 'cache_hits': 0, 'same_language': 0, 'coalesced': 0,
+                       'batches': 0, 'batched_texts': 0, 'fallbacks': 0, 'failed': 0}
+        self._workers: Optional[BoundedWorkerPool] = None
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def _after_fork(self) -> None:
+        self._reset()
+        for pool in self.pools:
+            pool._reset()
+
+    def _start(self) -> None:
+        """Запускает диспетчер и пул потоков в текущем процессе (вызывается под self._cond)."""
+        if self._dispatcher is not None:
+            return
+        # Собственные потоки, а не ThreadPoolExecutor: тот не принимает задачи после начала
+        # завершения интерпретатора, а пакеты досылаются из atexit (app.shutdown_workers).
+        # Пакетов одновременно не больше _capacity, поэтому очередь не переполняется
+        self._workers = BoundedWorkerPool(self._capacity, max_queue=self._capacity, name='translate')
+        self._dispatcher = threading.Thread(target=self._dispatch, name='translate-batcher', daemon=True)
+        self._dispatcher.start()
+
+    def detected_language(self, text: str) -> Optional[str]:
+        """
+        :return: Язык текста, если он уже определялся при переводе, иначе None.
+        """
+        found, language = self._languages.get(normalize_text(text))
+        return language if found else None
+
+    def submit(self, text: str, dest: str, src: str = 'auto') -> 'Future[Translated]':
+        """
+        Ставит строку в пакет на перевод.
+
+        :param text: Исходный текст.
+        :param dest: Целевой язык.
+        :param src: Язык исходного текста или 'auto'.
+        :return: Future с Translated (или исключением последнего бэкенда цепочки).
+        """
+        future: Future = Future()
+        dest = dest.lower()
+        normalized = normalize_text(text)
+        if src == 'auto':
+            src = self.detected_language(normalized) or 'auto'
+        with self._cond:
+            self._stats['requests'] += 1
+        if not normalized or src == dest:
+            self._count('same_language')
+            future.set_result(Translated(text, src, dest))
+            return future
+        found, translated = self._results.get(self._result_key(normalized, src, dest))
+        if found:
+            self._count('cache_hits')
+            future.set_result(Translated(translated, src, dest))
+            return future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('translation engine is shut down')
+            self._start()
+            pending = self._pending.get((src, dest))
+            # Диспетчер будится при новом пакете (у него свой срок) и когда пакет набран целиком
+            wake = pending is None
+            if pending is None:
+                pending = self._pending[(src, dest)] = _Pending(
+                    time.monotonic() + (self.window if self._running else 0)
+                )
+            waiters = pending.items.setdefault(normalized, [])
+            if waiters:
+                self._stats['coalesced'] += 1
+            waiters.append(future)
+            if wake or (len(waiters) == 1 and len(pending.items) == self.max_batch):
+                self._cond.notify()
+        return future
+
+    def translate(self, text: str, dest: str, src: str = 'auto', timeout: Optional[float] = None) -> Translated:
+        """
+        Синхронный перевод через пакетную очередь.
+
+        :raises concurrent.futures.TimeoutError: Если результат не готов за timeout секунд.
+        :raises Exception: Ошибка последнего бэкенда цепочки.
+        """
+        return self.submit(text, dest, src).result(self.timeout if timeout is None else timeout)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Счётчики запросов, попаданий в кэш, пакетов и ошибок, число ожидающих строк.
+        """
+        with self._cond:
+            result = dict(self._stats)
+            result['pending'] = sum(len(pending.items) for pending in self._pending.values())
+        return result
+
+    def shutdown(self) -> None:
+        """Отправляет накопленные пакеты и дожидается их перевода."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            dispatcher, workers = self._dispatcher, self._workers
+        if dispatcher is not None:
+            dispatcher.join()
+            workers.shutdown()
+
+    @staticmethod
+    def _result_key(normalized: str, src: str, dest: str) -> str:
+        return f'{src}\x00{dest}\x00{normalized}'
+
+    def _count(self, field: str, value: int = 1) -> None:
+        with self._cond:
+            self._stats[field] += value
+
+    def _dispatch(self) -> None:
+        """
+        Фоновый поток: отправляет пакеты, у которых истекло окно или набран max_batch.
+        Пока все клиенты заняты, пакеты не отправляются, а продолжают копить строки.
+        """
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    free = self._capacity - self._running
+                    due = sorted(
+                        (pending.deadline, key) for key, pending in self._pending.items()
+                        if self._closed or pending.deadline <= now or len(pending.items) >= self.max_batch
+                    )
+                    if (due and free > 0) or (self._closed and not self._pending):
+                        break
+                    deadline = min((pending.deadline for pending in self._pending.values()), default=None)
+                    # Без свободных клиентов ждём завершения пакета (_run_batch будит диспетчер)
+                    timeout = None if deadline is None or due else deadline - now
+                    self._cond.wait(timeout)
+                if not due:
+                    return
+                batches = []
+                for _, key in due:
+                    if len(batches) >= free and not self._closed:
+                        break
+                    items = self._pending.pop(key).items
+                    texts = list(items)
+                    # Сверх max_batch строки отправляются следующими пакетами
+                    for start in range(0, len(texts), self.max_batch):
+                        chunk = texts[start:start + self.max_batch]
+                        batches.append((key, [(text, items[text]) for text in chunk]))
+                self._running += len(batches)
+                self._stats['batches'] += len(batches)
+                self._stats['batched_texts'] += sum(len(batch) for _, batch in batches)
+            for (src, dest), batch in batches:
+                if not self._workers.submit(self._run_batch, src, dest, batch):
+                    self._reject_batch(batch)
+
+    def _reject_batch(self, batch: List[Tuple[str, List[Future]]]) -> None:
+        """Пакет не принят пулом: ожидающие получают ошибку сразу, а не по таймауту."""
+        error = RuntimeError('translation batch was not scheduled')
+        for _, futures in batch:
+            for future in futures:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(error)
+        with self._cond:
+            self._running -= 1
+            self._stats['failed'] += len(batch)
+            self._cond.notify()
+
+    def _run_batch(self, src: str, dest: str, batch: List[Tuple[str, List[Future]]]) -> None:
+        try:
+            # Отменённые ожидающим (asyncio.wait_for) Future больше не ждут результата
+            batch = [(text, [f for f in futures if f.set_running_or_notify_cancel()]) for text, futures in batch]
+            batch = [(text, futures) for text, futures in batch if futures]
+            if batch:
+                self._translate_batch(src, dest, batch)
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify()
+
+    def _translate_batch(self, src: str, dest: str, batch: List[Tuple[str, List[Future]]]) -> None:
+        texts = [text for text, _ in batch]
+        error: Optional[BaseException] = None
+        for index, pool in enumerate(self.pools):
+            if index:
+                self._count('fallbacks')
+            try:
+                with pool.client() as client:
+                    results = client.translate_batch(texts, dest, src)
+                if len(results) != len(texts):
+                    raise ValueError(f'{pool.name}: {len(results)} results for {len(texts)} texts')
+            except Exception as e:
+                logger.warning(f"Ошибка переводчика {pool.name} ({len(texts)} строк -> {dest}): {e}")
+                error = e
+                continue
+            for (text, futures), result in zip(batch, results):
+                if self.cache_ttl > 0:
+                    if result.src and result.src != 'auto':
+                        self._languages.set(text, result.src, self.cache_ttl)
+                    self._results.set(self._result_key(text, result.src, dest), result.text, self.cache_ttl)
+                for future in futures:
+                    future.set_result(result)
+            return
+        self._count('failed', len(batch))
+        for _, futures in batch:
+            for future in futures:
+                future.set_exception(error)
+
+
+def create_engine(backends: Optional[str] = None) -> TranslationEngine:
+    """
+    :param backends: Цепочка бэкендов через запятую; по умолчанию TRANSLATE_BACKENDS.
+    :return: TranslationEngine с пулом клиентов на каждый бэкенд.
+    :raises ValueError: Если указан неизвестный бэкенд.
+    """
+    pools = []
+    for name in (backends or TRANSLATE_BACKENDS).split(','):
+        name = name.strip()
+        if name not in BACKENDS:
+            raise ValueError(f'unknown translation backend: {name}')
+        if name == 'http' and not TRANSLATE_API_BASE:
+            raise ValueError('TRANSLATE_API_BASE is required for the http backend')
+        pools.append(TranslatorPool(name, BACKENDS[name], TRANSLATE_CLIENTS))
+    return TranslationEngine(
+        pools, window=TRANSLATE_BATCH_WINDOW, max_batch=TRANSLATE_BATCH_SIZE,
+        cache_entries=TRANSLATE_CACHE_ENTRIES, cache_ttl=TRANSLATE_CACHE_TTL, timeout=TRANSLATE_TIMEOUT
+    )
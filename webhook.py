@@ -0,0 +1,181 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+# orjson заметно быстрее на больших телах; без него используется json из стандартной библиотеки
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - зависит от окружения
+    orjson = None
+    _loads = json.loads
+
+
+class InvalidSignatureError(ValueError):
+    """Подпись X-Line-Signature не соответствует телу запроса."""
+
+
+class InvalidBodyError(ValueError):
+    """Тело запроса не является корректным JSON вебхука LINE."""
+
+
+class Source:
+    """Источник события: пользователь, группа или комната."""
+
+    __slots__ = ('type', 'user_id', 'group_id', 'room_id')
+
+    def __init__(self, type: Optional[str], user_id: Optional[str] = None,
+                 group_id: Optional[str] = None, room_id: Optional[str] = None) -> None:
+        self.type = type
+        self.user_id = user_id
+        self.group_id = group_id
+        self.room_id = room_id
+
+
+class Message:
+    """Сообщение события (текст или стикер; для остальных типов заполнены только id и type)."""
+
+    __slots__ = ('id', 'type', 'text', 'package_id', 'sticker_id')
+
+    def __init__(self, id: Optional[str], type: Optional[str], text: Optional[str] = None,
+                 package_id: Optional[str] = None, sticker_id: Optional[str] = None) -> None:
+        self.id = id
+        self.type = type
+        self.text = text
+        self.package_id = package_id
+        self.sticker_id = sticker_id
+
+
+class Event:
+    """
+    Событие вебхука с полями, которые используют боты. Имена атрибутов совпадают
+    с моделями linebot (reply_token, source.user_id, message.text, ...).
+    """
+
+    __slots__ = ('type', 'mode', 'timestamp', 'reply_token', 'webhook_event_id', 'is_redelivery',
+                 'source', 'message')
+
+    def __init__(self, type: Optional[str], mode: Optional[str] = None, timestamp: Optional[int] = None,
+                 reply_token: Optional[str] = None, webhook_event_id: Optional[str] = None,
+                 is_redelivery: bool = False, source: Optional[Source] = None,
+                 message: Optional[Message] = None) -> None:
+        self.type = type
+        self.mode = mode
+        self.timestamp = timestamp
+        self.reply_token = reply_token
+        self.webhook_event_id = webhook_event_id
+        self.is_redelivery = is_redelivery
+        self.source = source
+        self.message = message
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Event':
+        source = data.get('source')
+        message = data.get('message')
+        delivery = data.get('deliveryContext')
+        return cls(
+            data.get('type'),
+            data.get('mode'),
+            data.get('timestamp'),
+            data.get('replyToken'),
+            data.get('webhookEventId'),
+            bool(delivery.get('isRedelivery')) if delivery else False,
+            Source(source.get('type'), source.get('userId'), source.get('groupId'), source.get('roomId'))
+            if source else None,
+            Message(message.get('id'), message.get('type'), message.get('text'),
+                    message.get('packageId'), message.get('stickerId'))
+            if message else None,
+        )
+
+
+class WebhookParser:
+    """
+    Проверка подписи и разбор тела вебхука за один проход по исходным байтам.
+
+    Ключ HMAC подготавливается один раз, для каждого запроса копируется готовое состояние.
+    Подпись сравнивается с декодированными байтами заголовка, без base64-кодирования дайджеста.
+    """
+
+    def __init__(self, channel_secret: str, loads: Optional[Callable[[bytes], Any]] = None) -> None:
+        """
+        :param channel_secret: Секрет канала LINE.
+        :param loads: Декодер JSON (по умолчанию orjson.loads, если установлен, иначе json.loads).
+        """
+        self._mac = hmac.new(channel_secret.encode('utf-8'), digestmod=hashlib.sha256)
+        self._loads = loads or _loads
+
+    def verify(self, body: bytes, signature: str) -> bool:
+        """
+        :param body: Тело запроса в байтах.
+        :param signature: Значение заголовка X-Line-Signature.
+        :return: True, если подпись корректна.
+        """
+        try:
+            expected = base64.b64decode(signature, validate=True)
+        except (binascii.Error, ValueError):
+            return False
+        mac = self._mac.copy()
+        mac.update(body)
+        return hmac.compare_digest(mac.digest(), expected)
+
+    def parse(self, body: bytes, signature: str) -> List[Event]:
+        """
+        :param body: Тело запроса в байтах.
+        :param signature: Значение заголовка X-Line-Signature.
+        :return: События запроса.
+        :raises InvalidSignatureError: Если подпись неверна.
+        :raises InvalidBodyError: Если тело не JSON или в нём нет списка 'events'.
+        """
+        if not self.verify(body, signature):
+            raise InvalidSignatureError('Invalid signature')
+        return self.parse_body(body)
+
+    def parse_body(self, body: bytes) -> List[Event]:
+        """
+        Разбирает тело, подпись которого уже проверена verify.
+
+        :param body: Тело запроса в байтах.
+        :raises InvalidBodyError: Если тело не JSON или в нём нет списка 'events'.
+        """
+        return parse_events(body, self._loads)
+
+    def load_body(self, body: bytes) -> List[Dict[str, Any]]:
+        """
+        Как parse_body, но события остаются словарями: дешевле, когда из события нужны два-три поля.
+
+        :param body: Тело запроса в байтах.
+        :raises InvalidBodyError: Если тело не JSON или в нём нет списка 'events'.
+        """
+        return load_events(body, self._loads)
+
+
+def load_events(body: bytes, loads: Callable[[bytes], Any] = _loads) -> List[Dict[str, Any]]:
+    """
+    Разбирает тело вебхука в словари событий без проверки подписи.
+
+    :param body: Тело запроса в байтах.
+    :param loads: Декодер JSON.
+    :raises InvalidBodyError: Если тело не JSON или в нём нет списка 'events'.
+    """
+    try:
+        payload = loads(body)
+    except ValueError as e:
+        raise InvalidBodyError(f'Invalid JSON: {e}') from e
+    events = payload.get('events') if isinstance(payload, dict) else None
+    if not isinstance(events, list):
+        raise InvalidBodyError("Missing 'events' list")
+    return [event for event in events if isinstance(event, dict)]
+
+
+def parse_events(body: bytes, loads: Callable[[bytes], Any] = _loads) -> List[Event]:
+    """
+    Разбирает тело вебхука без проверки подписи.
+
+    :param body: Тело запроса в байтах.
+    :param loads: Декодер JSON.
+    :raises InvalidBodyError: Если тело не JSON или в нём нет списка 'events'.
+    """
+    return [Event.from_dict(event) for event in load_events(body, loads)]
@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Маркер остановки для рабочих потоков
+_STOP = object()
+
+
+class BoundedWorkerPool:
+    """
+    Пул рабочих потоков с ограниченной очередью задач.
+
+    Если очередь заполнена, submit() не блокирует вызывающий поток,
+    а возвращает False — решение о сбросе нагрузки принимает вызывающий код.
+    """
+
+    def __init__(self, workers: int = 8, max_queue: int = 100, name: str = 'worker') -> None:
+        """
+        :param workers: Количество рабочих потоков.
+        :param max_queue: Максимальная глубина очереди задач.
+        :param name: Префикс имени потоков (для логов).
+        """
+        if workers < 1:
+            raise ValueError('workers must be >= 1')
+        if max_queue < 1:
+            raise ValueError('max_queue must be >= 1')
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+        self._threads: List[threading.Thread] = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._run, name=f'{name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @property
+    def queue_depth(self) -> int:
+        """Текущее количество задач в очереди."""
+        return self._queue.qsize()
+
+    @property
+    def max_queue(self) -> int:
+        """Максимальная глубина очереди."""
+        return self._queue.maxsize
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Возвращает счётчики пула.
+
+        :return: Словарь со счётчиками submitted/rejected/completed/failed и глубиной очереди.
+        """
+        with self._lock:
+            result = dict(self._stats)
+        result['queue_depth'] = self.queue_depth
+        return result
+
+    def submit(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> bool:
+        """
+        Ставит задачу в очередь без блокировки.
+
+        :param func: Вызываемый объект.
+        :return: True, если задача принята, False — если очередь заполнена или пул остановлен.
+        """
+        with self._lock:
+            if self._closed:
+                self._stats['rejected'] += 1
+                return False
+        try:
+            self._queue.put_nowait((func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+        with self._lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        Прекращает приём задач, дожидается выполнения уже поставленных и останавливает потоки.
+
+        :param timeout: Максимальное время ожидания каждого потока в секундах.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        logger.info(f"Остановка пула, задач в очереди: {self.queue_depth}")
+        for _ in self._threads:
+            # Блокирующий put: маркеры встают в очередь после всех принятых задач
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                func, args, kwargs = item
+                try:
+                    func(*args, **kwargs)
+                except Exception as e:
+                    with self._lock:
+                        self._stats['failed'] += 1
+                    logger.exception(f"Ошибка при выполнении задачи: {e}")
+                else:
+                    with self._lock:
+                        self._stats['completed'] += 1
+            finally:
+                self._queue.task_done()